@@ -0,0 +1,68 @@
+"""
+Joins of a large table with a small one: the hash join holding the small
+side against petl's sort-merge join, a band join on ranges of values, and
+the semi and anti joins of IN (subquery) and NOT EXISTS, and tables listed
+in FROM with the conditions joining them in WHERE, joined in the order
+estimated cheapest.
+
+    python benchmarks/bench_join.py [rows]
+"""
+import sys
+
+import petl as etl
+
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+from bench_pipeline import synthetic_table, drain, best
+
+
+QUERIES = (
+    "select id, price, label from t inner join d on t.name = d.dname",
+    "select id, label from t left join d on t.name = d.dname where qty < 5",
+)
+
+# joins only the held side can run: a condition besides the keys, a range
+RESIDUAL = "select id, label from t inner join d on t.name = d.dname and t.price > d.floor"
+BAND = "select id, wid from t inner join w on t.id between w.lo and w.hi"
+
+# a subquery read once into a set the rows of t are checked against
+SEMI = "select id from t where name in (select dname from d where floor < 50)"
+ANTI = "select id from t where not exists (select 1 from d where d.dname = t.name and d.floor < 50)"
+
+# written small tables first: without reordering, their cross join is held
+# and every row of t is tested against it
+COMMA = "select id, label, wid from d, w, t where t.name = d.dname and t.id between w.lo and w.hi"
+
+
+def dimension(data):
+    names = sorted({row[1] for row in data[1:]})
+    return [("dname", "label", "floor")] + [(n, n.upper(), i % 100) for i, n in enumerate(names)]
+
+
+def windows(rows, width=1000):
+    return [("wid", "lo", "hi")] + [(i, lo, lo + width - 1) for i, lo in enumerate(range(0, rows, width))]
+
+
+def main(rows=200000):
+    data = synthetic_table(rows)
+    views = dict(t=data, d=dimension(data), w=windows(rows))
+    dbs = {method: VirtualDB(join_method=method, **views) for method in ('hash', 'merge')}
+    print("rows: {}".format(rows))
+    for sql in QUERIES:
+        results = {m: sorted(tuple(r) for r in etl.data(execute(sql, db))) for m, db in dbs.items()}
+        assert results['hash'] == results['merge'], "results differ: " + sql
+        print(sql)
+        for method, db in dbs.items():
+            t = best(lambda: drain(execute(sql, db)), 3)
+            print("  {:6} {:8.1f} ms".format(method, t * 1000))
+    db = dbs['hash']
+    assert drain(execute(BAND, db)) == rows + 1, "band join lost rows"
+    assert drain(execute(SEMI, db)) + drain(execute(ANTI, db)) == rows + 2, "semi and anti joins overlap"
+    assert drain(execute(COMMA, db)) == rows + 1, "comma join lost rows"
+    for name, sql in (('hash', RESIDUAL), ('band', BAND), ('semi', SEMI), ('anti', ANTI), ('comma', COMMA)):
+        print(sql)
+        print("  {:6} {:8.1f} ms".format(name, best(lambda: drain(execute(sql, db)), 3) * 1000))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
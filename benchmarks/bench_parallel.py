@@ -0,0 +1,70 @@
+"""
+GROUP BY aggregated by the process running the statement (workers=1)
+against pools of worker processes, each finishing the groups of a
+partition of the keys, checking all give the same groups. The gain needs
+as many cores as workers.
+
+    python benchmarks/bench_parallel.py [rows] [workers]
+"""
+import os
+import sys
+import math
+
+import petl as etl
+
+# run from any directory: the modules next to this one and the petlsql of
+# this tree first
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+from bench_pipeline import synthetic_table, drain, best
+
+
+QUERIES = (
+    # 10 groups
+    "select grp, count(*) as n, sum(price) as s, avg(qty) as a, min(name) as m, max(price) as x from t group by grp",
+    # 500 groups
+    "select name, count(*) filter (where qty > 2) as n, sum(price) as s, avg(price) as a from t group by name",
+    # 5000 groups: more states to merge
+    "select name, grp, count(*) as n, sum(qty) as s from t group by name, grp",
+)
+
+
+def groups(sql, db):
+    return sorted(tuple(r) for r in etl.data(execute(sql, db)))
+
+
+def same(a, b):
+    """groups a and b alike, but for the rounding of float sums added in
+    another order"""
+    return len(a) == len(b) and all(
+        len(r) == len(s) and all(math.isclose(u, v) if isinstance(u, float) else u == v for u, v in zip(r, s))
+        for r, s in zip(a, b))
+
+
+def main(rows=1000000, workers=os.cpu_count() or 1):
+    data = synthetic_table(rows)
+    dbs = {1: VirtualDB(t=data, workers=1)}
+    for n in sorted({2, workers} - {1}):
+        dbs[n] = VirtualDB(t=data, workers=n)
+    print("rows: {} cores: {}".format(rows, os.cpu_count()))
+    try:
+        for sql in QUERIES:
+            expected = groups(sql, dbs[1])
+            for n, db in dbs.items():
+                assert same(groups(sql, db), expected), "results differ: " + sql
+            print(sql)
+            serial = None
+            for n, db in dbs.items():
+                t = best(lambda: drain(execute(sql, db)), 3)
+                serial = serial or t
+                print("  workers {:2} {:8.1f} ms  x{:.2f}".format(n, t * 1000, serial / t))
+    finally:
+        for db in dbs.values():
+            db.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
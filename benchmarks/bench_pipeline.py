@@ -0,0 +1,59 @@
+"""
+Execution time of scan -> where -> select statements with the default
+chain of petl steps against the fused generated row loop.
+
+    python benchmarks/bench_pipeline.py [rows]
+"""
+import sys
+import time
+import random
+
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+
+
+QUERIES = (
+    "select id, name from t where price > 50",
+    "select id, (price * qty) as total, upper(name) as uname from t where qty < 5 and name like 'a%'",
+    "select * from t where grp in (1, 3, 5)",
+)
+
+
+def synthetic_table(rows=200000, seed=1):
+    rnd = random.Random(seed)
+    names = ["".join(rnd.choice("abcdefgh") for _ in range(6)) for _ in range(500)]
+    data = [("id", "name", "grp", "price", "qty")]
+    for i in range(rows):
+        data.append((i, rnd.choice(names), rnd.randrange(10), rnd.uniform(0, 100), rnd.randrange(10)))
+    return data
+
+
+def drain(table):
+    return sum(1 for _ in table)
+
+
+def best(f, repeat=5):
+    r = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        r.append(time.perf_counter() - start)
+    return min(r)
+
+
+def main(rows=200000):
+    data = synthetic_table(rows)
+    dbs = {mode: VirtualDB(execution=mode, t=data) for mode in VirtualDB.EXECUTION_MODES}
+    print("rows: {}".format(rows))
+    for sql in QUERIES:
+        results = {mode: [tuple(r) for r in execute(sql, db)] for mode, db in dbs.items()}
+        assert results['chain'] == results['fused'], "results differ: " + sql
+        print(sql)
+        times = {mode: best(lambda: drain(execute(sql, db))) for mode, db in dbs.items()}
+        for mode, t in times.items():
+            print("  {:6} {:8.1f} ms".format(mode, t * 1000))
+        print("  speedup {:.1f}x".format(times['chain'] / times['fused']))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,86 @@
+"""
+A table of a database answering in round trips of some latency, as a
+psycopg2 named cursor fetching over the network does, read as the
+statement pulls its rows and by a thread reading ahead of it.
+
+    python benchmarks/bench_prefetch.py [rows] [latency ms]
+"""
+import sys
+import time
+
+import petl as etl
+
+from petlsql.virtdb import VirtualDB, DB
+from petlsql.virtsql import execute
+from bench_pipeline import synthetic_table, drain, best
+
+
+QUERIES = (
+    "select id, (price * qty) as total, upper(name) as uname from r.t where qty < 5 and name like 'a%'",
+    "select grp, count(*) as n, sum(price) as s from r.t group by grp",
+)
+
+# rows of one round trip, the itersize of psycopg2 named cursors
+FETCH_ROWS = 2000
+
+
+class RemoteDB(DB):
+    """rows of a list sent FETCH_ROWS at a time, each round trip taking
+    latency seconds"""
+    data = None
+    latency = 0.0
+
+    def create_connection(self, url, config=None):
+        return None
+
+    def _get_tables(self):
+        return {'t'}
+
+    def get_view(self, path, query=None):
+        view = DB.get_view(self, path, query)
+        if view is not None:
+            # rows are sent whole, conditions stay in python
+            view.database, view.project = None, False
+        return view
+
+    def select(self, path, **kwargs):
+        return etl.wrap(RemoteRows(self.data, self.latency))
+
+    def estimate(self, path):
+        return len(self.data) - 1
+
+
+class RemoteRows:
+    def __init__(self, data, latency):
+        self.data = data
+        self.latency = latency
+
+    def __iter__(self):
+        yield self.data[0]
+        for start in range(1, len(self.data), FETCH_ROWS):
+            time.sleep(self.latency)
+            yield from self.data[start:start + FETCH_ROWS]
+
+
+VirtualDB.register_db_driver('remote', RemoteDB)
+
+
+def main(rows=200000, latency=5):
+    RemoteDB.data = synthetic_table(rows)
+    RemoteDB.latency = latency / 1000
+    dbs = {}
+    for depth in (0, 4):
+        db = dbs[depth] = VirtualDB(prefetch=depth)
+        db.addDatabase('remote://t', name='r')
+    print("rows: {} latency: {} ms per {} rows".format(rows, latency, FETCH_ROWS))
+    for sql in QUERIES:
+        results = {d: sorted(tuple(r) for r in etl.data(execute(sql, db))) for d, db in dbs.items()}
+        assert results[0] == results[4], "results differ: " + sql
+        print(sql)
+        for depth, db in dbs.items():
+            t = best(lambda: drain(execute(sql, db)), 3)
+            print("  prefetch {} {:8.1f} ms".format(depth, t * 1000))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
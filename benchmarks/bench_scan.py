@@ -0,0 +1,103 @@
+"""
+Reading a few columns of a wide csv file and of a wide sqlite table, with
+and without projection and predicate pushdown, and the csv file scanned by
+worker processes, one per cpu.
+
+    python benchmarks/bench_scan.py [rows] [columns]
+"""
+import os
+import sys
+import csv
+import random
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from petlsql.virtdb import VirtualDB, DirectoryDB
+from petlsql.virtsql import execute
+from petlsql.sqlitedb import SqliteDB
+from petlsql import csvscan
+from bench_pipeline import drain, best
+
+
+QUERIES = (
+    "select c0, c7 from {} where c3 = '5'",
+    "select c1, count(*) as n from {} where c0 = '1' group by c1",
+)
+
+
+def wide_files(directory, rows, columns):
+    rnd = random.Random(1)
+    header = ["c{}".format(i) for i in range(columns)]
+    data = [[str(rnd.randrange(10)) for _ in header] for _ in range(rows)]
+    path = os.path.join(directory, "wide.csv")
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(data)
+    dbpath = os.path.join(directory, "wide.db")
+    conn = sqlite3.connect(dbpath)
+    conn.execute("create table wide ({})".format(", ".join(header)))
+    conn.executemany("insert into wide values ({})".format(", ".join("?" * columns)), data)
+    conn.commit()
+    conn.close()
+    return path, dbpath
+
+
+@contextmanager
+def whole_rows(db):
+    """sources read whole, with WHERE evaluated in python"""
+    project = DirectoryDB._ext_['csv']
+    get_view = SqliteDB.get_view
+
+    def whole(self, path, query=None):
+        view = get_view(self, path, query)
+        if view is not None:
+            view.database, view.project = None, False
+        return view
+
+    DirectoryDB._ext_['csv'] = project[:2] + (False,) + project[3:]
+    SqliteDB.get_view = whole
+    db.invalidate()
+    try:
+        yield
+    finally:
+        DirectoryDB._ext_['csv'] = project
+        SqliteDB.get_view = get_view
+        db.invalidate()
+
+
+def main(rows=50000, columns=150):
+    directory = tempfile.mkdtemp(prefix='petlsql-bench-')
+    path, dbpath = wide_files(directory, rows, columns)
+    db = VirtualDB()
+    db.addDatabase('sqlite:///' + dbpath, name='s')
+    print("rows: {} columns: {}".format(rows, columns))
+    for template in QUERIES:
+        for table in ("'file:{}'".format(path), "s.wide"):
+            sql = template.format(table)
+            print(sql)
+            t = best(lambda: drain(execute(sql, db)), 3)
+            with whole_rows(db):
+                expected = sorted(map(tuple, execute(sql, db)), key=repr)
+                w = best(lambda: drain(execute(sql, db)), 3)
+            assert sorted(map(tuple, execute(sql, db)), key=repr) == expected, "results differ: " + sql
+            print("  pushed {:8.1f} ms  whole rows {:8.1f} ms".format(t * 1000, w * 1000))
+    # files of any size are split
+    csvscan.PARALLEL_BYTES = 0
+    workers = max(os.cpu_count() or 1, 2)
+    par = VirtualDB(workers=workers)
+    try:
+        for template in QUERIES:
+            sql = template.format("'file:{}'".format(path))
+            expected = sorted(map(tuple, execute(sql, db)), key=repr)
+            assert sorted(map(tuple, execute(sql, par)), key=repr) == expected, "results differ: " + sql
+            print(sql)
+            p = best(lambda: drain(execute(sql, par)), 3)
+            print("  {} workers {:8.1f} ms".format(workers, p * 1000))
+    finally:
+        par.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,62 @@
+"""
+Parse throughput of the generated Coco/R Scanner against FastScanner on
+large synthetic statements (wide WITH chains).
+
+    python benchmarks/bench_scanner.py [ctes] [columns]
+"""
+import sys
+import time
+
+from petlsql.sql.Scanner import Scanner
+from petlsql.sql.fastscanner import FastScanner
+from petlsql.virtsql import parse_sql
+
+
+def synthetic_sql(ctes=60, columns=12):
+    views = []
+    for i in range(ctes):
+        src = "t{}".format(i - 1) if i else "source"
+        cols = ", ".join("c{} AS c{}".format(j, j) for j in range(columns))
+        views.append("t{} AS (SELECT {} FROM {} WHERE c0 > {} AND c1 LIKE 'x{}%' "
+                     "/* step {} */ OR c2 IN (1, 2, 3, 'a\\'b'))".format(i, cols, src, i, i, i))
+    return "WITH " + "\nWITH ".join(views) + "\nSELECT * FROM t{}".format(ctes - 1)
+
+
+def tokens(scanner):
+    r = []
+    while True:
+        t = scanner.Scan()
+        r.append((t.kind, t.val, t.pos, t.line, t.col))
+        if t.kind == 0:
+            return r
+
+
+def drain(scanner):
+    while scanner.Scan().kind:
+        pass
+
+
+def best(f, repeat=5):
+    r = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        r.append(time.perf_counter() - start)
+    return min(r)
+
+
+def main(ctes=60, columns=12):
+    sql = synthetic_sql(ctes, columns)
+    assert tokens(Scanner(sql)) == tokens(FastScanner(sql)), "token streams differ"
+    size = len(sql) / 1024
+    print("statement: {:.1f} KB, {} tokens".format(size, len(tokens(FastScanner(sql)))))
+    for name, f in (("scan coco/r", lambda: drain(Scanner(sql))),
+                    ("scan fast", lambda: drain(FastScanner(sql))),
+                    ("parse coco/r", lambda: parse_sql(sql, fast=False)),
+                    ("parse fast", lambda: parse_sql(sql))):
+        t = best(f)
+        print("{:14} {:8.2f} ms {:8.0f} KB/s".format(name, t * 1000, size / t))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
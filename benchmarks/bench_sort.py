@@ -0,0 +1,59 @@
+"""
+ORDER BY in memory against the external sort with a memory budget much
+smaller than the input, checking both give the same rows.
+
+    python benchmarks/bench_sort.py [rows] [budget in KB]
+"""
+import os
+import sys
+import glob
+import tempfile
+import tracemalloc
+
+# run from any directory: the modules next to this one and the petlsql of
+# this tree first
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+from bench_pipeline import synthetic_table, drain, best
+
+
+QUERIES = (
+    "select id, name, price from t order by name",
+    "select id, grp, qty from t order by grp, qty desc",
+    "select id, name from t where price > 50 order by price",
+)
+
+
+def peak(f):
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(rows=200000, budget=1024):
+    data = synthetic_table(rows)
+    # nulls sort first, as with petl
+    data[1::97] = [(i, None, grp, price, qty) for i, _, grp, price, qty in data[1::97]]
+    spill = tempfile.mkdtemp(prefix='petlsql-bench-')
+    memory = VirtualDB(t=data)
+    external = VirtualDB(t=data, sort_memory=budget * 1024, sort_dir=spill)
+    print("rows: {} budget: {} KB".format(rows, budget))
+    for sql in QUERIES:
+        expected = [tuple(r) for r in execute(sql, memory)]
+        assert [tuple(r) for r in execute(sql, external)] == expected, "results differ: " + sql
+        assert not glob.glob(spill + '/*'), "runs left behind"
+        print(sql)
+        for name, db in (('memory', memory), ('external', external)):
+            t = best(lambda: drain(execute(sql, db)), 3)
+            p = peak(lambda: drain(execute(sql, db)))
+            print("  {:8} {:8.1f} ms  peak {:8.1f} MB".format(name, t * 1000, p / (1 << 20)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,3 +1,5 @@
+__version__ = '0.9'
+
 
 
 class Aggregator:
@@ -6,3 +8,24 @@ class Aggregator:
 
     def finalize(self):
         pass
+
+    # Optional: merge(other) adds the state of another accumulator of the
+    # same aggregate, so aggregation can be split into partial runs over
+    # parts of the rows and a final one combining them. Accumulators that
+    # do not define it are not mergeable.
+    merge = None
+
+    def state(self):
+        """picklable state, for moving partial aggregates between processes"""
+        return dict(vars(self))
+
+    @classmethod
+    def restore(cls, state):
+        """accumulator with the state returned by state()"""
+        r = cls.__new__(cls)
+        vars(r).update(state)
+        return r
+
+
+def is_mergeable(cls):
+    return isinstance(cls, type) and issubclass(cls, Aggregator) and getattr(cls, 'merge', None) is not None
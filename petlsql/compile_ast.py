@@ -1,25 +1,42 @@
-from functools import singledispatch
+from functools import singledispatch, lru_cache
+from collections import Counter
 from .sql.ast import *
+from .rewrite import share_common
+from . import sqlib
+import hashlib
+import math
 import re
 
 
 def compile_function(compiler, fid, src, arg='rec'):
+    uses_params = PARAMS_REF in src
+    source = src
+    if arg == 'rec':
+        positions = repeated_columns(src)
+        if positions:
+            if '\n' not in src:
+                src = "return " + src
+            src = "\n    ".join(column_bindings(positions) + [bind_columns(src, positions)])
     if '\n' in src:
         src = """
-def {}({}):
+def {}({}, params=None):
     {}
     """.format(fid, arg, src)
     else:
         src = """
-def {}({}):
+def {}({}, params=None):
     return {}
     """.format(fid, arg, src)
     # print("func:\n", src)
     exec(src, compiler.module)
-    return compiler.module.get(fid)
+    f = compiler.module.get(fid)
+    f.uses_params = uses_params
+    f.src = source
+    return f
 
 
 def compile_ast(ast, compiler, **kwargs):
+    ast = share_common([ast], compiler.db.is_deterministic, kwargs.get('header'))[0]
     r = comp(ast, compiler=compiler, **kwargs)
     if isinstance(r, Expression):
         r = compile_function(compiler, "f{}".format(id(ast)), r)
@@ -36,9 +53,38 @@ class Expression(str):
     pass
 
 
+PARAMS_REF = "params["
+
+
+# a column read by position, outside of string literals
+_colref = re.compile(r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|\brec\[(\d+)\]""")
+
+
+def repeated_columns(src):
+    """positions of the columns src reads more than once"""
+    counts = Counter(m.group(2) for m in _colref.finditer(src) if m.group(2))
+    return sorted((int(p) for p, n in counts.items() if n > 1))
+
+
+def column_bindings(positions):
+    return ["_c{0} = rec[{0}]".format(p) for p in positions]
+
+
+def bind_columns(src, positions):
+    """src reading the columns at positions from locals set by column_bindings"""
+    names = set(map(str, positions))
+    return _colref.sub(lambda m: "_c" + m.group(2) if m.group(2) in names else m.group(0), src)
+
+
 @comp.register(Column)
-def _(ast, compiler, **kwargs):
+def _(ast, compiler, colref=None, header=None, **kwargs):
     # print("cc:", repr(ast))
+    if colref is not None:
+        # fused pipelines read columns of raw source rows by position
+        return Expression(colref(ast))
+    position = header.position(ast.name) if hasattr(header, 'position') else None
+    if position is not None:
+        return Expression("rec[{}]".format(position))
     return Expression("rec.{}".format(ast.name))
 
 
@@ -74,46 +120,136 @@ def _escape(m):
 
 
 def _unescape(m):
-    c = chr(m.group(1))
+    c = chr(int(m.group(1)))
     if c in rexchars:
         return '\\'+c
     return c
 
 
+# LIKE wildcards, % and _
+_ANY, _ONE = object(), object()
+
+
+def like_tokens(pattern, escape=None):
+    """literal strings and wildcards of a LIKE pattern"""
+    tokens = []
+    literal = []
+    chars = iter(pattern)
+    for c in chars:
+        if c == escape:
+            literal.append(next(chars, ''))
+        elif c == '%' or c == '_':
+            if literal:
+                tokens.append(''.join(literal))
+                literal = []
+            token = _ANY if c == '%' else _ONE
+            if not (token is _ANY and tokens and tokens[-1] is _ANY):
+                tokens.append(token)
+        else:
+            literal.append(c)
+    if literal:
+        tokens.append(''.join(literal))
+    return tokens
+
+
+@lru_cache(maxsize=1024)
+def like_matcher(pattern, escape=None, isre=False):
+    """cheapest sqlib test for a LIKE (or SIMILAR TO, isre) pattern:
+    the function name and its constant arguments.
+
+    Prefix, suffix, substring and exact patterns are tested with str
+    methods, anything else with a regex compiled once per pattern.
+    """
+    name = "rex_" + hashlib.md5(repr((pattern, escape, isre)).encode('utf-8')).hexdigest()
+    if isre:
+        if escape:
+            pattern = re.sub('\\' + escape + "(.)", _escape, pattern)
+        pattern = re.sub(r'%', '.*', pattern)
+        pattern = re.sub(r'_', '.', pattern)
+        if escape:
+            pattern = re.sub(r'@(\d+)@', _unescape, pattern)
+        if pattern[:1] != '^':
+            pattern = '^'+pattern
+        if pattern[-1:] != '$':
+            pattern += '$'
+        rex = re.compile(pattern)
+    else:
+        tokens = like_tokens(pattern, escape)
+        if not any(t is _ONE for t in tokens):
+            literals = [t for t in tokens if t is not _ANY]
+            shape = tuple(t is _ANY for t in tokens)
+            if shape == ():
+                return "EQUALS", ('',)
+            if shape == (False,):
+                return "EQUALS", tuple(literals)
+            if shape == (True,):
+                # anything that is not NULL
+                return "STARTSWITH", ('',)
+            if shape == (False, True):
+                return "STARTSWITH", tuple(literals)
+            if shape == (True, False):
+                return "ENDSWITH", tuple(literals)
+            if shape == (True, False, True):
+                return "CONTAINS", tuple(literals)
+            if shape == (False, True, False):
+                return "STARTSENDS", tuple(literals)
+        rex = ''.join('.*' if t is _ANY else '.' if t is _ONE else re.escape(t) for t in tokens)
+        rex = re.compile(rex + r'\Z', re.S)
+    return "MATCH", (name, rex)
+
+
 @comp.register(LikeExpr)
 def _(ast, **kwargs):
     db = kwargs['db']
     arg = comp(ast.arg, **kwargs)
-    pattern = ast.pattern
-    escape = ast.escape
-    if escape:
-        if len(escape) > 1:
-            escape = escape[0]
-        pattern = re.sub('\\' + escape + "(.)", _escape, pattern)
-    if not ast.isre:
-        for ch in rexchars:
-            pattern.replace(ch, '\\'+ch)
-    pattern = re.sub(r'%', '.*', pattern)
-    pattern = re.sub(r'_', '.', pattern)
-    if escape:
-        pattern = re.sub(r'@(\d+)@', _unescape, pattern)
-    if pattern[0] != '^':
-        pattern = '^'+pattern
-    if pattern[-1] != '$':
-        pattern += '$'
-    pattern = re.compile(pattern)
-    rex = db.addGlobalVar(pattern, ast)
+    escape = ast.escape[0] if ast.escape else None
+    func, args = like_matcher(ast.pattern, escape, ast.isre)
     prefix = "" if ast.is_true else "NOT"
-    return Expression('sqlib.{}MATCH({},{})'.format(prefix, rex, arg))
+    if func == "MATCH":
+        name, rex = args
+        # the name depends on the pattern only, compiled code of other
+        # statements keeps refering to the same regex
+        db.addGlobalVar(rex, name)
+        return Expression('sqlib.{}MATCH({},{})'.format(prefix, name, arg))
+    return Expression('sqlib.{}{}({}, {})'.format(prefix, func, arg, ', '.join(map(repr, args))))
+
+
+def constant_values(values):
+    """python values of a list of literals, or None if some are not"""
+    r = []
+    for v in values:
+        if isinstance(v, Constant):
+            v = v.value
+        elif isinstance(v, Identifier) or not (v is None or isinstance(v, (str, int, float))):
+            return
+        r.append(v)
+    return r
 
 
 @comp.register(InExpr)
 def _(ast, **kwargs):
     arg = comp(ast.arg, **kwargs)
-    values = [comp(v, **kwargs) for v in ast.values]
     prefix = "" if ast.is_true else "NOT"
+    values = constant_values(ast.values)
+    if values is not None:
+        try:
+            values = frozenset(values)
+        except TypeError:
+            pass
+        else:
+            # built once; same lists share one set across statements
+            key = repr(sorted(map(repr, values))).encode('utf-8')
+            name = kwargs['db'].addGlobalVar(values, "in_" + hashlib.md5(key).hexdigest())
+            return Expression('sqlib.{}INSET({},{})'.format(prefix, arg, name))
+    values = [comp(v, **kwargs) for v in ast.values]
     return Expression('sqlib.{}IN({},{})'.format(prefix, arg, ', '.join(values)))
 
+@comp.register(InSubquery)
+@comp.register(Exists)
+def _(ast, **kwargs):
+    raise SQLError("EXISTS and IN (subquery) are supported as conditions of WHERE joined by AND only")
+
+
 @comp.register(ContainingExpr)
 def _(ast, **kwargs):
     arg = comp(ast.arg, **kwargs)
@@ -199,14 +335,40 @@ def _(ast, **kwargs):
 
 
 @comp.register(Var)
-def _(ast, **kwargs):
-    return comp(ast.value, **kwargs)
+def _(ast, header=None, **kwargs):
+    if ast.id is not None and not isinstance(ast.value, Column) and hasattr(header, 'position'):
+        # already computed by an earlier plan step
+        position = header.position(str(ast.id))
+        if position is not None:
+            return Expression("rec[{}]".format(position))
+    return comp(ast.value, header=header, **kwargs)
 
 @comp.register(PyVar)
 def _(ast, **kwargs):
     return ast.val
 
 
+@comp.register(Param)
+def _(ast, **kwargs):
+    return Expression('{}"{}"]'.format(PARAMS_REF, ast.id))
+
+
+@comp.register(Constant)
+def _(ast, db, **kwargs):
+    value = ast.value
+    if value is None or isinstance(value, (bool, int, str)) \
+            or (isinstance(value, float) and math.isfinite(value)):
+        return Expression(repr(value))
+    return Expression(db.addGlobalVar(value))
+
+
+@comp.register(Shared)
+def _(ast, **kwargs):
+    if ast.first:
+        return Expression("({} := {})".format(ast.name, comp(ast.value, **kwargs)))
+    return Expression(ast.name)
+
+
 _type2func = {
     int: "sqlib.INT",
     str: "sqlib.STR",
@@ -287,6 +449,56 @@ def _(ast, **kwargs):
     return compile_function(kwargs['compiler'], "r{}".format(id(ast)), src, arg='rows')
 
 
+def accumulator(ast, **kwargs):
+    """(factory, value, condition) of an aggregate stepped row by row:
+    factory() makes the accumulator of a group, value is the source of
+    what it steps with (None: the row itself) and condition the source of
+    its FILTER clause (None: every row)"""
+    if isinstance(ast, Function):
+        args = [comp(arg, **kwargs) for arg in ast.args]
+        value = args[0] if len(args) == 1 else "[{}]".format(', '.join(args))
+        return ast.id.code, value, None
+    value = condition = None
+    if ast.arg is None and ast.func == Aggregate.COUNT:
+        factory = sqlib.CountAll
+    else:
+        name = ast.func.name + ("_DISTINCT" if ast.distinct else "")
+        factory = sqlib.accumulators[name]
+        value = comp(ast.arg, **kwargs)
+    if ast.selector:
+        condition = comp(ast.selector, **kwargs)
+    return factory, value, condition
+
+
+def compile_aggregates(aggregates, compiler, nulls=True, **kwargs):
+    """factories of the accumulators of aggregates and one function that
+    steps all of them with a row, step(states, rec)
+
+    With nulls an aggregate whose value fails for a row is null; its
+    state becomes None and is not stepped any more. Otherwise the error
+    propagates.
+    """
+    factories = []
+    lines = []
+    for i, ast in enumerate(aggregates):
+        factory, value, condition = accumulator(ast, compiler=compiler, **kwargs)
+        factories.append(factory)
+        code = "states[{}].step({})".format(i, "rec" if value is None else value)
+        if condition is not None:
+            code = "if {}:\n    {}".format(condition, code)
+        if nulls:
+            code = "if states[{0}] is not None:\n    try:\n        {1}\n    except Exception:\n" \
+                   "        states[{0}] = None".format(i, code.replace("\n", "\n        "))
+        lines.append(code)
+    src = "\n".join(lines)
+    positions = repeated_columns(src)
+    if positions:
+        src = "\n".join(column_bindings(positions) + [bind_columns(src, positions)])
+    src = src.replace("\n", "\n    ") + "\n    return states" if src else "return states"
+    step = compile_function(compiler, "g{}".format(id(aggregates)), src, arg='states, rec')
+    return factories, step
+
+
 @comp.register(list)
 def _(ast, **kwargs):
     r = [comp(x, **kwargs) for x in ast]
@@ -0,0 +1,320 @@
+"""
+Reading some columns of a csv file.
+
+Lines without a quote character are split with str.split, no further than
+the last column read, so the fields after it are never separated and the
+rows built hold the columns read only. Lines with quotes, which may hold
+delimiters or go on over the next lines, are parsed by csv.reader.
+
+Large files can be read by a pool of worker processes. The process running
+the statement cuts the file into ranges of records and the workers each
+parse one, returning its rows as a tuple of columns, as the batches of
+petlsql.parallel travel. A range ends after a newline outside quotes,
+found by counting the quote characters from the start of the records: the
+newlines of quoted values come after an odd number of them. The workers
+may also run the fused segment of a statement, its WHERE and select list,
+over their rows, so only the rows it keeps travel back.
+"""
+import io
+import os
+import csv
+import locale
+from collections import deque
+from itertools import chain, repeat
+from operator import itemgetter
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import petl as etl
+from petl.io.sources import read_source_from_arg
+
+from .parallel import rebuild
+
+
+__all__ = ("fromcsv", "CSVColumnsView", "estimate_rows", "parallel_fromcsv", "ParallelCSVView")
+
+
+# bytes of the start of a file whose lines estimate the length of the others
+SAMPLE_BYTES = 1 << 16
+
+
+def fromcsv(source=None, columns=None, **kwargs):
+    """etl.fromcsv, reading the columns only when given"""
+    if columns is None:
+        return etl.fromcsv(source, **kwargs)
+    if kwargs.get('header') is not None:
+        return etl.cut(etl.fromcsv(source, **kwargs), *columns)
+    kwargs.pop('header', None)
+    return CSVColumnsView(source, columns, **kwargs)
+
+
+def estimate_rows(path):
+    """rows of the csv file path, estimated from the lines of its start"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            sample = f.read(SAMPLE_BYTES)
+    except OSError:
+        return
+    lines = sample.count(b'\n')
+    if len(sample) == size:
+        # all of it: a last line without a newline counts too
+        return max(lines + (not sample.endswith(b'\n')) - 1, 0)
+    if not lines:
+        return
+    return int(size / (len(sample) / lines)) - 1
+
+
+class CSVColumnsView(etl.Table):
+    """rows of the fields columns of a csv file with a header line"""
+    def __init__(self, source, columns, encoding=None, errors='strict', **csvargs):
+        self.source = source
+        self.columns = tuple(columns)
+        self.encoding = encoding
+        self.errors = errors
+        self.csvargs = csvargs
+        self.csvargs.setdefault('dialect', 'excel')
+
+    def __iter__(self):
+        yield self.columns
+        source = read_source_from_arg(str(self.source))
+        with source.open('rb') as buf:
+            f = io.TextIOWrapper(buf, encoding=self.encoding, errors=self.errors, newline='')
+            try:
+                yield from self.rows(f)
+            finally:
+                f.detach()
+
+    def rows(self, f):
+        return project_lines(iter(f), self.columns, **self.csvargs)
+
+
+def project_lines(lines, columns=None, positions=None, **csvargs):
+    """rows of the fields columns of the csv lines lines, read from their
+    header line, or, for lines without one, of the fields at positions"""
+    # a line csv.reader is to parse; it reads the lines after it
+    # from the file when a quoted field goes on
+    pending = []
+
+    def feed():
+        while True:
+            if pending:
+                yield pending.pop()
+            else:
+                line = next(lines, None)
+                if line is None:
+                    return
+                yield line
+
+    reader = csv.reader(feed(), **csvargs)
+    if positions is None:
+        header = next(reader, None)
+        if header is None:
+            return
+        positions = [header.index(c) for c in columns]
+    if not positions:
+        for _ in reader:
+            yield ()
+        return
+    last = max(positions)
+    get = itemgetter(*positions)
+    single = len(positions) == 1
+    padding = [None] * (last + 1)
+    d = reader.dialect
+    # quoting rules aside, a csv line is its fields joined by the delimiter
+    plain = d.escapechar is None and not d.skipinitialspace and d.quoting in (csv.QUOTE_MINIMAL, csv.QUOTE_ALL)
+    delimiter, quotechar = d.delimiter, d.quotechar
+    for line in lines:
+        if plain and quotechar not in line:
+            line = line.rstrip('\r\n')
+            row = line.split(delimiter, last + 1) if line else []
+        else:
+            pending.append(line)
+            row = next(reader)
+        if len(row) <= last:
+            # short rows read as NULLs, as with etl.fieldmap
+            row = row + padding[len(row):]
+        yield (get(row),) if single else get(row)
+
+
+def dialect(csvargs):
+    return csv.reader([], **csvargs).dialect
+
+
+def splittable(encoding, csvargs):
+    """records of csv files of encoding and the csv options csvargs can be
+    told apart by the quote characters and newlines of their bytes: quotes
+    are doubled in the values, and both are single bytes no other character
+    holds"""
+    d = dialect(csvargs)
+    if d.escapechar is not None or not d.doublequote or d.quoting == csv.QUOTE_NONE:
+        return False
+    try:
+        return d.quotechar.encode(encoding) == d.quotechar.encode('ascii') and '\n'.encode(encoding) == b'\n'
+    except (UnicodeError, LookupError):
+        return False
+
+
+def record_ranges(f, start, size, quote=b'"'):
+    """(start, end) byte ranges of the records of the binary file f from
+    the offset start on, about size bytes each. A range ends after a
+    newline outside quotes: the quotes before it, counted from start, the
+    first byte of a record, are even"""
+    f.seek(start)
+    begin = offset = start
+    inside = False
+    while True:
+        block = f.read(size)
+        if not block:
+            break
+        # the last newline of the block outside quotes
+        quotes = block.count(quote)
+        after = 0
+        p = len(block)
+        while True:
+            q = block.rfind(b'\n', 0, p)
+            if q < 0:
+                break
+            after += block.count(quote, q, p)
+            p = q
+            if not inside ^ ((quotes - after) & 1):
+                yield begin, offset + p + 1
+                begin = offset + p + 1
+                break
+        inside ^= quotes & 1
+        offset += len(block)
+    if begin < offset:
+        yield begin, offset
+
+
+def header_end(f, quote=b'"'):
+    """offset of the first byte after the header record of the binary file f"""
+    f.seek(0)
+    offset = 0
+    inside = False
+    while True:
+        block = f.read(1 << 12)
+        if not block:
+            return offset
+        p = 0
+        while True:
+            q = block.find(b'\n', p)
+            if q < 0:
+                break
+            inside ^= block.count(quote, p, q) & 1
+            p = q + 1
+            if not inside:
+                return offset + p
+        inside ^= block.count(quote, p) & 1
+        offset += len(block)
+
+
+def scan_range(path, start, end, positions, encoding, errors, csvargs, code=None, params=None):
+    """rows of the fields at positions of the records of the byte range
+    start, end of the csv file path, in a worker, as the number of rows and
+    a tuple of their columns; with code, those of the rows the segment code
+    was compiled from turns them into"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding, errors)
+    rows = project_lines(iter(io.StringIO(text, newline='')), positions=positions, **csvargs)
+    if code is not None:
+        segment = rebuild(code, "segment(rows, params=None)")
+        # the segment skips a header first
+        rows = segment(chain([None], rows), params)
+    rows = list(rows)
+    return len(rows), tuple(zip(*rows))
+
+
+# files smaller than this are read by the process running the statement
+PARALLEL_BYTES = 16 << 20
+# bytes of the records of one range read by a worker
+RANGE_BYTES = 4 << 20
+
+
+def parallel_fromcsv(source, pool, workers, columns=None, ordered=True, segment=None, params=None,
+                     encoding=None, errors='strict', header=None, **csvargs):
+    """ParallelCSVView of the csv file source, or None when it is too small
+    to pay for the workers or its records cannot be split"""
+    if header is not None or not isinstance(source, (str, os.PathLike)):
+        return
+    encoding = encoding or locale.getpreferredencoding(False)
+    csvargs.setdefault('dialect', 'excel')
+    try:
+        if os.path.getsize(source) < PARALLEL_BYTES:
+            return
+    except OSError:
+        return
+    if not splittable(encoding, csvargs):
+        return
+    return ParallelCSVView(source, columns, pool, workers, ordered, segment, params,
+                           encoding, errors, csvargs)
+
+
+class ParallelCSVView(etl.Table):
+    """rows of the fields columns (all when None) of a csv file, its ranges
+    of records parsed by a pool of worker processes. With segment, a pair of
+    the code of a fused segment and its header, the workers also run the
+    segment and its rows are returned. The rows come in the order of the
+    file with ordered, else as the workers return them"""
+    def __init__(self, source, columns, pool, workers, ordered=True, segment=None, params=None,
+                 encoding='utf-8', errors='strict', csvargs={}):
+        self.source = str(source)
+        self.columns = columns
+        self.pool = pool
+        self.workers = workers
+        self.ordered = ordered
+        self.segment = segment
+        self.params = params
+        self.encoding = encoding
+        self.errors = errors
+        self.csvargs = csvargs
+
+    def __iter__(self):
+        quote = dialect(self.csvargs).quotechar.encode(self.encoding)
+        with open(self.source, 'rb') as f:
+            start = header_end(f, quote)
+            f.seek(0)
+            text = f.read(start).decode(self.encoding, self.errors)
+            fields = next(csv.reader(io.StringIO(text, newline=''), **self.csvargs), [])
+            if self.columns is None:
+                positions = list(range(len(fields)))
+                header = tuple(fields)
+            else:
+                positions = [fields.index(c) for c in self.columns]
+                header = tuple(self.columns)
+            code = None
+            if self.segment is not None:
+                code, header = self.segment
+            yield header
+            batches = self.batches(record_ranges(f, start, RANGE_BYTES, quote), positions, code)
+            for n, columns in batches:
+                if columns:
+                    yield from zip(*columns)
+                else:
+                    yield from repeat((), n)
+
+    def batches(self, ranges, positions, code):
+        """results of the workers for the ranges, at most two per worker in
+        flight"""
+        pool = self.pool()
+        pending = deque()
+        args = (positions, self.encoding, self.errors, self.csvargs, code, self.params)
+        try:
+            for start, end in ranges:
+                if len(pending) >= 2 * self.workers:
+                    yield from self.done(pending)
+                pending.append(pool.submit(scan_range, self.source, start, end, *args))
+            while pending:
+                yield from self.done(pending)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def done(self, pending):
+        if self.ordered:
+            yield pending.popleft().result()
+            return
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            pending.remove(future)
+            yield future.result()
@@ -0,0 +1,405 @@
+"""
+EXPLAIN for compiled statements.
+
+A compiled statement is a nest of functools.partial objects over the
+run.py executors. explain() walks that nest and describes each executor;
+with analyze=True it also runs the statement through probes that count
+the rows every operator produces, the time spent producing them and the
+memory traced while they were produced.
+"""
+import time
+import tracemalloc
+from copy import copy
+from functools import partial
+
+import petl as etl
+
+from .sql.ast import View, Join, Param
+from .run import *
+from .parallel import parallel_aggregate_execute
+
+
+__all__ = ("explain", "Operator")
+
+
+def _names(fields):
+    return ', '.join(str(name) for name, _ in fields)
+
+
+def _expr(f):
+    src = getattr(f, 'src', None)
+    if src is None:
+        return str(f)
+    return ' '.join(src.split())
+
+
+def _fieldmap(fields):
+    r = []
+    for name, value in fields.items():
+        if isinstance(value, str):
+            r.append(name if name == value else "{}={}".format(name, value))
+        else:
+            r.append("{}={}".format(name, _expr(value)))
+    return ', '.join(r)
+
+
+def _keys(key):
+    if isinstance(key, (list, tuple)):
+        return ', '.join(map(str, key))
+    return str(key)
+
+
+def _bound(sql, args):
+    """sql sent to a database and the arguments of its placeholders"""
+    if not args:
+        return str(sql)
+    return "{} [{}]".format(sql, ', '.join(_value(a) if isinstance(a, Param) else repr(a) for a in args))
+
+
+def _parallel(parallel):
+    r = " workers: {}".format(parallel['workers'])
+    if not parallel['ordered']:
+        r += " unordered"
+    return r
+
+
+def _prefetch(prefetch):
+    return " prefetch: {}".format(prefetch) if prefetch else ""
+
+
+def _describe_table(view, fieldmap=None, row_number=None, columns=None, where=None, parallel=None,
+                    prefetch=None, **kwargs):
+    r = "Scan {}".format(view.name or '(subquery)')
+    if columns is not None:
+        r += " columns: " + ', '.join(columns)
+    if where is not None:
+        r += " where: " + _bound(where, where.args)
+    if fieldmap:
+        r += " fields: " + _fieldmap(fieldmap)
+    if row_number:
+        r += " row number: " + row_number
+    if parallel is not None:
+        r += _parallel(parallel)
+    return r + _prefetch(prefetch)
+
+
+def _describe_fused(view, segment, header, columns=None, where=None, parallel=None, code=None,
+                    prefetch=None, **kwargs):
+    r = "Fused scan {}".format(view.name or '(subquery)')
+    if columns is not None:
+        r += " columns: " + ', '.join(columns)
+    if where is not None:
+        r += " where: " + _bound(where, where.args)
+    r += " fields: " + ', '.join(header)
+    if parallel is not None:
+        r += _parallel(parallel)
+        if code is None:
+            r += " (filtered here)"
+    return r + _prefetch(prefetch)
+
+
+def _describe_query(query, prefetch=None, **kwargs):
+    return "Query {}: {}{}".format(type(query.database).__name__, _bound(query, query.all_args), _prefetch(prefetch))
+
+
+def _describe_join(cl, cr, join, **kwargs):
+    if join == Join.UNION:
+        r = "Cross join"
+    else:
+        r = "{} join".format(join.name.capitalize())
+        if 'key' in kwargs:
+            r += " key: " + _keys(kwargs['key'])
+        elif 'lkey' in kwargs:
+            r += " keys: ({}) = ({})".format(_keys(kwargs['lkey']), _keys(kwargs['rkey']))
+        if kwargs.get('presorted'):
+            r += " presorted"
+    return r + _join_adds(**kwargs)
+
+
+def _describe_hash_join(cl, cr, join, lkey=(), rkey=(), build='right', residual=None, **kwargs):
+    r = "Hash {} join keys: ({}) = ({}) build: {}".format(join.name.lower(), _keys(lkey), _keys(rkey), build)
+    if residual is not None:
+        r += " filter: " + _expr(residual)
+    return r + _join_adds(**kwargs)
+
+
+def _describe_band_join(cl, cr, join, build='right', value=None, lower=None, upper=None,
+                        residual=None, **kwargs):
+    if value is None:
+        r = "Nested loop {} join build: {}".format(join.name.lower(), build)
+    else:
+        r = "Band {} join value: {}".format(join.name.lower(), _expr(value))
+        if lower is not None:
+            r += " lower: " + _expr(lower)
+        if upper is not None:
+            r += " upper: " + _expr(upper)
+        r += " build: " + build
+    if residual is not None:
+        r += " filter: " + _expr(residual)
+    return r + _join_adds(**kwargs)
+
+
+def _describe_semi_join(c, view, keys=(), fields=(), anti=False, residual=None, **kwargs):
+    r = "Anti join" if anti else "Semi join"
+    if keys:
+        r += " keys: ({}) = ({})".format(', '.join(map(_expr, keys)), _keys(fields))
+    if residual is not None:
+        r += " filter: " + _expr(residual)
+    return r
+
+
+def _join_adds(addLfields=None, addRfields=None, **kwargs):
+    r = ""
+    if addLfields:
+        r += " left adds: " + _names(addLfields)
+    if addRfields:
+        r += " right adds: " + _names(addRfields)
+    return r
+
+
+def _describe_select(c, selector, addfields=None, **kwargs):
+    r = "Select " + _expr(selector)
+    if addfields:
+        r += " adds: " + _names(addfields)
+    return r
+
+
+def _describe_addfields(c, addfields=(), **kwargs):
+    return "Add fields " + _names(addfields)
+
+
+def _describe_fieldmap(c, fieldmap={}, **kwargs):
+    return "Project " + _fieldmap(fieldmap)
+
+
+def _describe_cut(c, fields=(), **kwargs):
+    return "Cut " + ', '.join(map(str, fields))
+
+
+def _describe_reducer(c, key=(), header=(), aggregates=(), addfields=None, presorted=False, **kwargs):
+    r = "{} by {} aggregates: {}".format("Group presorted" if presorted else "Sort group",
+                                       _keys(key), ', '.join(map(str, header[len(key):])))
+    if addfields:
+        r += " adds: " + _names(addfields)
+    return r
+
+
+def _describe_hash_aggregate(c, key=(), header=(), aggregates=(), addfields=None, mergeable=False, **kwargs):
+    r = "Hash group by {} aggregates: {}".format(_keys(key), ', '.join(map(str, header[len(key):])))
+    if mergeable:
+        r += " (mergeable)"
+    if addfields:
+        r += " adds: " + _names(addfields)
+    return r
+
+
+def _describe_parallel_aggregate(c, key=(), header=(), workers=1, addfields=None, **kwargs):
+    r = "Parallel hash group by {} aggregates: {} workers: {}".format(
+        _keys(key), ', '.join(map(str, header[len(key):])), workers)
+    if addfields:
+        r += " adds: " + _names(addfields)
+    return r
+
+
+def _describe_aggregate(c, header, aggregates, **kwargs):
+    return "Aggregate " + ', '.join(map(str, header))
+
+
+def _describe_sort(c, key=(), reverse=False, addfields=None, memory=None, limit=None, **kwargs):
+    r = "Top {} by ".format(_limit(*limit)) if limit else "Sort by "
+    r += _keys(key)
+    if reverse:
+        r += " desc"
+    if memory:
+        r += " memory: {} KB".format(memory // 1024)
+    if addfields:
+        r += " adds: " + _names(addfields)
+    return r
+
+
+def _describe_distinct(c, **kwargs):
+    return "Distinct"
+
+
+def _limit(count, offset=None):
+    r = _value(count) if count is not None else "all"
+    if offset is not None:
+        r += " offset " + _value(offset)
+    return r
+
+
+def _value(value):
+    return "?" + value.id if isinstance(value, Param) else str(value)
+
+
+def _describe_limit(c, count=None, offset=None, **kwargs):
+    return "Limit " + _limit(count, offset)
+
+
+describers = {
+    table_execute: _describe_table,
+    fused_execute: _describe_fused,
+    query_execute: _describe_query,
+    join_execute: _describe_join,
+    hash_join_execute: _describe_hash_join,
+    band_join_execute: _describe_band_join,
+    semi_join_execute: _describe_semi_join,
+    select_execute: _describe_select,
+    addfields_execute: _describe_addfields,
+    fieldmap_execute: _describe_fieldmap,
+    cut_execute: _describe_cut,
+    reducer_execute: _describe_reducer,
+    hash_aggregate_execute: _describe_hash_aggregate,
+    parallel_aggregate_execute: _describe_parallel_aggregate,
+    aggregate_execute: _describe_aggregate,
+    sort_execute: _describe_sort,
+    distinct_execute: _describe_distinct,
+    limit_execute: _describe_limit,
+}
+
+
+def compiled(view):
+    """executors of a view compiled from sql, or None"""
+    while isinstance(view, View):
+        view = view.f
+    if isinstance(view, partial):
+        return view
+
+
+class Operator:
+    """one executor of a compiled statement and the operators it reads"""
+    def __init__(self, f):
+        self.f = f
+        self.children = []
+        self.args = []
+        for arg in f.args:
+            if isinstance(arg, partial):
+                op = Operator(arg)
+                self.children.append(op)
+                arg = op
+            elif isinstance(arg, View) and compiled(arg) is not None:
+                arg = self.subquery(arg)
+            self.args.append(arg)
+        self.rows = 0
+        self.time = 0.0
+        self.peak = 0
+
+    def subquery(self, view):
+        """copy of view, a statement compiled from sql, running through
+        operators of its own"""
+        view = copy(view)
+        if isinstance(view.f, View):
+            view.f = self.subquery(view.f)
+        else:
+            op = Operator(view.f)
+            self.children.append(op)
+            view.f = op
+        return view
+
+    @property
+    def description(self):
+        describe = describers.get(self.f.func)
+        if describe is None:
+            return getattr(self.f.func, '__name__', str(self.f.func))
+        return describe(*self.f.args, **self.f.keywords)
+
+    @property
+    def rows_in(self):
+        return sum(op.rows for op in self.children)
+
+    @property
+    def own_time(self):
+        return max(self.time - sum(op.time for op in self.children), 0.0)
+
+    def __call__(self, params=None, **kwargs):
+        # some executors read their input right away (global aggregates)
+        start = time.perf_counter()
+        table = self.f.func(*self.args, params=params, **self.f.keywords)
+        self.time += time.perf_counter() - start
+        return Probe(table, self)
+
+    def lines(self, analyze=False, depth=0):
+        line = "  " * depth + self.description
+        if analyze:
+            line += "  (rows in={} out={} time={:.3f} ms total={:.3f} ms peak={:.1f} KB)".format(
+                self.rows_in if self.children else '-', self.rows,
+                self.own_time * 1000, self.time * 1000, self.peak / 1024)
+        yield line
+        for op in self.children:
+            yield from op.lines(analyze, depth + 1)
+
+
+class Probe(etl.Table):
+    """rows of an operator, counted and timed as they are pulled"""
+    def __init__(self, table, op):
+        self.table = table
+        self.op = op
+
+    def __iter__(self):
+        op = self.op
+        clock = time.perf_counter
+        tracing = tracemalloc.is_tracing()
+        # memory held by the operator: traced memory above what it held
+        # when it started, at its highest while it produces a row
+        base = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = self.pull(clock)
+        it = iter(self.table)
+        try:
+            header = next(it)
+        except StopIteration:
+            self.pulled(start, clock, tracing, base)
+            return
+        self.pulled(start, clock, tracing, base)
+        yield header
+        while True:
+            start = self.pull(clock)
+            try:
+                row = next(it)
+            except StopIteration:
+                self.pulled(start, clock, tracing, base)
+                return
+            self.pulled(start, clock, tracing, base)
+            op.rows += 1
+            yield row
+
+    @staticmethod
+    def pull(clock):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        return clock()
+
+    def pulled(self, start, clock, tracing, base):
+        """account the time and peak memory of a pull begun at start"""
+        op = self.op
+        op.time += clock() - start
+        if tracing:
+            op.peak = max(op.peak, tracemalloc.get_traced_memory()[1] - base)
+
+
+def explain(view, analyze=False, params=None):
+    """operator tree of a compiled statement, one operator per line.
+
+    With analyze the statement is run (its rows are discarded) and every
+    operator reports the rows it read and produced, the time spent in it
+    and in the operators below it, and the memory traced while it ran.
+    """
+    f = compiled(view)
+    if f is None:
+        return "Result"
+    root = Operator(f)
+    if not analyze:
+        return '\n'.join(root.lines())
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        for _ in root(params=params):
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    lines = list(root.lines(analyze=True))
+    lines.append("Total: {} rows in {:.3f} ms".format(root.rows, elapsed * 1000))
+    return '\n'.join(lines)
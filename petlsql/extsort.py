@@ -0,0 +1,124 @@
+"""
+ORDER BY within a memory budget.
+
+Rows are collected until their estimated size reaches the budget, then
+sorted and written to a compressed run file in the spill directory. The
+runs and the rows still in memory are combined with a k-way heapq.merge,
+which keeps the order of equal rows as it was in the input.
+"""
+import os
+import sys
+import heapq
+import pickle
+import zlib
+import tempfile
+from struct import Struct
+from itertools import islice
+
+import petl as etl
+from petl.comparison import comparable_itemgetter
+
+
+__all__ = ("ExternalSortView",)
+
+
+# rows pickled together in a run file
+CHUNK_ROWS = 1000
+# runs merged into one before there are more, so the final merge does
+# not keep too many files open
+MERGE_RUNS = 64
+# rows whose size is measured to estimate the size of the others
+SAMPLE_ROWS = 100
+
+_length = Struct('<I')
+
+
+def row_size(row):
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+
+class Run:
+    """sorted rows written to a temporary file as compressed pickled
+    chunks, each preceded by its length"""
+    def __init__(self, rows, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='petlsql-sort-', suffix='.run', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                rows = iter(rows)
+                while True:
+                    chunk = list(islice(rows, CHUNK_ROWS))
+                    if not chunk:
+                        break
+                    data = zlib.compress(pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL), 1)
+                    f.write(_length.pack(len(data)))
+                    f.write(data)
+        except BaseException:
+            self.remove()
+            raise
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                prefix = f.read(_length.size)
+                if not prefix:
+                    return
+                data = f.read(_length.unpack(prefix)[0])
+                yield from pickle.loads(zlib.decompress(data))
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ExternalSortView(etl.Table):
+    """rows of source sorted by the fields key, holding about memory
+    bytes of rows at a time; the rest is spilled to directory"""
+    def __init__(self, source, key, reverse=False, memory=64 << 20, directory=None):
+        self.source = source
+        self.key = key
+        self.reverse = reverse
+        self.memory = memory
+        self.directory = directory
+
+    def __iter__(self):
+        it = iter(self.source)
+        try:
+            header = tuple(next(it))
+        except StopIteration:
+            return
+        yield header
+        key = comparable_itemgetter(*[header.index(k) for k in self.key])
+        runs = []
+        try:
+            rows = []
+            size = 0
+            measured = 0
+            for row in it:
+                rows.append(row)
+                if measured < SAMPLE_ROWS:
+                    size += row_size(row)
+                    measured += 1
+                if len(rows) * size > self.memory * measured:
+                    rows.sort(key=key, reverse=self.reverse)
+                    runs.append(Run(rows, self.directory))
+                    rows = []
+                    if len(runs) >= MERGE_RUNS:
+                        runs = [self.merge(runs, key)]
+            rows.sort(key=key, reverse=self.reverse)
+            if not runs:
+                yield from rows
+                return
+            yield from heapq.merge(*runs, rows, key=key, reverse=self.reverse)
+        finally:
+            for run in runs:
+                run.remove()
+
+    def merge(self, runs, key):
+        """one run of the rows of runs"""
+        try:
+            return Run(heapq.merge(*runs, key=key, reverse=self.reverse), self.directory)
+        finally:
+            for run in runs:
+                run.remove()
@@ -0,0 +1,95 @@
+"""
+Whole pipeline code generation.
+
+A statement that only scans one table, filters and projects is compiled
+into a single generated function. It walks the raw source tuples once,
+reads columns by position and yields output tuples, so no intermediate
+petl tables or per-row Record objects are built.
+"""
+from functools import partial
+
+from .sql.ast import *
+from .compile_ast import comp, compile_function, repeated_columns, column_bindings, bind_columns
+from .rewrite import share_common
+from .run import fused_execute
+from .plan import scan_columns, parallel_scan, read_ahead
+from .parallel import portable
+
+
+__all__ = ("fuse",)
+
+
+def fuse(ast, compiler, **kwargs):
+    """fused plan of ast, or None when it has stages other than
+    scan, where and select list"""
+    table = ast.source
+    if not isinstance(table, Table) or table.rownumber:
+        return
+    if ast.groupby or ast.orders or ast.semijoins:
+        return
+    scan = {}
+    read = scan_columns(table)
+    if read is None and table.view.project:
+        # sources reading some columns give rows of all of them, short
+        # rows padded with NULLs as fieldmap does for the others
+        read = list(table.columns)
+    if read is not None:
+        scan['columns'] = read
+    if table.pushed is not None:
+        scan['where'] = table.pushed
+    if table.view.blocking:
+        scan.update(read_ahead(compiler.db))
+    columns = {c: i for i, c in enumerate(table.columns if read is None else read)}
+    kwargs.update(compiler=compiler, colref=lambda c: "rec[{}]".format(columns[c.column]))
+    fields = []
+    if isinstance(ast.columns, Columns):
+        for var in ast.columns:
+            name = compiler.var_name(var)
+            v = var.value
+            if is_aggregate(v):
+                return
+            if isinstance(v, Column) and var.id == v:
+                name = v.column
+            fields.append((name, v))
+    else:
+        for k, c in table.use.items():
+            fields.append((str(c.alias or k), c))
+    header, values = zip(*fields)
+    roots = list(values)
+    if ast.selector is not None:
+        roots.insert(0, ast.selector.cond)
+    # expressions repeated within the row are computed once
+    shared = [expression(v, **kwargs) for v in share_common(roots, compiler.db.is_deterministic)]
+    cond = shared.pop(0) if ast.selector is not None else None
+    # columns read more than once per row are bound to locals
+    positions = repeated_columns("\n".join(shared if cond is None else [cond] + shared))
+    shared = [bind_columns(v, positions) for v in shared]
+    guarded = ["sqlib.TRY(rec, lambda rec: {})".format(expression(v, **kwargs)) for v in values]
+    indent = "    "
+    src = ["rows = iter(rows)", "next(rows, None)", "for rec in rows:"]
+    src += [indent + line for line in column_bindings(positions)]
+    if cond is not None:
+        src.append(indent + "if not ({}): continue".format(bind_columns(cond, positions)))
+    # petl fieldmap turns failing expressions into None; do the same,
+    # without paying for it on rows that evaluate cleanly
+    src += [indent + "try: out = ({},)".format(', '.join(shared)),
+            indent + "except Exception: out = ({},)".format(', '.join(guarded)),
+            indent + "yield out"]
+    segment = compile_function(compiler, "p{}".format(id(ast)), "\n    ".join(src), arg='rows')
+    parallel = parallel_scan(compiler.db, table)
+    if parallel is not None:
+        scan['parallel'] = parallel
+        # the workers filter and project their rows when they can rebuild
+        # the segment, else the rows they read are fed to it here
+        code = portable(segment, compiler.module)
+        if code is not None:
+            scan['code'] = code
+    return partial(fused_execute, table.view, segment, header, **scan)
+
+
+def expression(ast, db, **kwargs):
+    r = comp(ast, db=db, **kwargs)
+    if callable(r):
+        # CASE compiles to a function of the row
+        return "{}(rec, params)".format(db.addGlobalVar(r))
+    return r
@@ -0,0 +1,244 @@
+"""
+Order of the inner joins of a FROM clause.
+
+The parser joins the tables of FROM left-deep, in the order they are
+written. reorder_joins takes a run of inner and cross joins apart into
+its inputs and their conditions, the conditions of WHERE that read
+several inputs included, and joins the inputs again: in the order whose
+intermediate results it estimates smallest, each condition on the first
+join that has the inputs it reads. An input's rows are estimated by its
+source, the rows of a join from those of its inputs and the selectivity
+of the conditions joining them: 1 / the larger number of distinct values
+of the keys of an equality when the sources know them, else 1 / the rows
+of the smaller input (its key taken as unique), and 1/3 for any other
+condition.
+
+Joins drop the right keys from their rows, so the fields the new joins
+give can differ from those of the written ones: the new joins keep the
+tables and keys of the written ones, from which the planner puts them
+back.
+"""
+from .sql.ast import *
+from .skan_ast import post_condition, post_join
+from .pushdown import conjuncts, database
+from .plan import estimate_rows
+
+
+__all__ = ("reorder_joins", )
+
+
+# selectivity of a condition nothing is known about
+GUESS = 1 / 3
+
+# inputs up to which every left-deep order is costed; beyond, the inputs
+# are added greedily, the one giving the fewest rows first
+EXHAUSTIVE = 10
+
+
+def reorder_joins(ast):
+    """join the inner joined inputs of the FROM of ast in the cheapest
+    order found, moving conditions of its WHERE that join them to ON"""
+    source = ast.source
+    if not isinstance(source, JoinCursor) or database(source) is not None:
+        # joined by one database, which orders them itself
+        return
+    if computed_keys(source):
+        return
+    inputs, conds = [], []
+    flatten(source, inputs, conds)
+    if len(inputs) < 2:
+        return
+    written = layout(source)
+    moved = joining(ast, inputs)
+    conds += moved
+    order = list(range(len(inputs)))
+    rows = [estimate_rows(i) for i in inputs]
+    if None not in rows:
+        preds = predicates(conds, inputs, rows)
+        rows = [r * GUESS ** sum(1 for m, _, _ in preds if m == 1 << i) for i, r in enumerate(rows)]
+        best = best_order(rows, preds)
+        if cost(best, rows, preds) < cost(order, rows, preds):
+            order = best
+    if order == list(range(len(inputs))) and not moved:
+        return
+    ast.source = rebuild([inputs[i] for i in order], conds, inputs)
+    ast.source.written = written
+
+
+def computed_keys(source):
+    """some join of source has a key that is an expression"""
+    if not isinstance(source, JoinCursor):
+        return False
+    keys = getattr(source.join, 'keys', None) or ()
+    if not all(isinstance(k, Column) for ks in keys for k in ks):
+        return True
+    return computed_keys(source.source1) or computed_keys(source.source2)
+
+
+def inner(source):
+    return isinstance(source, JoinCursor) and source.query is None and (
+        source.jointype == Join.UNION
+        or (source.jointype == Join.INNER and isinstance(source.join, JoinCondition)))
+
+
+def flatten(source, inputs, conds):
+    """inputs of the run of inner and cross joins source, and the
+    conjuncts of their ON"""
+    if not inner(source) or database(source) is not None:
+        # tables of one database stay together, for it to join them
+        inputs.append(source)
+        return
+    flatten(source.source1, inputs, conds)
+    flatten(source.source2, inputs, conds)
+    if source.jointype != Join.UNION:
+        conds.extend(conjuncts(source.join.cond))
+
+
+def layout(source):
+    """the tables of source and, for each join, the right keys it drops"""
+    if not isinstance(source, JoinCursor):
+        return source
+    # outer joins keep the right keys, NULL for rows without a match
+    keys = getattr(source.join, 'keys', None) if source.jointype in (Join.INNER, Join.RIGHT) else None
+    return layout(source.source1), layout(source.source2), list(keys[1]) if keys else []
+
+
+def joining(ast, inputs):
+    """take the conjuncts of the WHERE of ast that read columns of several
+    inputs, and nothing else, out of it"""
+    if ast.selector is None:
+        return []
+    tables = [source_tables(i) for i in inputs]
+    keep, moved = [], []
+    for cond in conjuncts(ast.selector.cond):
+        read = tables_read(cond)
+        if not has_values(cond) and read and sum(1 for t in tables if t & read) > 1 \
+                and read <= set().union(*tables):
+            moved.append(cond)
+        else:
+            keep.append(cond)
+    if moved:
+        if keep:
+            ast.selector.cond = conjunction(keep)
+        else:
+            ast.selector = None
+    return moved
+
+
+@Walker
+def _values(tree, collect, stop, **kw):
+    if isinstance(tree, (Var, Shared, AggregateFunc, Exists, InSubquery)):
+        collect(tree)
+        stop()
+
+
+def has_values(cond):
+    """cond reads fields besides columns: select list values or aggregates"""
+    return bool(_values.collect(cond))
+
+
+def predicates(conds, inputs, rows):
+    """mask of the inputs, selectivity and equality flag of each condition"""
+    tables = [source_tables(i) for i in inputs]
+    r = []
+    for cond in conds:
+        read = tables_read(cond)
+        mask = sum(1 << i for i, t in enumerate(tables) if t & read)
+        sel, eq = GUESS, False
+        if isinstance(cond, CompareExpr) and cond.op == '==':
+            l, r_ = tables_read(cond.arg1), tables_read(cond.arg2)
+            li = [i for i, t in enumerate(tables) if t & l]
+            ri = [i for i, t in enumerate(tables) if t & r_]
+            if len(li) == 1 and len(ri) == 1 and li != ri:
+                eq = True
+                sel = 1 / max(min(rows[li[0]], rows[ri[0]]), 1)
+                ndv = [distinct_values(unbraced(a)) for a in (cond.arg1, cond.arg2)]
+                if None not in ndv:
+                    sel = 1 / max(max(ndv), 1)
+        r.append((mask, sel, eq))
+    return r
+
+
+def distinct_values(expr):
+    """estimated number of distinct values of a column, None when unknown"""
+    if isinstance(expr, Column) and isinstance(expr.table, Table) and expr.table.view is not None:
+        return expr.table.view.distinct_values(expr.column)
+
+
+def join_rows(rows, mask, j, inputs, preds):
+    """rows of joining the rows of the inputs mask to input j"""
+    both = mask | 1 << j
+    eqs, others = [], 0
+    for m, sel, eq in preds:
+        if m & 1 << j and m & mask and not m & ~both:
+            if eq:
+                eqs.append(sel)
+            else:
+                others += 1
+    sel = (min(eqs) if eqs else 1) * GUESS ** others
+    return max(rows * inputs[j] * sel, 1)
+
+
+def cost(order, rows, preds):
+    """rows held in memory and produced before the last join, joining the
+    inputs in order"""
+    mask, n, total = 1 << order[0], rows[order[0]], 0
+    for k, j in enumerate(order[1:], 1):
+        n = join_rows(n, mask, j, rows, preds)
+        mask |= 1 << j
+        total += rows[j] + (n if k < len(order) - 1 else 0)
+    return total
+
+
+def best_order(rows, preds):
+    """left-deep order of the inputs of cheapest cost"""
+    n = len(rows)
+    if n > EXHAUSTIVE:
+        return greedy_order(rows, preds)
+    full = (1 << n) - 1
+    best = {1 << i: (0, rows[i], [i]) for i in range(n)}
+    for _ in range(n - 1):
+        step = {}
+        for mask, (c, r, order) in best.items():
+            for j in range(n):
+                if mask & 1 << j:
+                    continue
+                nr = join_rows(r, mask, j, rows, preds)
+                m = mask | 1 << j
+                nc = c + rows[j] + (nr if m != full else 0)
+                if m not in step or nc < step[m][0]:
+                    step[m] = nc, nr, order + [j]
+        best = step
+    return best[full][2]
+
+
+def greedy_order(rows, preds):
+    order = [min(range(len(rows)), key=lambda i: rows[i])]
+    mask, n = 1 << order[0], rows[order[0]]
+    while len(order) < len(rows):
+        j = min((j for j in range(len(rows)) if not mask & 1 << j),
+                key=lambda j: join_rows(n, mask, j, rows, preds))
+        n = join_rows(n, mask, j, rows, preds)
+        mask |= 1 << j
+        order.append(j)
+    return order
+
+
+def rebuild(order, conds, inputs):
+    """left-deep joins of the inputs in order, each condition on the first
+    join that has the inputs it reads"""
+    tables = {id(i): source_tables(i) for i in inputs}
+    pending = list(conds)
+    source, have = order[0], set(tables[id(order[0])])
+    for item in order[1:]:
+        have |= tables[id(item)]
+        on = [c for c in pending if tables_read(c) <= have]
+        pending = [c for c in pending if not tables_read(c) <= have]
+        if on:
+            cursor = JoinCursor(source, item, Join.INNER, JoinCondition(conjunction(on)))
+            post_condition(cursor.join, [], context=cursor)
+            post_join(cursor, [])
+        else:
+            cursor = JoinCursor(source, item, Join.UNION)
+        source = cursor
+    return source
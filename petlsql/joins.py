@@ -0,0 +1,289 @@
+"""
+Joins that hold one side in memory.
+
+The rows of the build side are read into an index, then the rows of the
+probe side are streamed past it, unsorted, each joined with the build rows
+the index finds for it. A hash index finds the rows with equal keys, a
+band index the rows whose bounds hold the value of the probe row, and a
+scan index, for conditions with neither, all of them. A residual
+condition, evaluated on the left fields followed by the right ones, then
+decides which candidates match.
+
+The rows are those of etl.join and its outer variants: left fields, then
+the right fields but its keys; keys match NULL with NULL; a row without a
+left side takes the keys of its right one. The side kept by an outer join
+may be either the build or the probe side, the build rows nothing matched
+come out after the others.
+
+Semi and anti joins, for EXISTS and IN (subquery), keep the rows of the
+probe side that have (have no) matching rows in the build side, the rows
+of a subquery read once per execution into a set of keys.
+"""
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+import petl as etl
+
+from .sql.ast import Join
+
+
+__all__ = ("JoinView", "HashIndex", "BandIndex", "ScanIndex", "SemiJoinView")
+
+
+def getter(positions):
+    """function of a row returning the values at positions as a tuple"""
+    if not positions:
+        return lambda row: ()
+    if len(positions) == 1:
+        p = positions[0]
+        return lambda row: (row[p],)
+    return itemgetter(*positions)
+
+
+class HashIndex:
+    """build rows by the values of their fields keys"""
+    def __init__(self, key, probe_key):
+        self.key = key
+        self.probe_key = probe_key
+
+    def build(self, rows, header, probe_header):
+        get = getter([header.index(k) for k in self.key])
+        table = {}
+        for i, row in enumerate(rows):
+            table.setdefault(get(row), []).append(i)
+        self.table = table
+        self.get = getter([probe_header.index(k) for k in self.probe_key])
+
+    def match(self, row):
+        return self.table.get(self.get(row), ())
+
+
+class BandIndex:
+    """build rows by the bounds lower(row) <= value and value <= upper(row)
+    the value value(row) of a probe row must be within; either bound may be
+    missing. Rows with a NULL bound match nothing"""
+    def __init__(self, value, lower=None, upper=None):
+        self.value = value
+        self.lower = lower
+        self.upper = upper
+
+    def build(self, rows, header, probe_header):
+        lower, upper = self.lower, self.upper
+        entries = []
+        for i, row in enumerate(rows):
+            lo = lower(row) if lower is not None else None
+            hi = upper(row) if upper is not None else None
+            if (lower is not None and lo is None) or (upper is not None and hi is None):
+                continue
+            entries.append((lo, hi, i))
+        if lower is not None:
+            entries.sort(key=itemgetter(0))
+            self.bounds = [e[0] for e in entries]
+        else:
+            entries.sort(key=itemgetter(1))
+            self.bounds = [e[1] for e in entries]
+        self.rows = [e[2] for e in entries]
+        if lower is not None and upper is not None:
+            # highest upper bound of the rows up to each one: scanning back
+            # from the last lower bound below a value stops where it is
+            # below the value
+            reach = []
+            top = None
+            for _, hi, _ in entries:
+                top = hi if top is None or hi > top else top
+                reach.append(top)
+            self.uppers = [e[1] for e in entries]
+            self.reach = reach
+
+    def match(self, row):
+        v = self.value(row)
+        if v is None:
+            return ()
+        if self.lower is None:
+            return self.rows[bisect_left(self.bounds, v):]
+        end = bisect_right(self.bounds, v)
+        if self.upper is None:
+            return self.rows[:end]
+        r = []
+        reach, uppers, rows = self.reach, self.uppers, self.rows
+        j = end - 1
+        while j >= 0 and reach[j] >= v:
+            if uppers[j] >= v:
+                r.append(rows[j])
+            j -= 1
+        r.reverse()
+        return r
+
+
+class ScanIndex:
+    """all the build rows, for conditions that can only be tested"""
+    def build(self, rows, header, probe_header):
+        self.all = range(len(rows))
+
+    def match(self, row):
+        return self.all
+
+
+class JoinView(etl.Table):
+    """rows of the join of left and right, the build side ('left' or
+    'right') held in index"""
+    def __init__(self, left, right, join, index, build='right', lkey=(), rkey=(),
+                 residual=None, missing=None):
+        self.left = left
+        self.right = right
+        self.join = join
+        self.index = index
+        self.build = build
+        self.lkey = tuple(lkey)
+        self.rkey = tuple(rkey)
+        self.residual = residual
+        self.missing = missing
+
+    def __iter__(self):
+        lit, rit = iter(self.left), iter(self.right)
+        lheader, rheader = next(lit, None), next(rit, None)
+        if lheader is None or rheader is None:
+            # a side without even a header, as an empty csv file: no rows
+            yield tuple(lheader or ()) + tuple(f for f in rheader or () if f not in self.rkey)
+            return
+        lheader, rheader = tuple(lheader), tuple(rheader)
+        rkeep = [i for i, f in enumerate(rheader) if f not in self.rkey]
+        yield lheader + tuple(rheader[i] for i in rkeep)
+        project = None if len(rkeep) == len(rheader) else getter(rkeep)
+        missing = self.missing
+        lmissing = (missing,) * len(lheader)
+        rmissing = (missing,) * len(rkeep)
+        # rows with no left side take the keys of the right one
+        lpositions = [lheader.index(k) for k in self.lkey]
+        rpositions = [rheader.index(k) for k in self.rkey]
+
+        def lpad(r):
+            row = list(lmissing)
+            for lp, rp in zip(lpositions, rpositions):
+                row[lp] = r[rp]
+            return tuple(row) + (project(r) if project else r)
+
+        def rpad(l):
+            return l + rmissing
+
+        def joined(l, r):
+            return l + (project(r) if project else r)
+
+        if self.build == 'left':
+            build, bheader, probe, pheader = lit, lheader, rit, rheader
+        else:
+            build, bheader, probe, pheader = rit, rheader, lit, lheader
+        rows = [tuple(row) for row in build]
+        index = self.index
+        index.build(rows, bheader, pheader)
+        join, residual = self.join, self.residual
+        left_kept = join in (Join.LEFT, Join.FULL)
+        right_kept = join in (Join.RIGHT, Join.FULL)
+        if self.build == 'left':
+            build_kept, probe_pad = left_kept, (lpad if right_kept else None)
+            build_pad = rpad
+        else:
+            build_kept, probe_pad = right_kept, (rpad if left_kept else None)
+            build_pad = lpad
+        matched = bytearray(len(rows)) if build_kept else None
+        match = index.match
+        if residual is None and matched is None and self.build == 'right':
+            # inner and left joins on keys only, the usual case
+            if project is not None:
+                rows = [project(r) for r in rows]
+            for p in probe:
+                p = tuple(p)
+                found = match(p)
+                if found:
+                    for i in found:
+                        yield p + rows[i]
+                elif probe_pad is not None:
+                    yield p + rmissing
+            return
+        for p in probe:
+            p = tuple(p)
+            found = False
+            for i in match(p):
+                b = rows[i]
+                l, r = (b, p) if self.build == 'left' else (p, b)
+                if residual is not None and not residual(l + r):
+                    continue
+                found = True
+                if matched is not None:
+                    matched[i] = 1
+                yield joined(l, r)
+            if not found and probe_pad is not None:
+                yield probe_pad(p)
+        if matched is not None:
+            for i, b in enumerate(rows):
+                if not matched[i]:
+                    yield build_pad(b)
+
+
+class SemiJoinView(etl.Table):
+    """rows of source that have (anti: have no) matching rows in sub, the
+    values keys(row) of a row equal to the fields fields of its matches;
+    a residual condition, evaluated on the source fields followed by the
+    sub ones, then decides which candidates match. With strict, a row whose
+    first key is NULL matches nothing and is dropped either way"""
+    def __init__(self, source, sub, keys=(), fields=(), anti=False, residual=None, strict=False):
+        self.source = source
+        self.sub = sub
+        self.keys = keys
+        self.fields = tuple(fields)
+        self.anti = anti
+        self.residual = residual
+        self.strict = strict
+
+    def __iter__(self):
+        it, sit = iter(self.source), iter(self.sub)
+        header = next(it, None)
+        if header is None:
+            return
+        yield tuple(header)
+        sheader = next(sit, None)
+        anti, residual = self.anti, self.residual
+        keys = self.keys
+        strict = self.strict
+        if sheader is None:
+            # a subquery without even a header has no rows to match
+            if anti:
+                for row in it:
+                    if not (strict and keys and keys[0](row) is None):
+                        yield row
+            return
+        sheader = tuple(sheader)
+        if not keys and residual is None:
+            # uncorrelated EXISTS: one row of the subquery decides
+            if (next(sit, None) is None) == anti:
+                yield from it
+            return
+        get = getter([sheader.index(k) for k in self.fields])
+        if len(keys) == 1:
+            k0 = keys[0]
+
+            def key(row):
+                return (k0(row),)
+        else:
+            def key(row):
+                return tuple(k(row) for k in keys)
+        if residual is None:
+            found = {get(row) for row in sit}
+            for row in it:
+                k = key(row)
+                if strict and k[0] is None:
+                    continue
+                if (k in found) != anti:
+                    yield row
+            return
+        table = {}
+        for row in sit:
+            row = tuple(row)
+            table.setdefault(get(row), []).append(row)
+        for row in it:
+            k = key(row)
+            if strict and k[0] is None:
+                continue
+            p = tuple(row)
+            if any(residual(p + s) for s in table.get(k, ())) != anti:
+                yield row
@@ -0,0 +1,225 @@
+"""
+GROUP BY spread over a pool of worker processes.
+
+The parent reads the rows and sends them to the workers in batches. A
+batch travels as a tuple of columns, which pickles smaller than a list of
+rows. Each worker runs the first phase of the aggregation over its batch
+and splits the states of its groups into one partition per worker by a
+hash of the key that is the same in every process. The parent only keeps
+the pieces of every partition, pickled by the workers so it never loads
+them, and sends them back to be merged: a partition with many pieces into
+one, then each partition into its final groups, by a worker of its own.
+Inputs shorter than MIN_ROWS are aggregated in the parent.
+"""
+import zlib
+import pickle
+import inspect
+import numbers
+import importlib
+from functools import partial
+from itertools import chain, islice
+from operator import itemgetter
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import petl as etl
+
+from .run import *
+
+
+__all__ = ("parallel_aggregate_execute", "portable", "rebuild", "MIN_ROWS", "BATCH_ROWS")
+
+
+# rows read before deciding to use the workers
+MIN_ROWS = 50000
+# rows sent to a worker at a time: the fewer, the more of the states of
+# groups with many keys travel back
+BATCH_ROWS = 50000
+# pieces of a partition merged into one before there are more
+MERGE_PIECES = 8
+
+
+def portable(step, module):
+    """what rebuilds step in a worker process: its source, the globals it
+    reads and the modules it imports, or None when some global does not
+    pickle (functions compiled for CASE expressions, for example)"""
+    env = {}
+    modules = {}
+    for name in step.__code__.co_names:
+        if name not in module or name == '__builtins__':
+            continue
+        value = module[name]
+        if inspect.ismodule(value):
+            modules[name] = value.__name__
+            continue
+        try:
+            pickle.dumps(value)
+        except Exception:
+            return
+        env[name] = value
+    return step.src, env, modules
+
+
+# functions compiled in this worker, by signature and source
+_steps = {}
+
+
+def rebuild(code, signature="step(states, rec, params=None)"):
+    """the function of signature whose body code, returned by portable, is
+    the source of, compiled once per worker"""
+    src, env, modules = code
+    step = _steps.get((signature, src))
+    if step is None:
+        g = dict(env)
+        for name, module in modules.items():
+            g[name] = importlib.import_module(module)
+        exec("def {}:\n    {}".format(signature, src), g)
+        step = _steps[signature, src] = g[signature.split('(', 1)[0]]
+    return step
+
+
+def partition(key, n):
+    """partition of the group key out of n, the same in every process: the
+    hash of str and bytes changes with the process (unless PYTHONHASHSEED
+    is set), numbers hash alike everywhere, other values by their repr"""
+    return stable_hash(key) % n
+
+
+def stable_hash(value):
+    if isinstance(value, tuple):
+        return hash(tuple(map(stable_hash, value)))
+    if isinstance(value, str):
+        return zlib.crc32(value.encode('utf-8', 'surrogatepass'))
+    if isinstance(value, bytes):
+        return zlib.crc32(value)
+    if value is None:
+        return 0
+    if isinstance(value, numbers.Number):
+        return hash(value)
+    return zlib.crc32(repr(value).encode('utf-8', 'surrogatepass'))
+
+
+def dump_pieces(groups, n):
+    """groups split into n partitions, each pickled, None when empty"""
+    parts = [{} for _ in range(n)]
+    for key, states in groups.items():
+        parts[partition(key, n)][key] = states
+    return [pickle.dumps(dump_partial(part), pickle.HIGHEST_PROTOCOL) if part else None for part in parts]
+
+
+def load_pieces(pieces, factories):
+    return merge_partials(load_partial(pickle.loads(piece), factories) for piece in pieces)
+
+
+def aggregate_batch(code, factories, keys, columns, partitions, params=None):
+    """first phase of the aggregation of a batch, in a worker: the pieces
+    of its groups of every partition"""
+    step = rebuild(code)
+    if params:
+        step = partial(step, params=params)
+    groups = partial_aggregate(zip(*columns), itemgetter(*keys), factories, step)
+    return dump_pieces(groups, partitions)
+
+
+def merge_pieces(factories, pieces):
+    """the pieces of a partition merged into one, in a worker"""
+    return dump_pieces(load_pieces(pieces, factories), 1)[0]
+
+
+def finish_partition(factories, pieces, single):
+    """rows of the groups of the pieces of a partition, in a worker"""
+    return list(final_aggregate(load_pieces(pieces, factories), single))
+
+
+class ParallelAggregateView(etl.Table):
+    """hash aggregation run by a process pool, each worker finishing the
+    groups of a partition of the keys"""
+    def __init__(self, source, key, header, aggregates, step, code, pool, workers, params=None):
+        self.source = source
+        self.key = key
+        self.header = tuple(header)
+        self.aggregates = aggregates
+        self.step = step
+        self.code = code
+        self.pool = pool
+        self.workers = workers
+        self.params = params
+
+    def __iter__(self):
+        yield self.header
+        it = iter(self.source)
+        try:
+            fields = list(next(it))
+        except StopIteration:
+            return
+        keys = [fields.index(k) for k in self.key]
+        getkey = itemgetter(*keys)
+        single = len(keys) == 1
+        head = list(islice(it, MIN_ROWS))
+        if len(head) < MIN_ROWS:
+            # too few rows to pay for the workers
+            groups = partial_aggregate(head, getkey, self.aggregates, self.step)
+            yield from final_aggregate(groups, single)
+            return
+        pool = self.pool()
+        pending = {}
+        try:
+            pieces = self.pieces(pool, pending, chain(head, it), keys, len(fields))
+            for p, part in enumerate(pieces):
+                if part:
+                    pending[pool.submit(finish_partition, self.aggregates, part, single)] = p
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    yield from future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def pieces(self, pool, pending, rows, keys, width):
+        """the pieces of the groups of rows of every partition, aggregated
+        batch by batch by the workers; pending holds the tasks in flight"""
+        n = self.workers
+        pieces = [[] for _ in range(n)]
+
+        def add(p, piece):
+            part = pieces[p]
+            part.append(piece)
+            if len(part) >= MERGE_PIECES:
+                pending[pool.submit(merge_pieces, self.aggregates, part)] = p
+                pieces[p] = []
+
+        def collect():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                p = pending.pop(future)
+                if p is None:
+                    for p, piece in enumerate(future.result()):
+                        if piece is not None:
+                            add(p, piece)
+                else:
+                    add(p, future.result())
+
+        while True:
+            batch = list(islice(rows, BATCH_ROWS))
+            if not batch:
+                break
+            if len(pending) >= 2 * n:
+                # bound the batches in flight
+                collect()
+            # zip(*batch) unpacks a call of as many arguments as rows, much
+            # slower than reading each column out of the rows
+            columns = tuple(list(map(itemgetter(i), batch)) for i in range(width))
+            future = pool.submit(aggregate_batch, self.code, self.aggregates, keys, columns, n, self.params)
+            pending[future] = None
+        while pending:
+            collect()
+        return pieces
+
+
+def parallel_aggregate_execute(c, key, header, aggregates, step, code, pool, workers, params=None, **kwargs):
+    r = c(params=params)
+    if 'addfields' in kwargs:
+        r = etl.addfields(r, bind_fields(kwargs['addfields'], params))
+    return ParallelAggregateView(r, key, header, aggregates, bind_params(step, params),
+                                 code, pool, workers, params)
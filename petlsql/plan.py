@@ -1,8 +1,77 @@
 from functools import singledispatch, partial
+from operator import itemgetter
 from collections import OrderedDict
 from .run import *
 from .sql.ast import *
-from .compile_ast import compile_ast
+from .compile_ast import compile_ast, compile_aggregates
+from . import is_mergeable
+from .parallel import parallel_aggregate_execute, portable, MIN_ROWS
+from .pushdown import group_query
+
+
+class Schema:
+    """ordered field names of the rows a plan step produces
+
+    Used as the planner's header: it answers membership like the set it
+    replaces and gives the position of a field, so compiled expressions
+    can index rows instead of looking fields up by name.
+    """
+    def __init__(self, fields=()):
+        self._positions = {}
+        # names the rows lack that read another field of the same values:
+        # the right keys a join drops, read from the left keys they equal
+        self._aliases = {}
+        self.update(fields)
+
+    def add(self, name):
+        if name not in self._positions:
+            self._positions[name] = len(self._positions)
+
+    def update(self, names):
+        for name in names:
+            self.add(name)
+        if isinstance(names, Schema):
+            self.update_aliases(names)
+
+    def alias(self, name, field):
+        if name not in self._positions:
+            self._aliases[name] = field
+
+    def update_aliases(self, other):
+        """read the names other reads from its fields the same way"""
+        for name, field in other._aliases.items():
+            self.alias(name, field)
+
+    def clear(self):
+        self._positions.clear()
+        self._aliases.clear()
+
+    def field(self, name):
+        """field of the rows name reads: itself or the field its alias is"""
+        for _ in range(len(self._aliases)):
+            if name in self._positions or name not in self._aliases:
+                break
+            name = self._aliases[name]
+        return name
+
+    def position(self, name):
+        return self._positions.get(self.field(name))
+
+    @property
+    def fields(self):
+        return list(self._positions)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __repr__(self):
+        return "Schema<{}>".format(', '.join(map(str, self._positions)))
 
 
 @singledispatch
@@ -11,6 +80,18 @@ def plan(ast, f=None, **kwargs):
     return f
 
 
+def scan_columns(table):
+    """fields of table a statement reads, in their order in the source, or
+    None when it reads them all or the source can only be read whole"""
+    if not table.view.project:
+        return
+    used = {str(c.column) for c in table.use.values()}
+    columns = [c for c in table.columns if c in used]
+    if len(columns) < len(table.columns):
+        # with no field used (count(*)), rows are still counted
+        return columns or list(table.columns[:1])
+
+
 @plan.register(Table)
 def _(ast, db, header, **kwargs):
     # print("***2", db, kwargs)
@@ -19,31 +100,258 @@ def _(ast, db, header, **kwargs):
     if ast.rownumber:
         name = ast.rownumber.alias
         attrs['row_number'] = name
+        fields[name] = name
         header.add(name)
     for k, c in ast.use.items():
         name = str(c.alias or k)
         fields[name] = str(c.column)
         header.add(name)
+    columns = scan_columns(ast)
+    if columns is not None:
+        attrs['columns'] = columns
+    if ast.pushed is not None:
+        attrs['where'] = ast.pushed
+    parallel = parallel_scan(db, ast)
+    if parallel is not None:
+        attrs['parallel'] = parallel
+    if ast.view.blocking:
+        attrs.update(read_ahead(db))
     return partial(table_execute, ast.view, **attrs)
 
 
+def read_ahead(db):
+    """arguments of the read of a database or file source by a thread
+    ahead of the statement, none when db reads them as they are pulled"""
+    return dict(prefetch=db.prefetch) if db.prefetch else {}
+
+
+def parallel_scan(db, table):
+    """arguments of the read of table by the worker processes of db, None
+    when it is read by the process running the statement"""
+    if not isinstance(table, Table) or table.view is None or table.view.scan is None:
+        return
+    if db.workers > 1 and table.pushed is None:
+        # row numbers follow the order of the rows
+        return dict(pool=db.process_pool, workers=db.workers, ordered=db.ordered_scan or bool(table.rownumber))
+
+
 @plan.register(JoinCursor)
-def _(ast, **kwargs):
-    c1, c2 = plan(ast.source1, **kwargs), plan(ast.source2, **kwargs)
+def _(ast, header, **kwargs):
+    f = plan_join(ast, header, **kwargs)
+    if ast.written is None:
+        return f
+    # reordered: the fields of the joins as written, in their order, a key
+    # the new joins dropped read from the one it equals
+    fields = written_fields(ast.written)
+    if list(header) == fields:
+        return f
+    equal = {}
+    dropped_keys(ast, equal)
+    if all(name in header for name in fields):
+        f = partial(cut_execute, f, fields=fields)
+    else:
+        f = partial(fieldmap_execute, f, fieldmap=OrderedDict(
+            (name, name if name in header else equal[name]) for name in fields))
+    header.clear()
+    header.update(fields)
+    for name, key in equal.items():
+        header.alias(name, key)
+    return f
+
+
+def written_fields(written):
+    """fields of the rows of the joins as written: the tables and the
+    right keys each join drops"""
+    if isinstance(written, Table):
+        r = [written.rownumber.alias] if written.rownumber else []
+        return r + [str(c.alias or k) for k, c in written.use.items()]
+    left, right, rkeys = written
+    dropped = {k.name for k in rkeys}
+    return written_fields(left) + [f for f in written_fields(right) if f not in dropped]
+
+
+def dropped_keys(source, equal):
+    """right keys of the joins of source, by name, and the left keys they
+    equal"""
+    if not isinstance(source, JoinCursor):
+        return
+    keys = getattr(source.join, 'keys', None) if source.jointype in (Join.INNER, Join.RIGHT) else None
+    for lk, rk in zip(*keys or ((), ())):
+        equal[rk.name] = lk.name
+    dropped_keys(source.source1, equal)
+    dropped_keys(source.source2, equal)
+
+
+def plan_join(ast, header, **kwargs):
+    if ast.query is not None:
+        # joined by the database of its tables
+        header.update(ast.query.names)
+        equal = {}
+        dropped_keys(ast, equal)
+        for name, key in equal.items():
+            header.alias(name, key)
+        return partial(query_execute, ast.query, **read_ahead(kwargs['db']))
+    # each side is planned against its own rows
+    left, right = Schema(), Schema()
+    c1, c2 = plan(ast.source1, header=left, **kwargs), plan(ast.source2, header=right, **kwargs)
     args = {}
     if ast.deps:
         # print("plan JoinCursor:", ast.deps, kwargs["header"])
         ldeps, rdeps = ast.deps
-        lvars = compile_vars(ldeps, **kwargs)
+        lvars = compile_vars(ldeps, header=left, **kwargs)
         if lvars:
             args['addLfields'] = lvars
-        rvars = compile_vars(rdeps, **kwargs)
+        rvars = compile_vars(rdeps, header=right, **kwargs)
         if rvars:
             args['addRfields'] = rvars
-    if ast.jointype != Join.UNION:
-        args.update(plan(ast.join, **kwargs))
-    # print ("join:", args, kwargs["header"])
-    return partial(join_execute, c1, c2, ast.jointype, **args)
+    if ast.jointype == Join.UNION:
+        header.update(left)
+        header.update(right)
+        return partial(join_execute, c1, c2, ast.jointype, **args)
+    keys = plan(ast.join, header=header, **kwargs)
+    lkey, rkey = keys['lkey'], keys['rkey']
+    lfilters, rfilters = getattr(ast.join, 'filters', ((), ()))
+    # conditions of ON on the rows of one side select them before the join
+    if lfilters:
+        c1 = partial(select_execute, c1, selector=compile_ast(conjunction(lfilters), header=left, **kwargs))
+    if rfilters:
+        c2 = partial(select_execute, c2, selector=compile_ast(conjunction(rfilters), header=right, **kwargs))
+    residual = conjunction(getattr(ast.join, 'residual', ()))
+    build = build_side(estimate_rows(ast.source1), estimate_rows(ast.source2))
+    if not lkey:
+        # no equal keys: a band join on a range of values, or a nested loop
+        both = Schema(list(left) + list(right))
+        band = band_bounds(ast.join.residual, ast, build)
+        if band is None:
+            band = band_bounds(ast.join.residual, ast, 'left' if build == 'right' else 'right')
+        if band is not None:
+            build, value, lower, upper = band
+            probe, bounds = (right, left) if build == 'left' else (left, right)
+            args['value'] = compile_ast(value, header=probe, **kwargs)
+            for name, bound in (('lower', lower), ('upper', upper)):
+                if bound is not None:
+                    args[name] = compile_ast(bound, header=bounds, **kwargs)
+        header.update(both)
+        header.update_aliases(left)
+        header.update_aliases(right)
+        if residual is not None:
+            args['residual'] = compile_ast(residual, header=both, **kwargs)
+        return partial(band_join_execute, c1, c2, ast.jointype, build=build, **args)
+    # petl joins keep the left fields, then the right ones except the keys
+    header.update(left)
+    presorted = sorted_by(ast.source1, lkey) and sorted_by(ast.source2, rkey)
+    if ast.jointype in (Join.LEFT, Join.FULL):
+        # the right keys of a left row without a match are NULL, not its
+        # keys: the join is on copies of them, and the keys are kept
+        copies = ["{}@key".format(name) for name in rkey]
+        # fields added to the rows are computed from the rows as read
+        added = dict(args.get('addRfields', ()))
+        args['addRfields'] = args.get('addRfields', []) + [
+            (copy, added.get(name) or itemgetter(right.position(name))) for copy, name in zip(copies, rkey)]
+        right.update(copies)
+        keys = dict(keys, rkey=copies)
+        header.update(name for name in right if name not in copies)
+        header.update_aliases(right)
+    else:
+        # the right keys equal the left ones, which hold those of a right
+        # row without a match
+        header.update(name for name in right if name not in rkey)
+        header.update_aliases(right)
+        for lname, rname in zip(lkey, rkey):
+            header.alias(rname, lname)
+    args.update(keys)
+    if residual is None:
+        if merge_join(kwargs['db'], presorted, estimate_rows(ast.source1), estimate_rows(ast.source2)):
+            if presorted:
+                args['presorted'] = True
+            return partial(join_execute, c1, c2, ast.jointype, **args)
+    else:
+        args['residual'] = compile_ast(residual, header=Schema(list(left) + list(right)), **kwargs)
+    return partial(hash_join_execute, c1, c2, ast.jointype, build=build, **args)
+
+
+# rows of the smaller side of a join above which it is not held in memory
+# but both sides are sorted, spilling to disk, and merged
+HASH_JOIN_ROWS = 5000000
+
+
+def estimate_rows(source):
+    """estimated number of rows of a FROM item, None when unknown"""
+    if isinstance(source, Table):
+        return source.view.estimate() if source.view is not None else None
+    if isinstance(source, JoinCursor):
+        left, right = estimate_rows(source.source1), estimate_rows(source.source2)
+        if left is None or right is None:
+            return
+        return left * right if source.jointype == Join.UNION else max(left, right)
+
+
+def build_side(left, right):
+    """side of a join to hold in memory: the smaller one, the right side
+    when unknown"""
+    if left is not None and right is not None and left < right:
+        return 'left'
+    return 'right'
+
+
+def merge_join(db, presorted, left, right):
+    """join by sort-merge instead of hashing"""
+    if db.join_method != 'auto':
+        return db.join_method == 'merge'
+    if presorted:
+        return True
+    return left is not None and right is not None and min(left, right) > HASH_JOIN_ROWS
+
+
+def sorted_by(source, keys):
+    """the rows of source come sorted by the fields keys, in this order"""
+    if not isinstance(source, Table) or source.view is None:
+        return False
+    order = getattr(source.view, 'sortedby', ())
+    columns = {str(c.alias or k): str(c.column) for k, c in source.use.items()}
+    return all(k in columns for k in keys) and [columns[k] for k in keys] == list(order[:len(keys)])
+
+
+_lower = {'>': True, '>=': True, '<': False, '<=': False}
+
+
+def band_bounds(conds, ast, build):
+    """build, value, lower, upper: the expressions of a band join holding
+    side build in memory, lower <= value <= upper with value read from the
+    other side, from the conditions conds; None when they have none"""
+    if build == 'left':
+        bside, pside = source_tables(ast.source1), source_tables(ast.source2)
+    else:
+        bside, pside = source_tables(ast.source2), source_tables(ast.source1)
+
+    def reads(node, side):
+        tables = tables_read(node)
+        return tables and tables <= side
+
+    value = lower = upper = None
+    for cond in conds:
+        bounds = []
+        if isinstance(cond, BetweenExpr) and cond.is_true and not cond.symmetric:
+            x, lo, hi = cond.args
+            if reads(x, pside) and reads(lo, bside) and reads(hi, bside):
+                bounds = [(x, lo, True), (x, hi, False)]
+        elif isinstance(cond, CompareExpr) and cond.op in _lower:
+            a, b, is_lower = cond.arg1, cond.arg2, _lower[cond.op]
+            if reads(a, pside) and reads(b, bside):
+                bounds = [(a, b, is_lower)]
+            elif reads(a, bside) and reads(b, pside):
+                bounds = [(b, a, not is_lower)]
+        for x, bound, is_lower in bounds:
+            if value is None:
+                value = x
+            elif str(x) != str(value):
+                continue
+            if is_lower and lower is None:
+                lower = bound
+            elif not is_lower and upper is None:
+                upper = bound
+    if value is not None:
+        return build, value, lower, upper
 
 
 @plan.register(JoinUsing)
@@ -54,26 +362,40 @@ def _(ast, **kwargs):
 
 @plan.register(JoinCondition)
 def _(ast, **kwargs):
-    if ast.keys:
-        lkey, rkey = ast.keys
-        return dict(lkey=[k.name for k in lkey], rkey=[k.name for k in rkey])
+    lkey, rkey = ast.keys
+    return dict(lkey=[k.name for k in lkey], rkey=[k.name for k in rkey])
 
 
 @plan.register(WhereAst)
 def _(ast, f, **kwargs):
-    fselect = compile_ast(ast, **kwargs)
-    # print("select:", fselect)
-    args = dict(selector=fselect)
+    args = {}
     if ast.deps:
         # print("plan Where:", ast.deps)
         vs = compile_vars(ast.deps, **kwargs)
         if vs:
             args['addfields'] = vs
+    # the condition reads the fields added for it
+    args['selector'] = compile_ast(ast, **kwargs)
+    # print("select:", args['selector'])
     # print("sel:", args, kwargs['header'])
     f = partial(select_execute, f, **args)
     return f
 
 
+@plan.register(SemiJoin)
+def _(ast, f, header, **kwargs):
+    args = dict(anti=ast.anti, strict=ast.strict)
+    okeys, ikeys = ast.keys
+    if okeys:
+        args['keys'] = [compile_ast(k, header=header, **kwargs) for k in okeys]
+        args['fields'] = ikeys
+    if ast.residual:
+        # the statement's rows followed by the subquery's
+        both = Schema(list(header) + ast.fields)
+        args['residual'] = compile_ast(conjunction(ast.residual), header=both, **kwargs)
+    return partial(semi_join_execute, f, ast.view, **args)
+
+
 @plan.register(Columns)
 def _(ast, f, **kwargs):
     compiler = kwargs['compiler']
@@ -93,7 +415,7 @@ def _(ast, f, **kwargs):
                 if grouping:
                     v = name
                 else:
-                    groups.append((name, compile_ast(var.value, **kwargs)))
+                    groups.append((name, var.value))
                     continue
             else:
                 if grouping:
@@ -103,23 +425,30 @@ def _(ast, f, **kwargs):
                         name, v = v.column, name
                     else:
                         v = v.name
+                    # a key a join dropped reads the one it equals
+                    v = header.field(v)
                 else:
                     v = compile_ast(v, **kwargs)
         fields.append((name, v))
     if groups:
         if fields:
             raise SQLError("Wrong select statement: combine aggregates with not aggregates")
-        header, fs = zip(*groups)
-        # print("cs:", header, fs)
-        return partial(aggregate_execute, f, header=header, aggregates=fs)
+        keys, values = zip(*groups)
+        # print("cs:", keys, values)
+        factories, step = compile_aggregates(values, nulls=False, **kwargs)
+        header.clear()
+        header.update(keys)
+        return partial(aggregate_execute, f, header=keys, aggregates=factories, step=step)
     elif fields:
         keys, values = zip(*fields)
         # print("cs:", keys, values, header)
         if keys == values:
-            if set(keys) == header:
+            if list(keys) == header.fields:
                 # print("as is:", f)
                 return f
             else:
+                header.clear()
+                header.update(keys)
                 return partial(cut_execute, f, fields=keys)
         # print("fields?:", fields, header)
         header.clear()
@@ -135,24 +464,6 @@ def _(ast, f, header, **kwargs):
     return f
 
 
-def _reducer(keys, rows, aggragates=[]):
-    if not isinstance(keys, (tuple, list)):
-        keys = [keys]
-    else:
-        keys = list(keys)
-    # print("reduc:", keys, type(keys))
-    rec = keys
-    rows = list(rows)
-    for f in aggragates:
-        try:
-            val = f(rows)
-        except:
-            val = None
-        rec.append(val)
-    # print("reduc1:", rec)
-    return rec
-
-
 @plan.register(GroupBy)
 def _(ast, f, **kwargs):
     compiler = kwargs['compiler']
@@ -160,10 +471,9 @@ def _(ast, f, **kwargs):
     # print("plan GroupBy:", ast.deps, ast.keys, header)
     keys = []
     hs = []
-    aggregates = []
     args = dict(key=keys, header=hs)
     if ast.deps:
-        vs = compile_vars(ast.deps, compiler, **kwargs)
+        vs = compile_vars(ast.deps, **kwargs)
     else:
         vs = []
         # print("plan deps GroupBy:", kwargs.get('header'))
@@ -179,25 +489,58 @@ def _(ast, f, **kwargs):
             if v is not None:
                v = compile_ast(v, **kwargs)
                vs.append((name, v))
+               header.add(name)
     if vs:
         args['addfields'] = vs
     # print("group by vars:", ast.vars)
-    cs = compiler.ast.columns
     for var in ast.vars:
-        name = compiler.var_name(var)
-        hs.append(name)
-        val = compile_ast(var.value, **kwargs)
-        # var.done = True
-        aggregates.append(val)
-        # print("g var:", var, val)
-    # print("group by:", args, aggregates)
-    args['reducer'] = partial(_reducer, aggragates=aggregates)
+        hs.append(compiler.var_name(var))
+    # every aggregate of a row is stepped by one function
+    factories, step = compile_aggregates([var.value for var in ast.vars], **kwargs)
+    args.update(aggregates=factories, step=step)
     #new header
     header = kwargs['header']
     header.clear()
     header.update(hs)
     # print("group by:", args)
-    return partial(reducer_execute, f, **args)
+    # partial states of mergeable aggregates can be combined: the rows may
+    # be aggregated in parts and the parts merged
+    mergeable = all(map(is_mergeable, factories))
+    db = kwargs['db']
+    if mergeable and db.workers > 1:
+        # no more rows than the workers need to pay for themselves, by the
+        # estimate of the rows read before WHERE, which may ask a database
+        rows = estimate_rows(compiler.ast.source)
+        code = portable(step, compiler.module) if rows is None or rows >= MIN_ROWS else None
+        if code is not None:
+            return partial(parallel_aggregate_execute, f, code=code, pool=db.process_pool,
+                           workers=db.workers, **args)
+    if is_presorted(compiler.ast.source, keys):
+        # groups are runs of adjacent rows, rowreduce needs no sort
+        return partial(reducer_execute, f, presorted=True, **args)
+    return partial(hash_aggregate_execute, f, mergeable=mergeable, **args)
+
+
+def plan_group_query(ast, compiler, header, **kwargs):
+    """FROM, WHERE and GROUP BY of ast run by the database of its tables,
+    or None when they can not"""
+    names = [compiler.var_name(var) for var in ast.groupby.vars]
+    query = group_query(ast, names)
+    if query is not None:
+        header.update(query.names)
+        return partial(query_execute, query, **read_ahead(kwargs['db']))
+
+
+def is_presorted(source, keys):
+    """the rows of source come sorted by the fields keys, in some order,
+    so rows of a group are adjacent"""
+    if not isinstance(source, Table) or source.view is None:
+        return False
+    order = getattr(source.view, 'sortedby', ())
+    columns = {str(c.alias or k): str(c.column) for k, c in source.use.items()}
+    if not all(k in columns for k in keys):
+        return False
+    return {columns[k] for k in keys} == set(order[:len(keys)])
 
 
 @plan.register(OrderBy)
@@ -218,16 +561,33 @@ def _(ast, f, **kwargs):
             if v is not None:
                 v = compile_ast(v, **kwargs)
                 vs.append((name, v))
+                header.add(name)
             else:
                 # print("h:", var, header)
                 raise SQLError("Order by unknown field {}".format(name))
         key.append(name)
         if vs:
             args['addfields'] = vs
+    limit = heap_limit(compiler.ast)
+    if limit is not None:
+        # only the first rows are kept: a bounded heap instead of a sort
+        args['limit'] = limit.count, limit.offset
+    db = kwargs['db']
+    if db.sort_memory:
+        args['memory'] = db.sort_memory
+    if db.sort_dir:
+        args['tempdir'] = str(db.sort_dir)
     # print("order by:", args)
     return partial(sort_execute, f, **args)
 
 
+def heap_limit(ast):
+    """the LIMIT of ast when its ORDER BY applies it"""
+    limit = ast.limit
+    if ast.orders and limit is not None and limit.count is not None and not ast.distinct:
+        return limit
+
+
 def compile_vars(vars, compiler, header, **kwargs):
     fields = []
     # tc = []
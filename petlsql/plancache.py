@@ -0,0 +1,140 @@
+import os
+import re
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+from collections import OrderedDict
+
+from . import __version__
+
+
+__all__ = ("PlanCache", "DiskPlanCache", "normalize_sql")
+
+
+# bumped whenever the parser builds statements differently, so entries
+# stored by an older parser are not reused
+FORMAT = 6
+
+_tokens = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\s+""")
+
+
+def normalize_sql(sql):
+    """collapse whitespace outside string literals, so formatting of the
+    same statement does not produce different cache keys"""
+    return _tokens.sub(lambda m: m.group(1) or ' ', sql).strip()
+
+
+class PlanCache:
+    """bounded LRU of compiled query plans
+
+    Keys are built by the caller (normalized sql text plus a fingerprint
+    of the database state the plan was resolved against).
+    maxsize <= 0 disables caching.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        plan = self._plans.get(key)
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._plans.move_to_end(key)
+        return plan
+
+    def put(self, key, plan):
+        if self.maxsize <= 0:
+            return
+        self._plans[key] = plan
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._plans.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    size=len(self._plans), maxsize=self.maxsize)
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __contains__(self, key):
+        return key in self._plans
+
+
+class DiskPlanCache:
+    """parsed statements stored under a directory, so short-lived processes
+    can skip the parser for sql they have seen before.
+
+    An entry is found by a hash of the sql text and the petlsql version and
+    is valid only while the views it reads keep the headers they had when
+    it was stored. Corrupt or stale entries are treated as missing.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, sql):
+        key = "{}\0{}\0{}".format(__version__, FORMAT, normalize_sql(sql))
+        return self.directory / "{}.plan".format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def load(self, sql, schema):
+        """parsed ast of sql, or None
+
+        schema(names) returns the current headers of the named views.
+        """
+        path = self.path(sql)
+        try:
+            with path.open('rb') as f:
+                entry = pickle.load(f)
+            if entry['version'] != (__version__, FORMAT) or entry['sql'] != normalize_sql(sql):
+                raise ValueError("stale entry")
+            if schema(list(entry['schema'])) != entry['schema']:
+                raise ValueError("schema changed")
+            ast = pickle.loads(entry['ast'])
+        except FileNotFoundError:
+            self.misses += 1
+            return
+        except Exception:
+            self.misses += 1
+            self.discard(path)
+            return
+        self.hits += 1
+        return ast
+
+    def store(self, sql, ast, schema):
+        """ast must be pickled bytes of the statement as the parser built it"""
+        entry = dict(version=(__version__, FORMAT), sql=normalize_sql(sql), schema=schema, ast=ast)
+        path = self.path(sql)
+        fd, tmp = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, str(path))
+        except Exception:
+            self.discard(Path(tmp))
+            raise
+
+    def discard(self, path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        for path in self.directory.glob('*.plan'):
+            self.discard(path)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
@@ -4,6 +4,10 @@ from .virtdb import DB, VirtualDB
 
 
 class PostgresDB(DB):
+    placeholder = '%s'
+    # backslash escapes by default
+    like_escape = " ESCAPE ''"
+
     def create_connection(self, url, config=None):
         pr = urlparse(url)
         connargs = dict(host=pr.hostname, port=pr.port, user=pr.username, password=pr.password, database=pr.path[1:])
@@ -22,4 +26,33 @@ class PostgresDB(DB):
         where relkind='r' and relname !~ '^(pg_|sql_)'""")
         return set([r[0] for r in c.fetchall()])
 
+    def estimate(self, path):
+        """rows of table path by the planner statistics in pg_class, which
+        VACUUM and ANALYZE keep; a table never analyzed has -1, or 0 before
+        PostgreSQL 14"""
+        c = self.conn.cursor()
+        c.execute("select reltuples from pg_class where oid = to_regclass(%s)", (path,))
+        row = c.fetchone()
+        if row is not None and row[0] is not None and row[0] > 0:
+            return int(row[0])
+
+    def _column_types(self, path):
+        schema, _, table = path.rpartition('.')
+        c = self.conn.cursor()
+        c.execute("""select column_name, data_type from information_schema.columns
+        where table_schema = %s and table_name = %s""", (schema or 'public', table))
+        r = {}
+        for name, kind in c.fetchall():
+            if kind in _text_types:
+                r[name] = (str,)
+            elif kind in _number_types:
+                r[name] = (int, float)
+        return r
+
+
+# character pads with blanks, numeric reads as Decimal: neither compares
+# as python does
+_text_types = {'text', 'character varying'}
+_number_types = {'smallint', 'integer', 'bigint', 'real', 'double precision'}
+
 VirtualDB.register_db_driver('postgres', PostgresDB)
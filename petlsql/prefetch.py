@@ -0,0 +1,99 @@
+"""
+Reading the rows of a source ahead of the statement.
+
+A thread pulls the rows of a database table or a file in batches into a
+bounded queue while the statement works on the rows before them, so the
+time the source keeps its reader waiting (a database server, the network,
+the disk) overlaps with the python work on the rows: psycopg2 and sqlite3
+let other threads run while they wait for rows. The queue holds depth
+batches at most.
+
+An error of the source is raised to the statement once it has the rows
+read before it. A statement that stops early, at a LIMIT or on an error of
+its own, stops the thread, which closes the source.
+"""
+import threading
+from itertools import islice
+from queue import Queue, Full
+
+import petl as etl
+
+
+__all__ = ("PrefetchView", "BATCH_ROWS")
+
+
+# rows of the largest batches; the first ones are smaller, so the first
+# rows reach the statement without waiting for a whole batch
+BATCH_ROWS = 2000
+FIRST_BATCH_ROWS = 64
+# seconds a thread waits on a full queue before it checks whether the
+# statement stopped
+POLL = 0.1
+
+_END = object()
+
+
+class PrefetchView(etl.Table):
+    """rows of source, read by a thread at most depth batches ahead"""
+    def __init__(self, source, depth=2):
+        self.source = source
+        self.depth = max(depth, 1)
+
+    def __iter__(self):
+        queue = Queue(self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=read_ahead, args=(self.source, queue, stop),
+                                  name="petlsql-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = queue.get()
+                if batch is _END:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield from batch
+        finally:
+            # the thread may be blocked on the full queue or fetching rows:
+            # it stops when it next puts a batch
+            stop.set()
+
+
+def read_ahead(source, queue, stop):
+    """put the rows of source into queue in batches until they end or stop
+    is set, then _END, or the error reading them raised"""
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=POLL)
+                return True
+            except Full:
+                pass
+        return False
+
+    it = None
+    batch = []
+    try:
+        it = iter(source)
+        size = FIRST_BATCH_ROWS
+        while not stop.is_set():
+            batch = []
+            append = batch.append
+            for row in islice(it, size):
+                append(row)
+            if not batch:
+                put(_END)
+                return
+            if not put(batch):
+                return
+            batch = []
+            size = min(size * 2, BATCH_ROWS)
+    except BaseException as e:
+        # the rows read before the error first
+        if not batch or put(batch):
+            put(e)
+    finally:
+        # a generator is closed by the thread running it
+        close = getattr(it, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,529 @@
+"""
+Work done by the database the tables are read from.
+
+Joins of tables of one database are sent to it as one statement, a Query,
+when the conditions of their ON clauses translate exactly.
+So is the GROUP BY of a statement whose FROM is such a join or one table
+of a database, when the database can compute its aggregates.
+
+The conjuncts of WHERE that read the columns of one database table only,
+or of the tables of one Query, and have an equivalent in the SQL of that
+database, are added to the statement reading them. Constants and
+parameters become arguments bound to its placeholders. What is left is
+evaluated in python as before. A conjunct the database evaluates only
+approximately (LIKE ignoring case) is kept as well, the database then only
+discards rows early.
+
+Conditions are translated so rows with NULLs are kept or dropped as
+python does it: NOT is not sent, since python's `not None` holds, <> is
+sent as the null-safe comparison of the database, and so is = of columns
+and parameters, which may be NULL, and join keys match NULLs with NULLs,
+as etl.join does. Values compared with a column must be of a type the
+database compares it with unconverted (DB.column_types): other constants
+are not sent, and conjuncts with values of unknown type, as parameters,
+are evaluated in python as well.
+"""
+from functools import singledispatch
+from string import Formatter
+
+from .sql.ast import *
+
+
+__all__ = ("push_predicates", "delegate_joins", "group_query", "Pushed", "Query")
+
+
+class NotPushable(Exception):
+    pass
+
+
+def bind_args(args, params):
+    return tuple(params[a.id] if isinstance(a, Param) else a for a in args)
+
+
+class Pushed:
+    """condition of the query reading a database table: sql with
+    placeholders and the values, or parameters, bound to them"""
+    def __init__(self, conditions, args):
+        self.sql = ' AND '.join(conditions)
+        self.args = tuple(args)
+
+    def bind(self, params):
+        return bind_args(self.args, params)
+
+    def __str__(self):
+        return self.sql
+
+
+class Query:
+    """statement a database runs for a part of a statement: its tables
+    joined, filtered and maybe grouped. fields are the (name, sql) of the
+    columns of its rows"""
+    def __init__(self, database):
+        self.database = database
+        self.aliases = {}
+        self.source = ''
+        self.fields = []
+        self.groupby = []
+        self.conditions = []
+        # arguments of the placeholders of the fields, of the conditions of
+        # the joins, then of WHERE
+        self.field_args = []
+        self.join_args = []
+        self.args = []
+
+    @property
+    def names(self):
+        return [name for name, _ in self.fields]
+
+    @property
+    def sql(self):
+        quote = self.database.quote
+        r = "SELECT {} FROM {}".format(
+            ', '.join("{} AS {}".format(sql, quote(name)) for name, sql in self.fields), self.source)
+        if self.conditions:
+            r += " WHERE " + ' AND '.join(self.conditions)
+        if self.groupby:
+            r += " GROUP BY " + ', '.join(self.groupby)
+        return r
+
+    @property
+    def all_args(self):
+        return tuple(self.field_args) + tuple(self.join_args) + tuple(self.args)
+
+    def rows(self, params=None):
+        return self.database.fetch(self.sql, bind_args(self.all_args, params))
+
+    def table(self, table):
+        """FROM item of table, adding its columns to the fields"""
+        alias = "t{}".format(len(self.aliases))
+        self.aliases[table] = alias
+        quote = self.database.quote
+        for k, c in table.use.items():
+            self.fields.append((str(c.alias or k), "{}.{}".format(alias, quote(str(c.column)))))
+        return "{} AS {}".format(table.view.name, alias)
+
+    def join(self, source):
+        """FROM clause of the tables of source, adding their columns to the
+        fields as the joins run in python combine them"""
+        if isinstance(source, Table):
+            return self.table(source)
+        left = self.join(source.source1)
+        lfields = dict(self.fields)
+        start = len(self.fields)
+        right = self.join(source.source2)
+        rfields = self.fields[start:]
+        del self.fields[start:]
+        if source.jointype == Join.UNION:
+            self.fields += rfields
+            return "{} CROSS JOIN {}".format(left, right)
+        lkeys, rkeys = source.join.keys
+        rsql = dict(rfields)
+        on = []
+        for lk, rk in zip(lkeys, rkeys):
+            on.append(self.database.same.format(lfields[lk.name], rsql[rk.name]))
+        # the other conjuncts of ON, as the database evaluates them exactly
+        t = Translation(JoinOn(self, dict(lfields, **rsql)))
+        for cond in [c for conds in getattr(source.join, 'filters', ()) for c in conds] + \
+                getattr(source.join, 'residual', []):
+            on.append(translate(cond, t))
+        if not t.exact:
+            raise NotPushable(source.join)
+        self.join_args += t.args
+        if source.jointype in (Join.RIGHT, Join.FULL):
+            for lk, rk in zip(lkeys, rkeys):
+                # rows with no left side take the keys of the right one
+                i = self.names.index(lk.name)
+                self.fields[i] = lk.name, "COALESCE({}, {})".format(lfields[lk.name], rsql[rk.name])
+        # outer joins keep the right keys, NULL for rows without a match
+        rnames = {k.name for k in rkeys} if source.jointype in (Join.INNER, Join.RIGHT) else set()
+        self.fields += [(name, sql) for name, sql in rfields if name not in rnames]
+        return "{} {} JOIN {} ON {}".format(left, source.jointype.name, right, ' AND '.join(on))
+
+    def column(self, c):
+        """sql of the field of column c, as WHERE sees it"""
+        if c.table in self.aliases:
+            for name, sql in self.fields:
+                if name == c.name:
+                    return sql
+        raise NotPushable(c)
+
+    def push(self, condition, args):
+        self.conditions.append(condition)
+        self.args.extend(args)
+
+    def __str__(self):
+        return self.sql
+
+
+class JoinOn:
+    """columns the ON clause of a join of a query reads: those of both sides"""
+    def __init__(self, query, fields):
+        self.query = query
+        self.database = query.database
+        self.fields = fields
+
+    def column(self, c):
+        if c.table not in self.query.aliases or c.name not in self.fields:
+            raise NotPushable(c)
+        return self.fields[c.name]
+
+
+class TableScan:
+    """conditions pushed to the query reading one database table"""
+    def __init__(self, table):
+        self.table = table
+        self.database = table.view.database
+        self.conditions = []
+        self.args = []
+
+    def column(self, c):
+        if c.table is not self.table:
+            raise NotPushable(c)
+        return self.database.quote(str(c.column))
+
+    def push(self, condition, args):
+        self.conditions.append(condition)
+        self.args.extend(args)
+
+    def done(self):
+        if self.conditions:
+            self.table.pushed = Pushed(self.conditions, self.args)
+
+
+def database(source):
+    """the database all tables of source are read from, and joined by, or
+    None"""
+    if isinstance(source, Table):
+        if source.view is not None and not source.rownumber:
+            return source.view.database
+        return
+    if isinstance(source, JoinCursor) and not source.deps:
+        db = database(source.source1)
+        if db is None or db is not database(source.source2):
+            return
+        if source.jointype in (Join.RIGHT, Join.FULL) and not db.outer_joins:
+            return
+        if source.jointype != Join.UNION:
+            keys = getattr(source.join, 'keys', None)
+            if not keys or not all(isinstance(k, Column) for ks in keys for k in ks):
+                return
+        return db
+
+
+def delegate_joins(source):
+    """send the largest joins of tables of one database to it"""
+    if not isinstance(source, JoinCursor):
+        return
+    db = database(source)
+    if db is not None:
+        query = Query(db)
+        try:
+            query.source = query.join(source)
+        except NotPushable:
+            pass
+        else:
+            if query.fields:
+                source.query = query
+                return
+    delegate_joins(source.source1)
+    delegate_joins(source.source2)
+
+
+class Translation:
+    """state of the translation of one condition for a table or a query"""
+    def __init__(self, unit):
+        self.unit = unit
+        self.db = unit.database
+        self.args = []
+        self.columns = 0
+        self.exact = True
+
+    def bind(self, value):
+        self.args.append(value)
+        return self.db.placeholder
+
+
+def conjuncts(cond):
+    while isinstance(cond, BracesExpr):
+        cond = cond.arg
+    if isinstance(cond, ConditionExpr) and cond.op == 'and':
+        return [c for arg in cond.args for c in conjuncts(arg)]
+    return [cond]
+
+
+def filtered_units(source):
+    """database tables and queries of source whose rows WHERE filters: not
+    those on the side of an outer join that is padded with NULLs"""
+    if isinstance(source, Table):
+        if source.view is not None and source.view.database is not None and not source.rownumber:
+            return [TableScan(source)]
+        return []
+    if isinstance(source, JoinCursor):
+        if source.query is not None:
+            return [source.query]
+        r = []
+        if source.jointype in (Join.INNER, Join.UNION, Join.LEFT):
+            r += filtered_units(source.source1)
+        if source.jointype in (Join.INNER, Join.UNION, Join.RIGHT):
+            r += filtered_units(source.source2)
+        return r
+    return []
+
+
+def push_predicates(ast):
+    """move what the databases can evaluate of the WHERE of ast to the
+    tables and queries read from them"""
+    if ast.selector is None:
+        return
+    units = filtered_units(ast.source)
+    if not units:
+        return
+    residual = []
+    for cond in conjuncts(ast.selector.cond):
+        keep = True
+        for unit in units:
+            t = Translation(unit)
+            try:
+                sql = translate(cond, t)
+            except NotPushable:
+                continue
+            if not t.columns:
+                break
+            unit.push(sql, t.args)
+            keep = not t.exact
+            break
+        if keep:
+            residual.append(cond)
+    for unit in units:
+        if isinstance(unit, TableScan):
+            unit.done()
+    if not residual:
+        ast.selector = None
+    elif len(residual) == 1:
+        ast.selector.cond = residual[0]
+    else:
+        ast.selector.cond = ConditionExpr('and', residual)
+
+
+def group_query(ast, names):
+    """Query computing the GROUP BY of ast, naming its aggregates names, or
+    None when the database can not"""
+    source = ast.source
+    if ast.selector is not None or ast.semijoins or ast.groupby.deps:
+        return
+    if isinstance(source, JoinCursor):
+        base = source.query
+    elif isinstance(source, Table) and database(source) is not None:
+        base = Query(source.view.database)
+        base.source = base.table(source)
+        if source.pushed is not None:
+            base.push(source.pushed.sql, source.pushed.args)
+    else:
+        return
+    if base is None:
+        return
+    query = Query(base.database)
+    query.aliases, query.source = base.aliases, base.source
+    query.conditions, query.join_args, query.args = base.conditions, base.join_args, base.args
+    fields = dict(base.fields)
+    for key in ast.groupby.keys:
+        name = key if isinstance(key, str) else key.name
+        if name not in fields:
+            # an expression of the select list
+            return
+        query.fields.append((name, fields[name]))
+        query.groupby.append(fields[name])
+    t = Translation(base)
+    for name, var in zip(names, ast.groupby.vars):
+        try:
+            query.fields.append((name, aggregate(var.value, t)))
+        except NotPushable:
+            return
+    query.field_args = t.args
+    return query
+
+
+_aggregates = {Aggregate.COUNT, Aggregate.SUM, Aggregate.MIN, Aggregate.MAX, Aggregate.AVG}
+
+
+def aggregate(ast, t):
+    """sql of an aggregate stepped with the values sqlib accumulators are:
+    those that are not false"""
+    if not isinstance(ast, AggregateFunc) or ast.func not in _aggregates:
+        raise NotPushable(ast)
+    value = None
+    if ast.arg is not None:
+        if t.db.nonfalsy is None:
+            raise NotPushable(ast)
+        value = t.db.nonfalsy.format(translate(ast.arg, t))
+    if ast.selector is not None:
+        value = "CASE WHEN {} THEN {} END".format(translate(ast.selector, t), value or 1)
+    if not t.exact:
+        raise NotPushable(ast)
+    return "{}({}{})".format(ast.func.name, "DISTINCT " if ast.distinct else "", value or '*')
+
+
+@singledispatch
+def translate(ast, t):
+    raise NotPushable(ast)
+
+
+@translate.register(Column)
+def _(ast, t):
+    r = t.unit.column(ast)
+    t.columns += 1
+    return r
+
+
+@translate.register(Constant)
+def _(ast, t):
+    return translate(ast.value, t)
+
+
+@translate.register(str)
+@translate.register(int)
+@translate.register(float)
+def _(ast, t):
+    if isinstance(ast, (Identifier, bool)):
+        raise NotPushable(ast)
+    return t.bind(ast)
+
+
+@translate.register(Param)
+def _(ast, t):
+    return t.bind(ast)
+
+
+@translate.register(BracesExpr)
+def _(ast, t):
+    return "({})".format(translate(ast.arg, t))
+
+
+_compare = {'==': '=', '=': '=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+
+
+def operand(ast):
+    while isinstance(ast, BracesExpr):
+        ast = ast.arg
+    return ast
+
+
+def constant(ast):
+    """value of ast when it is a constant the database is sent, or None"""
+    ast = operand(ast)
+    if isinstance(ast, Constant):
+        ast = ast.value
+    if isinstance(ast, (str, int, float)) and not isinstance(ast, (Identifier, bool)):
+        return ast
+
+
+def value_types(ast, t):
+    """python types of the values of ast as the database compares them:
+    that of a constant, those a column compares unconverted with, or None
+    when unknown, as for parameters"""
+    value = constant(ast)
+    if value is not None:
+        return (type(value),)
+    ast = operand(ast)
+    if isinstance(ast, Column):
+        # not pushable unless a column of the table or query
+        t.unit.column(ast)
+        return t.db.column_types(ast.table.view.name).get(str(ast.column))
+
+
+def compared(a, b, t):
+    """a compared with b by the database as python compares them: sqlite
+    converts '1' to 1 for an INTEGER column, postgresql refuses to compare
+    text with numbers. Unknown types keep the condition for python to
+    check as well"""
+    ta, tb = value_types(a, t), value_types(b, t)
+    if ta is None or tb is None:
+        t.exact = False
+    elif not set(ta) & set(tb):
+        raise NotPushable(a)
+    elif ta != tb and constant(a) is None and constant(b) is None:
+        # columns of different types
+        t.exact = False
+
+
+def same(a, b, t):
+    """t.db.same of a and b, each translated where it is read so that
+    placeholders are bound in order"""
+    sides = a, b
+    return ''.join(text + (translate(sides[int(field)], t) if field is not None else '')
+                   for text, field, _, _ in Formatter().parse(t.db.same))
+
+
+@translate.register(CompareExpr)
+def _(ast, t):
+    if ast.op in ('!=', '<>'):
+        op = t.db.distinct
+    elif ast.op in _compare:
+        op = _compare[ast.op]
+    else:
+        raise NotPushable(ast)
+    compared(ast.arg1, ast.arg2, t)
+    if op == '=' and constant(ast.arg1) is None and constant(ast.arg2) is None:
+        # columns and parameters may be NULL, and None == None holds
+        return same(ast.arg1, ast.arg2, t)
+    return "{} {} {}".format(translate(ast.arg1, t), op, translate(ast.arg2, t))
+
+
+@translate.register(ConditionExpr)
+def _(ast, t):
+    if ast.op not in ('and', 'or'):
+        raise NotPushable(ast)
+    return "({})".format(" {} ".format(ast.op.upper()).join(translate(arg, t) for arg in ast.args))
+
+
+@translate.register(BetweenExpr)
+def _(ast, t):
+    # placeholders are bound in the order they appear, so values used
+    # twice are translated twice, left to right
+    arg, a, b = ast.args
+    compared(arg, a, t)
+    compared(arg, b, t)
+    prefix = ""
+    if not ast.is_true:
+        # python keeps the NULLs: not sqlib.BETWEEN(...) holds for them
+        prefix = "{} IS NULL OR NOT ".format(translate(arg, t))
+    between = "{} BETWEEN {} AND {}"
+    r = between.format(translate(arg, t), translate(a, t), translate(b, t))
+    if ast.symmetric:
+        r = "({} OR {})".format(r, between.format(translate(arg, t), translate(b, t), translate(a, t)))
+    if prefix:
+        r = "({}{})".format(prefix, r)
+    return r
+
+
+@translate.register(InExpr)
+def _(ast, t):
+    if not isinstance(ast.values, list):
+        raise NotPushable(ast)
+    for v in ast.values:
+        compared(ast.arg, v, t)
+    return "{} {}IN ({})".format(translate(ast.arg, t), "" if ast.is_true else "NOT ",
+                                 ', '.join(translate(v, t) for v in ast.values))
+
+
+@translate.register(LikeExpr)
+def _(ast, t):
+    if ast.isre or not (ast.is_true or t.db.exact_like):
+        # rows an approximate NOT LIKE drops might match in python
+        raise NotPushable(ast)
+    r = "{} {}LIKE {}".format(translate(ast.arg, t), "" if ast.is_true else "NOT ", t.bind(ast.pattern))
+    if ast.escape:
+        r += " ESCAPE " + t.bind(ast.escape[0])
+    else:
+        r += t.db.like_escape
+    if not t.db.exact_like:
+        t.exact = False
+    return r
+
+
+@translate.register(Check)
+def _(ast, t):
+    if ast.val is not None:
+        # IS TRUE and IS FALSE test python's identity, not truth
+        raise NotPushable(ast)
+    return "{} IS {}NULL".format(translate(ast.arg, t), "" if ast.is_true else "NOT ")
@@ -0,0 +1,305 @@
+"""
+Rewrites of expression trees before they are compiled.
+
+fold_constants evaluates the parts of an expression that do not depend on
+the row once, at compile time. share_common finds sub-expressions that the
+code of one compiled function repeats and computes them once per row.
+reuse_aliases lets WHERE read select list fields whose expressions it
+repeats.
+"""
+from copy import copy
+from enum import Enum
+
+from .sql.ast import *
+
+
+__all__ = ("fold_constants", "share_common", "reuse_aliases")
+
+
+# children of expression nodes, in the order compile_ast emits them
+_children = (
+    (ConditionExpr, ("args",)),
+    (BinaryExpr, ("arg1", "arg2")),
+    (Negation, ("arg",)),
+    (BracesExpr, ("arg",)),
+    (BetweenExpr, ("args",)),
+    (InExpr, ("arg", "values")),
+    (LikeExpr, ("arg",)),
+    (ContainingExpr, ("arg",)),
+    (DistinctFrom, ("args",)),
+    (Function, ("args",)),
+    (SQLFunction, ("args",)),
+)
+
+# nodes that compile to separate functions or lambdas; constants inside
+# them are folded, but they are never shared or looked into for sharing
+_nested = (
+    (SimpleSwitch, ("val", "cases", "elsevalue")),
+    (SimpleCase, ("value",)),
+    (SearchedSwitch, ("cases", "elsevalue")),
+    (SearchCase, ("cond", "value")),
+    (Check, ("arg",)),
+    (AggregateFunc, ("arg", "selector")),
+    (WhereAst, ("cond",)),
+    (Var, ("value",)),
+)
+
+_foldable = (ConditionExpr, BinaryExpr, Negation, BracesExpr, InExpr,
+             ContainingExpr, DistinctFrom, SQLFunction)
+
+
+def children(node, table=_children):
+    for cls, fields in table:
+        if isinstance(node, cls):
+            return fields
+
+
+def is_constant(node):
+    if isinstance(node, (list, tuple)):
+        return all(map(is_constant, node))
+    if isinstance(node, str):
+        return not isinstance(node, Identifier)
+    return node is None or isinstance(node, (Constant, int, float, type, Enum))
+
+
+def is_call(node, deterministic):
+    """user function call that may be evaluated fewer times than written"""
+    return isinstance(node.id, PyVar) and not is_aggregate(node) and deterministic(node.id.val)
+
+
+def fold_constants(node, evaluate, deterministic):
+    """node with constant sub-expressions replaced by their values
+
+    evaluate(node) computes a constant expression; deterministic(name)
+    tells whether a user function always returns the same value for the
+    same arguments. Expressions that fail are left to fail at run time.
+    """
+    if isinstance(node, list):
+        return [fold_constants(n, evaluate, deterministic) for n in node]
+    if isinstance(node, tuple):
+        return tuple(fold_constants(n, evaluate, deterministic) for n in node)
+    fields = children(node) or children(node, _nested)
+    if fields is None:
+        return node
+    for field in fields:
+        setattr(node, field, fold_constants(getattr(node, field), evaluate, deterministic))
+    if isinstance(node, Function):
+        if not is_call(node, deterministic):
+            return node
+    elif not isinstance(node, _foldable):
+        return node
+    if all(is_constant(getattr(node, field)) for field in fields):
+        try:
+            return Constant(evaluate(node))
+        except Exception:
+            pass
+    return node
+
+
+class _Walk:
+    """keys and occurrences of the sub-expressions of code compiled into
+    one function, in evaluation order"""
+    def __init__(self, deterministic, header):
+        self.deterministic = deterministic
+        self.header = header
+        self.occurrences = {}
+        self.sizes = {}
+
+    def field(self, var):
+        if var.id is None or isinstance(var.value, Column):
+            return
+        if hasattr(self.header, 'position'):
+            return self.header.position(str(var.id))
+
+    def shareable(self, node):
+        if isinstance(node, Function):
+            return is_call(node, self.deterministic)
+        if isinstance(node, SQLFunction):
+            # coalesce compiles its arguments to lambdas
+            return node.id != SqlFunc.COALESCE
+        return children(node) is not None
+
+    def key(self, node, unconditional=True):
+        """structural key of node; records occurrences of shareable nodes"""
+        if isinstance(node, (list, tuple)):
+            return tuple(self.key(n, unconditional) for n in node)
+        if isinstance(node, Shared):
+            if node.first:
+                self.key(node.value, unconditional)
+            return ('shared', node.name)
+        if isinstance(node, Var):
+            if self.field(node) is not None:
+                return ('field', str(node.id))
+            return self.key(node.value, unconditional)
+        if isinstance(node, BracesExpr):
+            return self.key(node.arg, unconditional)
+        if isinstance(node, Column):
+            return ('column', str(node.table.name), node.column)
+        if isinstance(node, Param):
+            return ('param', node.id)
+        if isinstance(node, Constant):
+            return ('const', type(node.value), repr(node.value))
+        if isinstance(node, PyVar):
+            return ('pyvar', node.val)
+        if is_constant(node) or isinstance(node, Identifier):
+            return (type(node), repr(node))
+        if not self.shareable(node):
+            if isinstance(node, Function):
+                # arguments are evaluated, the call itself is not shared
+                self.key(node.args, unconditional)
+            return ('opaque', id(node))
+        fields = children(node)
+        keys = []
+        for field in fields:
+            value = getattr(node, field)
+            if isinstance(node, ConditionExpr):
+                # and/or: operands after the first may not be evaluated
+                keys.append(tuple(self.key(v, unconditional and i == 0) for i, v in enumerate(value)))
+            elif isinstance(node, SQLFunction) and node.id == SqlFunc.TRIM:
+                # trim emits its arguments in reverse order
+                keys.append(self.key(value, False))
+            else:
+                keys.append(self.key(value, unconditional))
+        attrs = tuple((k, repr(v)) for k, v in sorted(vars(node).items())
+                      if k not in fields and k != 'deps')
+        key = (type(node).__name__, attrs, tuple(keys))
+        self.occurrences.setdefault(key, []).append(unconditional)
+        self.sizes[key] = 1 + sum(self.sizes.get(k, 1) for k in _flatten(keys))
+        return key
+
+
+def _flatten(keys):
+    for k in keys:
+        if isinstance(k, tuple) and k and isinstance(k[0], tuple):
+            yield from _flatten(k)
+        else:
+            yield k
+
+
+def share_common(roots, deterministic, header=None):
+    """roots, compiled into one function and evaluated in order, with the
+    sub-expressions they repeat replaced by Shared nodes
+
+    A sub-expression is shared only when its first occurrence is always
+    evaluated, so the occurrences after it can read the local it sets.
+    """
+    roots = list(roots)
+    count = 0
+    while True:
+        walk = _Walk(deterministic, header)
+        for root in roots:
+            walk.key(root)
+        candidates = [k for k, occurs in walk.occurrences.items() if len(occurs) > 1 and occurs[0]]
+        if not candidates:
+            return roots
+        # enclosing expressions first, their parts are then evaluated once
+        key = max(candidates, key=walk.sizes.get)
+        count += 1
+        sub = _Substitute(walk, key, "_e{}".format(count))
+        roots = [sub(root) for root in roots]
+        if not sub.seen:
+            return roots
+
+
+class _Substitute:
+    def __init__(self, walk, key, name):
+        self.walk = walk
+        self.key = key
+        self.name = name
+        self.seen = False
+
+    def __call__(self, node):
+        if isinstance(node, list):
+            return [self(n) for n in node]
+        if isinstance(node, tuple):
+            return tuple(self(n) for n in node)
+        if isinstance(node, Shared):
+            if not node.first:
+                return node
+            value = self(node.value)
+            return node if value is node.value else Shared(node.name, value, True)
+        if isinstance(node, Var):
+            if self.walk.field(node) is not None:
+                return node
+            value = self(node.value)
+            return node if value is node.value else value
+        fields = children(node)
+        if fields is None:
+            return node
+        if isinstance(node, BracesExpr):
+            pass
+        elif self.walk.shareable(node):
+            if _Walk(self.walk.deterministic, self.walk.header).key(node) == self.key:
+                first, self.seen = not self.seen, True
+                return Shared(self.name, node, first)
+        elif not isinstance(node, Function):
+            # arguments of calls that are not shared may still be
+            return node
+        changed = {}
+        for field in fields:
+            value = getattr(node, field)
+            new = self(value)
+            if new is not value:
+                changed[field] = new
+        if not changed:
+            return node
+        node = copy(node)
+        for field, value in changed.items():
+            setattr(node, field, value)
+        return node
+
+
+def reuse_aliases(ast, deterministic):
+    """let WHERE read select list fields instead of repeating their
+    expressions; the fields are then computed once, before filtering,
+    together with the aliases WHERE refers to by name
+
+    Only expressions WHERE evaluates for every row are reused, so no
+    row computes something it would not have computed before.
+    """
+    cs = ast.columns
+    if ast.selector is None or ast.groupby is not None or not isinstance(cs, Columns):
+        return
+    if not ast.selector.deps:
+        # the fields are computed by the step that adds the ones WHERE
+        # already refers; a step of their own costs more than it saves
+        return
+    aliases = {}
+    walk = _Walk(deterministic, None)
+    for var in cs:
+        if var.id is None or isinstance(var.id, Column) or is_aggregate(var.value):
+            continue
+        value = var.value
+        while isinstance(value, BracesExpr):
+            value = value.arg
+        if children(value) is not None and walk.shareable(value):
+            aliases.setdefault(walk.key(value), var)
+    if not aliases:
+        return
+    where = ast.selector
+    walk = _Walk(deterministic, None)
+    walk.key(where.cond)
+    for key, occurs in walk.occurrences.items():
+        var = aliases.get(key)
+        if var is None or not any(occurs):
+            continue
+        sub = _Alias(walk, key, var)
+        where.cond = sub(where.cond)
+        if sub.seen:
+            if where.deps is None:
+                where.deps = []
+            if var not in where.deps:
+                where.deps.append(var)
+
+
+class _Alias(_Substitute):
+    """replaces every occurrence of an expression by a select list var"""
+    def __init__(self, walk, key, var):
+        super().__init__(walk, key, None)
+        self.var = var
+
+    def __call__(self, node):
+        r = super().__call__(node)
+        if isinstance(r, Shared) and r.name is None:
+            return self.var
+        return r
@@ -1,5 +1,14 @@
+from functools import partial
+from collections import OrderedDict
+import heapq
+from itertools import islice, chain
+from operator import itemgetter
 from .sql.ast import *
+from .extsort import ExternalSortView
+from .joins import JoinView, HashIndex, BandIndex, ScanIndex, SemiJoinView
+from .prefetch import PrefetchView
 import petl as etl
+from petl.comparison import comparable_itemgetter
 
 
 def filter_keys(kwargs, keys):
@@ -10,24 +19,140 @@ def filter_keys(kwargs, keys):
     return r
 
 
-def table_execute(view, **kwargs):
-    r = iter(view) #@
+def bind_params(f, params):
+    """bind statement parameters to a compiled function that refers them"""
+    if params and getattr(f, 'uses_params', False):
+        return partial(f, params=params)
+    return f
+
+
+def bind_fields(fields, params):
+    if params:
+        return [(name, bind_params(f, params)) for name, f in fields]
+    return fields
+
+
+def read_view(view, params=None, columns=None, where=None, parallel=None, prefetch=None):
+    """rows of view, of the fields columns only and with the conditions
+    where evaluated by its database, when given; with parallel, the
+    arguments pool, workers and ordered of view.scan, read by worker
+    processes when there are enough of them; with prefetch, read by a
+    thread up to prefetch batches ahead otherwise"""
+    kwargs = {}
+    if columns is not None:
+        kwargs['columns'] = columns
+    if where is not None:
+        kwargs.update(where=where.sql, args=where.bind(params))
+    if view.params:
+        kwargs['params'] = params
+    rows = None
+    if parallel is not None and where is None:
+        rows = view.scan(columns=columns, **parallel)
+    if rows is None:
+        rows = view(**kwargs)
+        if prefetch:
+            rows = PrefetchView(rows, prefetch)
+    if where is None and view.collect is not None:
+        # statistics are recorded only when the reader gets to the last row
+        return view.collect(rows)
+    return rows
+
+
+def table_execute(view, params=None, columns=None, where=None, **kwargs):
+    r = read_view(view, params, columns, where, kwargs.get('parallel'), kwargs.get('prefetch'))
     if 'row_number' in kwargs:
         r = etl.addrownumbers(r, field=kwargs['row_number'])
     if 'fieldmap' in kwargs:
-        r = etl.fieldmap(r, kwargs['fieldmap'])
+        r = fieldmap_rows(r, kwargs['fieldmap'])
     return r
 
 
-def join_execute(cl, cr, join, **kwargs):
-    cl, cr = cl(), cr()
-    if 'addLfields' in kwargs:
-        cl = etl.addfields(cl, kwargs['addLfields'])
-    if 'addRfields' in kwargs:
-        cr = etl.addfields(cr, kwargs['addRfields'])
-    args = cl, cr
+def fieldmap_rows(table, fieldmap):
+    """etl.fieldmap, reading the fields by position when every one is read
+    as it is"""
+    if fieldmap and all(isinstance(v, str) for v in fieldmap.values()):
+        return FieldsView(table, fieldmap)
+    return etl.fieldmap(table, fieldmap)
+
+
+class FieldsView(etl.Table):
+    """the fields of the rows of source fieldmap names, as etl.fieldmap
+    gives them without wrapping each row in a record: fields short rows
+    lack read as NULL"""
+    def __init__(self, source, fieldmap):
+        self.source = source
+        self.fieldmap = fieldmap
+
+    def __iter__(self):
+        it = iter(self.source)
+        try:
+            header = list(next(it))
+        except StopIteration:
+            return
+        fields = list(self.fieldmap.values())
+        if not all(f in header for f in fields):
+            # fields the source lacks read as NULL
+            yield from etl.fieldmap(etl.wrap(chain([header], it)), self.fieldmap)
+            return
+        yield tuple(self.fieldmap)
+        positions = [header.index(f) for f in fields]
+        get = itemgetter(*positions)
+        single = len(positions) == 1
+        padding = (None,) * (max(positions) + 1)
+        for row in it:
+            try:
+                values = get(row)
+            except IndexError:
+                values = get(tuple(row) + padding[len(row):])
+            yield (values,) if single else values
+
+
+class FusedView(etl.Table):
+    """rows of a generated pipeline segment over a source table"""
+    def __init__(self, source, segment, header, params=None):
+        self.source = source
+        self.segment = segment
+        self.fields = tuple(header)
+        self.params = params
+
+    def __iter__(self):
+        yield self.fields
+        yield from self.segment(self.source, self.params)
+
+
+def fused_execute(view, segment, header, params=None, columns=None, where=None,
+                  parallel=None, code=None, prefetch=None, **kwargs):
+    if parallel is not None and code is not None and where is None:
+        # the workers run the segment, rebuilt from code, too
+        r = view.scan(columns=columns, segment=(code, tuple(header)), params=params, **parallel)
+        if r is not None:
+            return r
+    source = read_view(view, params, columns, where, parallel, prefetch)
+    return FusedView(source, segment, header, params)
+
+
+def query_execute(query, params=None, prefetch=None, **kwargs):
+    r = query.rows(params)
+    if prefetch:
+        r = PrefetchView(r, prefetch)
+    return r
+
+
+def join_sides(cl, cr, params=None, addLfields=None, addRfields=None, **kwargs):
+    cl, cr = cl(params=params), cr(params=params)
+    if addLfields:
+        cl = etl.addfields(cl, bind_fields(addLfields, params))
+    if addRfields:
+        cr = etl.addfields(cr, bind_fields(addRfields, params))
+    return cl, cr
+
+
+def join_execute(cl, cr, join, params=None, **kwargs):
+    args = join_sides(cl, cr, params, **kwargs)
     if join == Join.UNION:
-        c = etl.crossjoin(*args)
+        # etl.crossjoin reads its sides twice, a scan can be read once:
+        # the right rows are held, the left ones streamed past them
+        c = JoinView(*args, Join.INNER, ScanIndex())
     else:
         kwargs = filter_keys(kwargs, ("key", "lkey", "rkey", "missing", "presorted", "buffersize", "tempdir", "cache"))
         if join == Join.INNER:
@@ -41,60 +166,275 @@ def join_execute(cl, cr, join, **kwargs):
     return c
 
 
-def addfields_execute(c, addfields={}, **kwargs):
-    r = c()
+def hash_join_execute(cl, cr, join, lkey, rkey, build='right', residual=None, params=None, **kwargs):
+    cl, cr = join_sides(cl, cr, params, **kwargs)
+    if build == 'left':
+        index = HashIndex(lkey, rkey)
+    else:
+        index = HashIndex(rkey, lkey)
+    if residual is not None:
+        residual = bind_params(residual, params)
+    return JoinView(cl, cr, join, index, build, lkey, rkey, residual, kwargs.get('missing'))
+
+
+def band_join_execute(cl, cr, join, build='right', value=None, lower=None, upper=None,
+                      residual=None, params=None, **kwargs):
+    cl, cr = join_sides(cl, cr, params, **kwargs)
+    if lower is None and upper is None:
+        index = ScanIndex()
+    else:
+        index = BandIndex(*(f if f is None else bind_params(f, params) for f in (value, lower, upper)))
+    if residual is not None:
+        residual = bind_params(residual, params)
+    return JoinView(cl, cr, join, index, build, residual=residual, missing=kwargs.get('missing'))
+
+
+def semi_join_execute(c, view, keys=(), fields=(), anti=False, residual=None, strict=False,
+                      params=None, **kwargs):
+    r = c(params=params)
+    keys = [bind_params(f, params) for f in keys]
+    if residual is not None:
+        residual = bind_params(residual, params)
+    return SemiJoinView(r, read_view(view, params), keys, fields, anti, residual, strict)
+
+
+def addfields_execute(c, addfields={}, params=None, **kwargs):
+    r = c(params=params)
     if addfields:
-        r = etl.addfields(r, addfields)
+        r = etl.addfields(r, bind_fields(addfields, params))
     return r
 
 
-def fieldmap_execute(c, fieldmap={}, **kwargs):
-    r = c()
+def fieldmap_execute(c, fieldmap={}, params=None, **kwargs):
+    r = c(params=params)
     if fieldmap:
-        r = etl.fieldmap(r, fieldmap)
+        if params:
+            fieldmap = OrderedDict(bind_fields(fieldmap.items(), params))
+        r = fieldmap_rows(r, fieldmap)
     return r
 
 
-def cut_execute(c, fields=[], **kwargs):
+def cut_execute(c, fields=[], params=None, **kwargs):
     # print("cut:", fields)
-    return etl.cut(c(), *fields)
+    return etl.cut(c(params=params), *fields)
 
 
-def select_execute(c, selector, **kwargs):
-    r = c()
+def select_execute(c, selector, params=None, **kwargs):
+    r = c(params=params)
     if 'addfields' in kwargs:
-        r = etl.addfields(r, kwargs['addfields'])
+        r = etl.addfields(r, bind_fields(kwargs['addfields'], params))
     if selector:
-        r = etl.select(r, selector)
+        r = etl.select(r, bind_params(selector, params))
+    return r
+
+
+def _finalize(states):
+    r = []
+    for state in states:
+        try:
+            r.append(state.finalize() if state is not None else None)
+        except Exception:
+            r.append(None)
     return r
 
 
-def reducer_execute(c, **kwargs):
-    r = c()
+def _reducer(keys, rows, aggregates=(), step=None):
+    if not isinstance(keys, (tuple, list)):
+        keys = [keys]
+    else:
+        keys = list(keys)
+    states = [factory() for factory in aggregates]
+    for rec in rows:
+        step(states, rec)
+    return keys + _finalize(states)
+
+
+def reducer_execute(c, aggregates=[], step=None, params=None, **kwargs):
+    r = c(params=params)
     if 'addfields' in kwargs:
-        r = etl.addfields(r, kwargs['addfields'])
-    kwargs = filter_keys(kwargs, ("key", "reducer", "header"))
-    return etl.rowreduce(r, **kwargs)
+        r = etl.addfields(r, bind_fields(kwargs['addfields'], params))
+    reducer = partial(_reducer, aggregates=aggregates, step=bind_params(step, params))
+    kwargs = filter_keys(kwargs, ("key", "header", "presorted"))
+    return etl.rowreduce(r, reducer=reducer, **kwargs)
+
+
+def partial_aggregate(rows, getkey, factories, step, groups=None):
+    """first phase: accumulator states of the groups of rows by key"""
+    if groups is None:
+        groups = {}
+    for rec in rows:
+        key = getkey(rec)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = [factory() for factory in factories]
+        step(states, rec)
+    return groups
+
+
+def merge_partials(partials):
+    """second phase: the groups of partial aggregations combined; needs
+    mergeable accumulators unless every key is in one partial only"""
+    partials = iter(partials)
+    groups = next(partials, {})
+    for other in partials:
+        for key, states in other.items():
+            mine = groups.get(key)
+            if mine is None:
+                groups[key] = states
+                continue
+            for i, state in enumerate(states):
+                if mine[i] is None or state is None:
+                    # a failed value makes the aggregate null
+                    mine[i] = None
+                else:
+                    mine[i].merge(state)
+    return groups
+
+
+def dump_partial(groups):
+    """picklable form of partial_aggregate groups"""
+    return {key: [None if state is None else state.state() for state in states]
+            for key, states in groups.items()}
+
+
+def load_partial(data, factories):
+    return {key: [None if state is None else factory.restore(state)
+                  for factory, state in zip(factories, states)]
+            for key, states in data.items()}
+
+
+def final_aggregate(groups, single):
+    """rows of groups: the key fields, then the aggregates"""
+    for key, states in groups.items():
+        yield tuple(([key] if single else list(key)) + _finalize(states))
+
+
+class HashAggregateView(etl.Table):
+    """groups of rows aggregated in one pass without sorting; groups come
+    in the order their keys first appear, each keeps one accumulator per
+    aggregate"""
+    def __init__(self, source, key, header, aggregates, step, mergeable=False):
+        self.source = source
+        self.key = key
+        self.header = tuple(header)
+        self.aggregates = aggregates
+        self.step = step
+        self.mergeable = mergeable
+
+    def __iter__(self):
+        yield self.header
+        it = iter(self.source)
+        try:
+            fields = list(next(it))
+        except StopIteration:
+            return
+        getkey = itemgetter(*[fields.index(k) for k in self.key])
+        groups = partial_aggregate(it, getkey, self.aggregates, self.step)
+        yield from final_aggregate(groups, len(self.key) == 1)
+
+
+def hash_aggregate_execute(c, key, header, aggregates, step, params=None, mergeable=False, **kwargs):
+    r = c(params=params)
+    if 'addfields' in kwargs:
+        r = etl.addfields(r, bind_fields(kwargs['addfields'], params))
+    return HashAggregateView(r, key, header, aggregates, bind_params(step, params), mergeable)
+
+
+class AggregateView(etl.Table):
+    """aggregates of all rows, stepped as the rows are read"""
+    def __init__(self, source, header, aggregates, step):
+        self.source = source
+        self.header = tuple(header)
+        self.aggregates = aggregates
+        self.step = step
+
+    def __iter__(self):
+        yield self.header
+        states = [factory() for factory in self.aggregates]
+        step = self.step
+        for rec in etl.data(self.source):
+            step(states, rec)
+        yield tuple(state.finalize() for state in states)
+
+
+def aggregate_execute(c, header, aggregates, step, params=None, **kwargs):
+    return AggregateView(c(params=params), header, aggregates, bind_params(step, params))
+
+
+def limit_value(value, params=None):
+    """LIMIT or OFFSET value, which may be a statement parameter"""
+    if isinstance(value, Param):
+        value = (params or {}).get(value.id)
+    if value is not None and (not isinstance(value, int) or value < 0):
+        raise SQLError("LIMIT and OFFSET take non-negative integers, not {!r}".format(value))
+    return value
+
+
+class LimitView(etl.Table):
+    """count rows of source after the first offset ones; stops reading
+    and closes the source as soon as it has them"""
+    def __init__(self, source, count=None, offset=None):
+        self.source = source
+        self.count = count
+        self.offset = offset or 0
+
+    def __iter__(self):
+        it = iter(self.source)
+        try:
+            try:
+                yield next(it)
+            except StopIteration:
+                return
+            stop = None if self.count is None else self.offset + self.count
+            yield from islice(it, self.offset, stop)
+        finally:
+            # lets generators upstream release files and database cursors
+            close = getattr(it, 'close', None)
+            if close is not None:
+                close()
+
 
+def limit_execute(c, count=None, offset=None, params=None, **kwargs):
+    return LimitView(c(params=params), limit_value(count, params), limit_value(offset, params))
 
-def _global_reducer(rows, aggragates=[]):
-    return [f(rows) for f in aggragates]
 
+class TopView(etl.Table):
+    """the rows ORDER BY ... LIMIT keeps, selected with a heap of
+    offset + count rows instead of sorting all of them"""
+    def __init__(self, source, key, reverse=False, count=0, offset=None):
+        self.source = source
+        self.key = key
+        self.reverse = reverse
+        self.count = count
+        self.offset = offset or 0
 
-def aggregate_execute(c, header, aggregates, **kwargs):
-    rows = list(iter(etl.namedtuples(c())))
-    data =[f(rows) for f in aggregates]
-    return etl.wrap([header, data])
+    def __iter__(self):
+        it = iter(self.source)
+        try:
+            header = tuple(next(it))
+        except StopIteration:
+            return
+        yield header
+        key = comparable_itemgetter(*[header.index(k) for k in self.key])
+        # both keep equal rows in input order, as a stable sort does
+        select = heapq.nlargest if self.reverse else heapq.nsmallest
+        yield from select(self.offset + self.count, it, key=key)[self.offset:]
 
 
-def sort_execute(c, **kwargs):
-    r = c()
+def sort_execute(c, params=None, **kwargs):
+    r = c(params=params)
     if 'addfields' in kwargs:
-        r = etl.addfields(r, kwargs['addfields'])
-    kwargs = filter_keys(kwargs, ("key", "reverse"))
+        r = etl.addfields(r, bind_fields(kwargs['addfields'], params))
+    if 'limit' in kwargs:
+        count, offset = (limit_value(v, params) for v in kwargs['limit'])
+        return TopView(r, kwargs['key'], kwargs.get('reverse', False), count, offset)
+    if kwargs.get('memory'):
+        return ExternalSortView(r, kwargs['key'], kwargs.get('reverse', False),
+                                kwargs['memory'], kwargs.get('tempdir'))
+    kwargs = filter_keys(kwargs, ("key", "reverse", "tempdir"))
     r = etl.sort(r, **kwargs)
     return r
 
 
-def distinct_execute(c, **kwargs):
-    return etl.distinct(c())
+def distinct_execute(c, params=None, **kwargs):
+    return etl.distinct(c(params=params))
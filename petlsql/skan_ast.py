@@ -1,5 +1,6 @@
 from .sql.ast import *
 from functools import singledispatch
+from .pushdown import conjuncts
 
 @Walker
 def skan_ast(tree, *args, **kwargs):
@@ -28,10 +29,15 @@ def _(ast, compiler, **kwargs):
     # print("table:", ast, type(ast.tblname))
     tblname = ast.tblname
     compiler.tables.append(ast)
-    root = compiler.ast
-    if root.withcontext and root.withcontext.hasView(tblname):
-        ast.setView(root.withcontext.getView(tblname))
-    elif compiler.db.hasView(tblname):
+    # WITH views of the statement or of the ones it is a subquery of
+    c = compiler
+    while c is not None:
+        root = c.ast
+        if root.withcontext and root.withcontext.hasView(tblname):
+            ast.setView(root.withcontext.getView(tblname))
+            return
+        c = c.parent
+    if compiler.db.hasView(tblname):
         ast.setView(compiler.db.getView(tblname))
     else:
         raise Exception(f"{tblname}: Unknown table")
@@ -78,16 +84,50 @@ def _(ast, context, compiler, **kwargs):
 
 
 @scan.register(JoinCondition)
-def _(ast, compiler, context, **kwargs):
-    try:
-        lkeys, rkeys = collect_eq_condition(ast.cond)
-        lkeys = compiler.find_vars(context.source1, lkeys)
-        rkeys = compiler.find_vars(context.source2, rkeys)
-        ast.keys = lkeys, rkeys
-        # print("cond|", ast.keys)
-    except _StopException as e:
-        print("!!!", e)
-        raise NotImplementedError("join on condition must be AND =")
+def _(ast, stop, **kwargs):
+    stop.post_proc = post_condition
+
+
+def post_condition(ast, aggregates, context, **kwargs):
+    """split the ON condition, its identifiers resolved, into the keys of
+    the join, filters of either side and the residual condition"""
+    left, right = source_tables(context.source1), source_tables(context.source2)
+    lkeys, rkeys = [], []
+    lfilters, rfilters = ast.filters
+    # the rows of a side that is padded with NULLs can be filtered before
+    # the join, the rows of a side that is kept whole can not
+    lfilter = context.jointype in (Join.INNER, Join.RIGHT)
+    rfilter = context.jointype in (Join.INNER, Join.LEFT)
+    for cond in conjuncts(ast.cond):
+        tables = tables_read(cond)
+        if tables and tables <= left and lfilter:
+            lfilters.append(cond)
+        elif tables and tables <= right and rfilter:
+            rfilters.append(cond)
+        elif isinstance(cond, CompareExpr) and cond.op == "==":
+            l, r = tables_read(cond.arg1), tables_read(cond.arg2)
+            if l and l <= right and r and r <= left:
+                cond.arg1, cond.arg2 = cond.arg2, cond.arg1
+                l, r = r, l
+            if l and l <= left and r and r <= right:
+                lkeys.append(join_key(cond.arg1))
+                rkeys.append(join_key(cond.arg2))
+            else:
+                ast.residual.append(cond)
+        else:
+            ast.residual.append(cond)
+    ast.keys = lkeys, rkeys
+    return ast, aggregates
+
+
+def join_key(ast):
+    """a key of a join: a column, or an expression computed into a field
+    of the rows of its side"""
+    while isinstance(ast, BracesExpr):
+        ast = ast.arg
+    if isinstance(ast, Column):
+        return ast
+    return Var(None, ast)
 
 
 @scan.register(Identifier)
@@ -162,26 +202,3 @@ def post_group(ast, aggregates, compiler, **kwargs):
                 vars.append(v)
     ast.vars = vars
     return ast, aggregates
-
-
-class _StopException(Exception):
-    pass
-
-
-@Walker
-def collect_equal_conditions(tree, collect, **kw):
-    # print(".>", type(tree), tree)
-    if isinstance(tree, ConditionExpr):
-        if tree.op != "and":
-            raise _StopException("not and")
-    elif isinstance(tree, CompareExpr):
-        if tree.op != "==":
-            raise _StopException("not eq: {}".format(tree.op))
-        collect((tree.arg1, tree.arg2))
-    elif isinstance(tree, Negation):
-        raise _StopException("Negation")
-
-
-def collect_eq_condition(cond):
-    r = collect_equal_conditions.collect(cond)
-    return list(zip(*r))
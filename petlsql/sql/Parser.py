@@ -77,7 +77,7 @@ class Parser( object ):
    _integer = 4
    _float = 5
    _string = 6
-   maxT = 104
+   maxT = 108
 
    T          = True
    x          = False
@@ -236,7 +236,7 @@ class Parser( object ):
       elif self.StartOf(1):
          self.selectList()
       else:
-         self.SynErr(105)
+         self.SynErr(109)
       self.Expect(14)
       tbl = self.tableRefList()
       val.source = tbl 
@@ -252,6 +252,8 @@ class Parser( object ):
          self.Get( )
          self.Expect(17)
          self.orderList()
+      if (self.la.kind == 104 or self.la.kind == 105 or self.la.kind == 106):
+         self.limitClause()
       self.context = oldcontext 
       return val
 
@@ -264,7 +266,7 @@ class Parser( object ):
          self.Get( )
          id = self.getCasesensitiveTokenValue(self.token)[1:] 
       else:
-         self.SynErr(106)
+         self.SynErr(110)
       return id
 
    def setQuantifier( self ):
@@ -275,7 +277,7 @@ class Parser( object ):
          self.Get( )
          distinct = False 
       else:
-         self.SynErr(107)
+         self.SynErr(111)
       return distinct
 
    def selectList( self ):
@@ -290,6 +292,7 @@ class Parser( object ):
       val = self.tableReference()
       while self.StartOf(2):
          if self.StartOf(3):
+            joinType = ast.Join.INNER 
             if (self.StartOf(4)):
                if self.la.kind == 28:
                   self.Get( )
@@ -306,7 +309,7 @@ class Parser( object ):
                         self.Get( )
                      joinType = ast.Join.FULL 
                   else:
-                     self.SynErr(108)
+                     self.SynErr(112)
             self.Get( )
             t = self.tableReference()
             join = self.joinSpecification()
@@ -346,6 +349,51 @@ class Parser( object ):
             desc = True 
       self.context.set_order_by(vars, desc) 
 
+   def limitClause( self ):
+      count, offset = None, None 
+      if self.la.kind == 104:
+         self.Get( )
+         count = self.rowCount()
+         if (self.la.kind == 105):
+            self.Get( )
+            offset = self.rowCount()
+      elif self.la.kind == 105:
+         self.Get( )
+         offset = self.rowCount()
+         if (self.la.kind == 1):
+            self.Word(("row", "rows"))
+         if (self.la.kind == 106):
+            count = self.fetchFirst()
+      elif self.la.kind == 106:
+         count = self.fetchFirst()
+      else:
+         self.SynErr(135)
+      self.context.set_limit(count, offset) 
+
+   def fetchFirst( self ):
+      count = 1 
+      self.Expect(106)
+      self.Word(("first", "next"))
+      if (self.la.kind == 3 or self.la.kind == 4):
+         count = self.rowCount()
+      self.Word(("row", "rows"))
+      self.Word(("only",))
+      return count
+
+   def rowCount( self ):
+      val = None 
+      if self.la.kind == 4:
+         val = self.Int()
+      elif self.la.kind == 3:
+         val = self.SQLParameter()
+      else:
+         self.SynErr(136)
+      return val
+
+   def Word( self, words ):
+      self.Expect(1)
+      if self.token.val.lower() not in words: self.SemErr("{} expected".format(' or '.join(words))) 
+
    def selectItem( self ):
       id,val = None,None 
       if self.StartOf(5):
@@ -353,7 +401,7 @@ class Parser( object ):
       elif self.StartOf(6):
          val = self.aggregateFunction()
       else:
-         self.SynErr(109)
+         self.SynErr(113)
       if (self.la.kind == 8):
          self.Get( )
          id = self.NameOrStr()
@@ -382,7 +430,7 @@ class Parser( object ):
             self.Get( )
             val = float(self.token.val) 
          else:
-            self.SynErr(110)
+            self.SynErr(114)
          val = sign * val 
       elif self.la.kind == 6:
          val = self.String()
@@ -402,12 +450,12 @@ class Parser( object ):
             val = self.valueExpr()
             val = ast.BracesExpr(val) 
          else:
-            self.SynErr(111)
+            self.SynErr(115)
          self.Expect(10)
       elif self.la.kind == 3:
          val = self.SQLParameter()
       else:
-         self.SynErr(112)
+         self.SynErr(116)
       return val
 
    def aggregateFunction( self ):
@@ -423,7 +471,7 @@ class Parser( object ):
                d = self.setQuantifier()
             val = self.valueLitteral()
          else:
-            self.SynErr(113)
+            self.SynErr(117)
          self.Expect(10)
       elif self.StartOf(10):
          if self.la.kind == 22:
@@ -452,7 +500,7 @@ class Parser( object ):
          val = self.valueList()
          self.Expect(10)
       else:
-         self.SynErr(114)
+         self.SynErr(118)
       val = ast.AggregateFunc(f, d, val) 
       if (self.la.kind == 27):
          cond = self.filterClause()
@@ -466,7 +514,7 @@ class Parser( object ):
       elif self.la.kind == 6:
          id = self.String()
       else:
-         self.SynErr(115)
+         self.SynErr(119)
       return id
 
    def valueList( self ):
@@ -496,7 +544,7 @@ class Parser( object ):
       elif self.la.kind == 6:
          tblname = self.String()
       else:
-         self.SynErr(116)
+         self.SynErr(120)
       if (self.la.kind == 8):
          self.Get( )
          id = self.Ident()
@@ -516,7 +564,7 @@ class Parser( object ):
          self.Expect(10)
          val = ast.JoinUsing(columns) 
       else:
-         self.SynErr(117)
+         self.SynErr(121)
       return val
 
    def NameList( self ):
@@ -557,9 +605,18 @@ class Parser( object ):
       return val
 
    def primaryCondition( self ):
-      val = self.valueLitteral()
-      if (self.StartOf(11)):
-         val = self.compareOperand(val)
+      if self.la.kind == 107:
+         self.Get( )
+         self.Expect(9)
+         q = self.sqlselect()
+         self.Expect(10)
+         val = ast.Exists(q) 
+      elif self.StartOf(5):
+         val = self.valueLitteral()
+         if (self.StartOf(11)):
+            val = self.compareOperand(val)
+      else:
+         self.SynErr(137)
       return val
 
    def compareOperand( self, arg ):
@@ -593,7 +650,7 @@ class Parser( object ):
             val = self.valueLitteral()
             val = ast.StartingExpr(arg, val, is_true) 
          else:
-            self.SynErr(118)
+            self.SynErr(122)
       elif self.StartOf(13):
          val = self.compareExpr(arg)
       elif self.la.kind == 46:
@@ -609,9 +666,9 @@ class Parser( object ):
          elif self.StartOf(14):
             val = self.truthValue(is_true, arg)
          else:
-            self.SynErr(119)
+            self.SynErr(123)
       else:
-         self.SynErr(120)
+         self.SynErr(124)
       return val
 
    def betweenExpr( self, arg, is_true ):
@@ -649,9 +706,10 @@ class Parser( object ):
 
          val = ast.InExpr(arg, is_true, vals) 
       elif self.la.kind == 12:
-         self.selectColumnList()
+         q = self.selectColumnList()
+         val = ast.InSubquery(arg, is_true, q) 
       else:
-         self.SynErr(121)
+         self.SynErr(125)
       return val
 
    def compareExpr( self, arg ):
@@ -672,7 +730,7 @@ class Parser( object ):
          self.Get( )
          op = '!=' 
       else:
-         self.SynErr(122)
+         self.SynErr(126)
       if self.StartOf(5):
          v = self.valueLitteral()
          val = ast.CompareExpr(op, arg,v) 
@@ -685,7 +743,7 @@ class Parser( object ):
          val = self.sqlselect()
          self.Expect(10)
       else:
-         self.SynErr(123)
+         self.SynErr(127)
       return val
 
    def truthValue( self, is_true, arg ):
@@ -701,12 +759,13 @@ class Parser( object ):
       elif self.la.kind == 50:
          self.Get( )
       else:
-         self.SynErr(124)
+         self.SynErr(128)
       val = ast.Check(arg,is_true, v) 
       return val
 
    def selectColumnList( self ):
       val = self.sqlselect()
+      return val
 
    def nameList( self ):
       val = [] 
@@ -806,7 +865,7 @@ class Parser( object ):
             args.append(l) 
          self.Expect(10)
       else:
-         self.SynErr(125)
+         self.SynErr(129)
       val = ast.SQLFunction(id, args) 
       return val
 
@@ -866,7 +925,7 @@ class Parser( object ):
          self.Get( )
          val = "DATETIME" 
       else:
-         self.SynErr(126)
+         self.SynErr(130)
       return val
 
    def procedureArgs( self ):
@@ -892,7 +951,7 @@ class Parser( object ):
          self.Get( )
          val = False 
       else:
-         self.SynErr(127)
+         self.SynErr(131)
       return val
 
    def caseExpr( self ):
@@ -901,7 +960,7 @@ class Parser( object ):
       elif self.la.kind == 83:
          val = self.searchedCase()
       else:
-         self.SynErr(128)
+         self.SynErr(132)
       if (self.la.kind == 82):
          self.Get( )
          elval = self.caseresult()
@@ -947,7 +1006,7 @@ class Parser( object ):
       elif self.la.kind == 50:
          self.Get( )
       else:
-         self.SynErr(129)
+         self.SynErr(133)
       return val
 
    def simpleCase( self, cases ):
@@ -956,7 +1015,7 @@ class Parser( object ):
       elif self.StartOf(11):
          ifv = self.compareOperand(None)
       else:
-         self.SynErr(130)
+         self.SynErr(134)
       self.Expect(84)
       thenv = self.caseresult()
       cases.append(ast.SimpleCase(ifv, thenv))  
@@ -999,23 +1058,23 @@ class Parser( object ):
 
 
    set = [
-      [T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,x, x,T,T,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,T,T,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,T, T,T,T,x, x,x,x,x, x,x,T,T, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,T, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x],
-      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x]
+      [T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,x, x,T,T,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,T,T,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,T,T,T, T,T,T,x, x,T,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, T,T,T,T, T,T,T,T, x,x,x,T, x,x,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,T, T,T,T,x, x,x,x,x, x,x,T,T, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,x,T, T,T,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,T,T, T,T,T,T, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x],
+      [x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x, x,x,x,T, T,T,T,T, T,x,x,x, x,x,x,x, x,x,x,x, x,x,x,x,x,x]
 
       ]
 
@@ -1125,33 +1184,40 @@ class Parser( object ):
       101 : "\"/\" expected",
       102 : "\"%\" expected",
       103 : "\".\" expected",
-      104 : "??? expected",
-      105 : "invalid sqlselect",
-      106 : "invalid Ident",
-      107 : "invalid setQuantifier",
-      108 : "invalid tableRefList",
-      109 : "invalid selectItem",
-      110 : "invalid valueLitteral",
-      111 : "invalid valueLitteral",
-      112 : "invalid valueLitteral",
-      113 : "invalid aggregateFunction",
-      114 : "invalid aggregateFunction",
-      115 : "invalid NameOrStr",
-      116 : "invalid tableReference",
-      117 : "invalid joinSpecification",
-      118 : "invalid compareOperand",
-      119 : "invalid compareOperand",
-      120 : "invalid compareOperand",
-      121 : "invalid inExpr",
-      122 : "invalid compareExpr",
-      123 : "invalid compareExpr",
-      124 : "invalid truthValue",
-      125 : "invalid standartFunction",
-      126 : "invalid Type",
-      127 : "invalid BoolLiteral",
-      128 : "invalid caseExpr",
-      129 : "invalid caseresult",
-      130 : "invalid simpleCase",
+      104 : "\"limit\" expected",
+      105 : "\"offset\" expected",
+      106 : "\"fetch\" expected",
+      107 : "\"exists\" expected",
+      108 : "??? expected",
+      109 : "invalid sqlselect",
+      110 : "invalid Ident",
+      111 : "invalid setQuantifier",
+      112 : "invalid tableRefList",
+      113 : "invalid selectItem",
+      114 : "invalid valueLitteral",
+      115 : "invalid valueLitteral",
+      116 : "invalid valueLitteral",
+      117 : "invalid aggregateFunction",
+      118 : "invalid aggregateFunction",
+      119 : "invalid NameOrStr",
+      120 : "invalid tableReference",
+      121 : "invalid joinSpecification",
+      122 : "invalid compareOperand",
+      123 : "invalid compareOperand",
+      124 : "invalid compareOperand",
+      125 : "invalid inExpr",
+      126 : "invalid compareExpr",
+      127 : "invalid compareExpr",
+      128 : "invalid truthValue",
+      129 : "invalid standartFunction",
+      130 : "invalid Type",
+      131 : "invalid BoolLiteral",
+      132 : "invalid caseExpr",
+      133 : "invalid caseresult",
+      134 : "invalid simpleCase",
+      135 : "invalid limitClause",
+      136 : "invalid rowCount",
+      137 : "invalid primaryCondition",
       }
 
 
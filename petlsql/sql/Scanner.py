@@ -91,8 +91,8 @@ class Scanner(object):
    eofSym  = 0
 
    charSetSize = 256
-   maxT = 104
-   noSym = 104
+   maxT = 108
+   noSym = 108
    start = [
      0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
      0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
@@ -373,6 +373,14 @@ class Scanner(object):
          self.t.kind = 98
       elif lit == "datetime":
          self.t.kind = 99
+      elif lit == "limit":
+         self.t.kind = 104
+      elif lit == "offset":
+         self.t.kind = 105
+      elif lit == "fetch":
+         self.t.kind = 106
+      elif lit == "exists":
+         self.t.kind = 107
 
 
    def NextToken( self ):
@@ -93,6 +93,8 @@ class Table:
         self.columns = []
         self.use = {}
         self.rownumber = None
+        # part of WHERE the database evaluates while reading the table
+        self.pushed = None
 
     @property
     def name(self):
@@ -205,12 +207,41 @@ class View:
         self.kwargs = kwargs
         self.f = f
         self._header = None
+        self.params = ()
+        # fields the rows are known to be sorted by
+        self.sortedby = ()
+        # number of rows, or a function estimating it when a plan needs it
+        self.estimated = None
+        # function estimating the number of distinct values of a field
+        self.distinct = None
+        # function of the rows of a full scan collecting their statistics
+        self.collect = None
+        # function reading the rows with worker processes, see read_view
+        self.scan = None
+        # reading the rows waits on a database or a file, a thread can read
+        # them ahead of the statement
+        self.blocking = False
+        # DB the rows are read from, which can filter them
+        self.database = None
+        # some fields can be read without the others: self(columns=[...])
+        self.project = False
 
     def header(self):
         if self._header is None:
             self._header = self().header()
         return self._header
 
+    def estimate(self):
+        """estimated number of rows, None when unknown"""
+        if callable(self.estimated):
+            self.estimated = self.estimated()
+        return self.estimated
+
+    def distinct_values(self, field):
+        """estimated number of distinct values of field, None when unknown"""
+        if self.distinct is not None:
+            return self.distinct(field)
+
     def __call__(self, **kwargs):
         kwargs.update(self.kwargs)
         return etl.wrap(self.f(*self.args, **kwargs))
@@ -246,8 +277,11 @@ class SelectAst:
         self.selector = None
         self.groupby = None
         self.orders = None
+        self.limit = None
         self.f = None
         self.params = {}
+        # EXISTS and IN (subquery) conditions taken out of WHERE
+        self.semijoins = []
 
     def set_header(self, names):
         self.header = names
@@ -266,6 +300,9 @@ class SelectAst:
     def set_order_by(self, vars, desc):
         self.orders = OrderBy(vars, desc)
 
+    def set_limit(self, count, offset):
+        self.limit = Limit(count, offset)
+
     def addParam(self, paramId):
         r = self.params.get(paramId)
         if r is None:
@@ -281,10 +318,11 @@ class SelectAst:
             cols = "DISTINCT "+cols
         return """SELECT {}
         FROM {}
-        {}{}{}
+        {}{}{}{}
         """.format(cols, self.source or "", self.selector or "",
                     self.groupby or "",
-                    self.orders or "")
+                    self.orders or "",
+                    self.limit or "")
 
 
 class WhereAst:
@@ -307,6 +345,10 @@ class JoinCursor:
         self.jointype = joinType
         self.join = join
         self.deps = None
+        # statement the database of all its tables runs for it
+        self.query = None
+        # tables and dropped keys of the joins as written, when reordered
+        self.written = None
         
     def __str__(self):
         return """%s
@@ -325,6 +367,13 @@ class JoinCondition:
 
     def __init__(self,cond):
         self.cond = cond
+        # equal expressions of the left and the right side
+        self.keys = None
+        # conjuncts reading one side only, that filter its rows before the
+        # join: lists for the left and the right side
+        self.filters = [], []
+        # conjuncts evaluated on the joined rows, left fields then right ones
+        self.residual = []
 
     def __str__(self):
         return "ON {}".format(self.cond)
@@ -364,6 +413,19 @@ class OrderBy:
         return "ORDER BY {} {}".format(', '.join(map(str,self.items)), "ASC" if self.asc else "DESC")
 
 
+class Limit:
+    """LIMIT count OFFSET offset; either is an int, a Param or None"""
+    def __init__(self, count, offset=None):
+        self.count = count
+        self.offset = offset
+
+    def __str__(self):
+        r = "LIMIT {}".format(self.count) if self.count is not None else ""
+        if self.offset is not None:
+            r += " OFFSET {}".format(self.offset)
+        return r.strip() + "\n"
+
+
 class BracesExpr:
     _fields = ("arg",)
     def __init__(self, arg):
@@ -411,7 +473,7 @@ class CompareExpr(BinaryExpr):
 
 
 class BetweenExpr:
-    _fields = ("arg", "fromarg", "toarg")
+    _fields = ("args",)
 
     def __init__(self, symmetric, is_true, args):
         self.args = args
@@ -427,6 +489,48 @@ class InExpr:
         self.values = vals
 
 
+class InSubquery:
+    _fields = ("arg", )
+
+    def __init__(self, arg, is_true, select):
+        self.arg = arg
+        self.is_true = is_true
+        self.select = select
+
+    def __str__(self):
+        return "{} {}IN ({})".format(self.arg, "" if self.is_true else "NOT ", " ".join(str(self.select).split()))
+
+
+class Exists:
+    # the subquery is compiled on its own, walkers stop here
+    _fields = ()
+
+    def __init__(self, select):
+        self.select = select
+
+    def __str__(self):
+        return "EXISTS ({})".format(" ".join(str(self.select).split()))
+
+
+class SemiJoin:
+    """rows of a statement that have (anti: have no) matching row in a
+    subquery, for an EXISTS or IN (subquery) condition of its WHERE"""
+    def __init__(self, select, anti=False):
+        self.select = select
+        self.anti = anti
+        # the compiled subquery and its fields
+        self.view = None
+        self.fields = []
+        # expressions of the statement equal to fields of the subquery
+        self.keys = [], []
+        # the first key is the value of IN: NULL matches nothing
+        self.strict = False
+        # conditions on the fields of the statement then of the subquery
+        self.residual = []
+        # columns of the statement the subquery reads
+        self.outer = []
+
+
 class LikeExpr:
     _fields = ("arg", )
     def __init__(self, arg, pat, isre, is_true, esc):
@@ -524,6 +628,26 @@ class Param:
         self.id = id
 
 
+class Constant:
+    """value of an expression evaluated at compile time"""
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class Shared:
+    """expression computed once per row and kept in a local"""
+    def __init__(self, name, value, first):
+        self.name = name
+        self.value = value
+        self.first = first
+
+    def __str__(self):
+        return str(self.value)
+
+
 def is_aggregate(ast):
     try:
         return isinstance(ast, AggregateFunc) \
@@ -711,3 +835,54 @@ class Tree:
         if tree.__class__.__module__ == Walker.__module__:
             result = self.func(tree=tree, children=result, **kw)
         return result
+
+
+@Walker
+def columns_read(tree, collect, **kw):
+    if isinstance(tree, Column):
+        collect(tree)
+
+
+def tables_read(node):
+    """tables whose columns expression node reads"""
+    return {c.table for c in columns_read.collect(node)}
+
+
+def source_tables(source):
+    """tables of a FROM item"""
+    if isinstance(source, JoinCursor):
+        return source_tables(source.source1) | source_tables(source.source2)
+    return {source}
+
+
+def conjunction(conds):
+    """AND of the conditions conds, None when there is none"""
+    if not conds:
+        return
+    if len(conds) == 1:
+        return conds[0]
+    return ConditionExpr('and', list(conds))
+
+
+def unbraced(ast):
+    while isinstance(ast, BracesExpr):
+        ast = ast.arg
+    return ast
+
+
+def subquery(cond):
+    """the EXISTS or IN (subquery) condition cond is, under NOTs and
+    braces, and whether it is negated; None and False for other conditions"""
+    negated = False
+    while True:
+        if isinstance(cond, BracesExpr):
+            cond = cond.arg
+        elif isinstance(cond, Negation):
+            cond, negated = cond.arg, not negated
+        else:
+            break
+    if isinstance(cond, InSubquery):
+        return cond, negated == cond.is_true
+    if isinstance(cond, Exists):
+        return cond, negated
+    return None, False
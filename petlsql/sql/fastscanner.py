@@ -0,0 +1,205 @@
+"""
+Table driven replacement for the generated Coco/R Scanner.
+
+FastScanner produces the same Token stream as Scanner.Scanner (kinds,
+values, positions, lines and columns), but matches whole tokens with
+compiled regular expressions and resolves keywords with a dict instead of
+walking the state machine one character at a time.
+"""
+import re
+from bisect import bisect_left
+
+from .Scanner import Token, Buffer, Scanner
+
+
+__all__ = ("FastScanner", "create_scanner")
+
+
+EOF_CHAR = Buffer.EOF
+
+keywords = {
+    "with": 7, "as": 8, "select": 12, "from": 14, "where": 15, "group": 16,
+    "by": 17, "order": 18, "distinct": 19, "all": 20, "count": 21, "avg": 22,
+    "max": 23, "min": 24, "sum": 25, "list": 26, "filter": 27, "inner": 28,
+    "left": 29, "right": 30, "full": 31, "outer": 32, "join": 33, "on": 34,
+    "using": 35, "or": 36, "and": 37, "not": 38, "between": 39, "like": 40,
+    "similar": 41, "to": 42, "in": 43, "containing": 44, "starting": 45,
+    "is": 46, "true": 47, "false": 48, "unknown": 49, "null": 50,
+    "asymmetric": 51, "symmetric": 52, "escape": 53, "some": 60, "any": 61,
+    "asc": 62, "desc": 63, "row_number": 64, "cast": 65, "nullif": 66,
+    "coalesce": 67, "substring": 68, "upper": 69, "lower": 70, "trim": 71,
+    "leading": 72, "trailing": 73, "both": 74, "overlay": 75, "placing": 76,
+    "for": 77, "case": 80, "end": 81, "else": 82, "when": 83, "then": 84,
+    "character": 85, "char": 86, "numeric": 87, "decimal": 88, "dec": 89,
+    "smallint": 90, "integer": 91, "int": 92, "float": 93, "real": 94,
+    "double": 95, "precision": 96, "boolean": 97, "date": 98, "datetime": 99,
+    "limit": 104, "offset": 105, "fetch": 106, "exists": 107,
+}
+
+# single character tokens
+punctuation = {
+    '(': 9, ')': 10, ',': 11, '*': 13, '=': 54, '+': 78, '-': 79,
+    '%': 102, '.': 103, '/': 101,
+}
+
+# comparison and concatenation operators
+operators = {
+    '<=': 57, '<>': 59, '>=': 58, '||': 100, '<': 55, '>': 56,
+}
+
+_IDENT, _FIXIDENT, _PARAM, _INTEGER, _FLOAT, _STRING = 1, 2, 3, 4, 5, 6
+
+# one token, after any blanks and comments
+_master = re.compile(r"""
+  (?:[ \t\r\n]+|/\*.*?\*/|//(?:[^\n\r]|\r(?=\n))*[\n\r])*
+  (?:
+    (?P<ident>[a-z_][a-z0-9_]*)
+  | (?P<float>[0-9]+\.[0-9]*)
+  | (?P<integer>[0-9]+)
+  | (?P<op><=|<>|>=|\|\||[<>(),*=+\-%.])
+  | (?P<string>'(?:[^'\\\n\r]|\\+(?:[^'\\\n\r]|'))*+'
+              |"(?:[^"\\\n\r]|\\+(?:[^"\\\n\r]|"))*+")
+  | (?P<fixident>\$[a-z_][a-z0-9_]*)
+  | (?P<param>\?[a-z_][a-z0-9_]*)
+  | (?P<comment>/[*/])
+  | (?P<slash>/)
+  | (?P<quote>['"])
+  | (?P<other>.)
+  | (?P<end>\Z)
+  )
+""", re.S | re.X)
+_kinds = dict(float=_FLOAT, integer=_INTEGER, string=_STRING, fixident=_FIXIDENT,
+              param=_PARAM, slash=punctuation['/'], other=Scanner.noSym)
+_eol = re.compile(r"\n|\r(?!\n)")
+# string bodies; a quote right after backslashes does not close the string
+_strings = {
+    "'": re.compile(r"'(?:[^'\\\n\r]|\\+(?:[^'\\\n\r]|'))*+"),
+    '"': re.compile(r'"(?:[^"\\\n\r]|\\+(?:[^"\\\n\r]|"))*+'),
+}
+
+
+def _lower(s):
+    # the generated scanner lowers every character separately
+    if s.isascii():
+        return s.lower()
+    return ''.join([c.lower() for c in s])
+
+
+def _string_end(text, quote, pos):
+    """end of the string token starting at pos and its kind"""
+    end = _strings[quote].match(text, pos).end()
+    stop = end
+    while stop < len(text) and text[stop] == '\\':
+        stop += 1
+    if stop > end:
+        # backslashes before a line break or the end of text
+        return stop, Scanner.noSym
+    if end < len(text) and text[end] == quote:
+        return end + 1, _STRING
+    if end - 1 > pos and text[end - 1] == quote:
+        # an escaped quote may close the string
+        return end, _STRING
+    return end, Scanner.noSym
+
+
+def create_scanner(s):
+    """FastScanner for s, or the generated Scanner for the rare texts the
+    fast one does not reproduce (characters that change length when
+    lowered, or the scanner's EOF character inside the text)"""
+    s = str(s)
+    if EOF_CHAR not in s:
+        text = _lower(s)
+        if len(text) == len(s):
+            return FastScanner(s, text)
+    return Scanner(s)
+
+
+class FastScanner(object):
+    EOL = u'\n'
+    eofSym = 0
+    maxT = Scanner.maxT
+    noSym = Scanner.noSym
+
+    def __init__(self, s, text=None):
+        s = str(s)
+        self.buffer = Buffer(s)
+        self.text = _lower(s) if text is None else text
+        self.eofs = 0
+        self.token = self.pt = Token()
+        self.last = self.token
+        self.tokenize()
+
+    def tokenize(self):
+        """scan the whole text into the linked list of tokens"""
+        text = self.text
+        eols = [m.start() for m in _eol.finditer(text)]
+        symbols = dict(punctuation, **operators)
+        new = Token.__new__
+        last = self.last
+        pos = line = linestart = 0
+        while pos is not None:
+            start, pos = pos, None
+            for m in _master.finditer(text, start):
+                group = m.lastgroup
+                begin, end = m.span(group)
+                if begin != m.start():
+                    line = bisect_left(eols, begin)
+                    linestart = eols[line - 1] + 1 if line else 0
+                if group == 'ident':
+                    kind = keywords.get(m.group(group), _IDENT)
+                elif group == 'op':
+                    kind = symbols[m.group(group)]
+                elif group == 'quote':
+                    end, kind = _string_end(text, m.group(group), begin)
+                    pos = end
+                elif group == 'end' or group == 'comment':
+                    # an unterminated comment runs to the end of text
+                    break
+                else:
+                    kind = _kinds[group]
+                t = last.next = new(Token)
+                t.kind = kind
+                t.pos = begin
+                t.line = line + 1
+                t.col = begin - linestart + 1
+                t.val = text[begin:end]
+                t.next = None
+                last = t
+                if pos is not None:
+                    # restart after a string that does not end at its quote
+                    break
+        self.last = last
+        self.eols = eols
+        self.end = len(text)
+
+    def NextToken(self):
+        # past the end; the generated scanner keeps advancing its position
+        t = Token()
+        t.kind = self.eofSym
+        t.pos = pos = self.end + self.eofs
+        n = bisect_left(self.eols, pos)
+        t.line = n + 1
+        t.col = pos - (self.eols[n - 1] + 1 if n else 0) + 1
+        t.val = EOF_CHAR
+        self.eofs += 1
+        return t
+
+    def Scan(self):
+        if self.token.next is None:
+            self.pt = self.token = self.NextToken()
+        else:
+            self.pt = self.token = self.token.next
+        return self.token
+
+    def Peek(self):
+        if self.pt.next is None:
+            self.pt.next = self.NextToken()
+        self.pt = self.pt.next
+        while self.pt.kind > self.maxT:
+            if self.pt.next is None:
+                self.pt.next = self.NextToken()
+            self.pt = self.pt.next
+        return self.pt
+
+    def ResetPeek(self):
+        self.pt = self.token
@@ -1,3 +1,6 @@
+from . import Aggregator
+
+
 
 def LTRIM(s, chars=None):
     if isinstance(s, (str, bytes)):
@@ -84,6 +87,13 @@ def CHECKNOT(rec, f, val):
         return False
 
 
+def TRY(rec, f):
+    try:
+        return f(rec)
+    except Exception:
+        return None
+
+
 def OVERLAY(value, rep, p, l=None):
     if value is not None and rep is not None:
         p -= 1
@@ -148,6 +158,133 @@ def LIST_DISTINCT(values):
     return list(set(filter(None, values)))
 
 
+# accumulators of the aggregates above, for aggregation that steps the
+# values of a group one at a time instead of collecting them in a list;
+# all of them merge, Avg keeps a (total, count) pair for that
+
+class Count(Aggregator):
+    def __init__(self):
+        self.count = 0
+
+    def step(self, value):
+        if value:
+            self.count += 1
+
+    def merge(self, other):
+        self.count += other.count
+
+    def finalize(self):
+        return self.count
+
+
+class CountAll(Count):
+    """COUNT(*), every row counts"""
+    def step(self, value):
+        self.count += 1
+
+
+class Distinct(Aggregator):
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value:
+            self.values.add(value)
+
+    def merge(self, other):
+        self.values |= other.values
+
+
+class CountDistinct(Distinct):
+    def finalize(self):
+        return len(self.values)
+
+
+class Min(Aggregator):
+    def __init__(self):
+        self.value = None
+
+    def step(self, value):
+        if value and (self.value is None or value < self.value):
+            self.value = value
+
+    def merge(self, other):
+        self.step(other.value)
+
+    def finalize(self):
+        return self.value
+
+
+class Max(Min):
+    def step(self, value):
+        if value and (self.value is None or value > self.value):
+            self.value = value
+
+
+class Sum(Aggregator):
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def step(self, value):
+        if value:
+            self.total += value
+            self.count += 1
+
+    def merge(self, other):
+        self.total += other.total
+        self.count += other.count
+
+    def finalize(self):
+        if self.count:
+            return self.total
+
+
+class SumDistinct(Distinct):
+    def finalize(self):
+        if self.values:
+            return sum(self.values)
+
+
+class Avg(Sum):
+    def finalize(self):
+        if self.count:
+            return self.total/self.count
+
+
+class AvgDistinct(Distinct):
+    def finalize(self):
+        if self.values:
+            return sum(self.values)/len(self.values)
+
+
+class List(Aggregator):
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value:
+            self.values.append(value)
+
+    def merge(self, other):
+        self.values.extend(other.values)
+
+    def finalize(self):
+        return self.values
+
+
+class ListDistinct(Distinct):
+    def finalize(self):
+        return list(self.values)
+
+
+accumulators = dict(
+    COUNT=Count, COUNT_DISTINCT=CountDistinct, MIN=Min, MAX=Max,
+    MIN_DISTINCT=Min, MAX_DISTINCT=Max, SUM=Sum, SUM_DISTINCT=SumDistinct,
+    AVG=Avg, AVG_DISTINCT=AvgDistinct, LIST=List, LIST_DISTINCT=ListDistinct,
+)
+
+
 def AGGREGATOR(cls, values):
     r = cls()
     for i in values:
@@ -185,14 +322,31 @@ def NOTIN(arg, *values):
         return arg not in values
 
 
+def INSET(arg, values):
+    if arg is not None:
+        try:
+            return arg in values
+        except TypeError:
+            # unhashable values, as lists read from yaml, are compared one by one
+            return any(arg == v for v in values)
+
+
+def NOTINSET(arg, values):
+    if arg is not None:
+        try:
+            return arg not in values
+        except TypeError:
+            return not any(arg == v for v in values)
+
+
 def CONTAINS(arg, s):
     if arg is not None:
-        return arg.find(s) != -1
+        return s in arg
 
 
 def NOTCONTAINS(arg, s):
     if arg is not None:
-        return arg.find(s) == -1
+        return s not in arg
 
 
 def STARTSWITH(arg, s):
@@ -205,6 +359,36 @@ def NOTSTARTSWITH(arg, s):
         return not arg.startswith(s)
 
 
+def ENDSWITH(arg, s):
+    if arg is not None:
+        return arg.endswith(s)
+
+
+def NOTENDSWITH(arg, s):
+    if arg is not None:
+        return not arg.endswith(s)
+
+
+def STARTSENDS(arg, prefix, suffix):
+    if arg is not None:
+        return len(arg) >= len(prefix) + len(suffix) and arg.startswith(prefix) and arg.endswith(suffix)
+
+
+def NOTSTARTSENDS(arg, prefix, suffix):
+    if arg is not None:
+        return not STARTSENDS(arg, prefix, suffix)
+
+
+def EQUALS(arg, s):
+    if arg is not None:
+        return arg == s
+
+
+def NOTEQUALS(arg, s):
+    if arg is not None:
+        return arg != s
+
+
 def DISTINCTFROM(A, B):
     return A != B
 
@@ -3,9 +3,17 @@ from .virtdb import DB, VirtualDB, path_from_url
 
 
 class SqliteDB(DB):
+    distinct = 'IS NOT'
+    same = '{0} IS {1}'
+    outer_joins = sqlite3.sqlite_version_info >= (3, 39)
+    # NULLIF compares without converting, text '0' stays
+    nonfalsy = "NULLIF(NULLIF({}, 0), '')"
+    exact_like = False
+
     def create_connection(self, url, config=None):
         _, dbname, query = path_from_url(url)
-        return sqlite3.connect(self.dbname)
+        # rows may be read by a prefetch thread
+        return sqlite3.connect(dbname, check_same_thread=False)
 
     def extractcursor(self, conn):
         return conn.cursor()
@@ -18,7 +26,37 @@ class SqliteDB(DB):
         rs = c.execute("SELECT name FROM sqlite_master WHERE type ='table' AND name NOT LIKE 'sqlite_%'")
         return set([r[0] for r in rs])
 
-
-VirtualDB.register_db_driver('sqlite', SqliteDB)
+    def estimate(self, path):
+        """rows of table path when ANALYZE recorded them in sqlite_stat1"""
+        c = self.conn.cursor()
+        try:
+            rs = c.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (path,)).fetchall()
+        except sqlite3.OperationalError:
+            # never analyzed: no sqlite_stat1
+            return None
+        # the first number of each entry is the rows of the table
+        return max((int(stat.split()[0]) for stat, in rs), default=None)
+
+    def _column_types(self, path):
+        c = self.conn.cursor()
+        rs = c.execute("SELECT name, type FROM pragma_table_info(?)", (path,))
+        return {name: _affinity_types(decl) for name, decl in rs}
+
+
+def _affinity_types(decl):
+    """types of the values a column declared decl compares with unconverted,
+    by the affinity sqlite gives it"""
+    decl = (decl or '').upper()
+    if 'INT' in decl:
+        return (int, float)
+    if any(t in decl for t in ('CHAR', 'CLOB', 'TEXT')):
+        # TEXT converts numbers to text
+        return (str,)
+    if not decl or 'BLOB' in decl:
+        # no affinity: nothing is converted
+        return (str, int, float)
+    # REAL and NUMERIC convert text that looks like a number
+    return (int, float)
 
 
+VirtualDB.register_db_driver('sqlite', SqliteDB)
@@ -0,0 +1,367 @@
+"""
+Statistics of the rows of views.
+
+A view's statistics are its number of rows and, per field, the fraction
+of NULLs, the least and greatest values and the number of distinct values.
+They are collected by reading all the rows of the view: on demand, by
+VirtualDB.analyze, or as a side effect of a query reading it whole. The
+distinct values are counted approximately, by a HyperLogLog sketch of 16 KB
+a field whatever their number.
+
+A Catalog holds the statistics of the views of a VirtualDB by the key of
+their source. Those of files are also stored next to them, in a .stats
+file of JSON, and stay valid while the file keeps its modification time
+and size. The least and greatest values are stored only when JSON holds
+them as they are (strings, numbers and booleans); the others read back as
+unknown.
+The planner reads them through the estimated and distinct hooks of the
+views.
+"""
+import os
+import json
+import math
+import tempfile
+from pathlib import Path
+from functools import partial
+
+import petl as etl
+
+
+__all__ = ("HyperLogLog", "ColumnStats", "TableStats", "Collector", "collect",
+           "StatsView", "Catalog")
+
+
+# bumped whenever the stored statistics change, so older files are ignored
+FORMAT = 2
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(h):
+    """64 well spread bits of the hash h (the splitmix64 finalizer): hash()
+    of an int is the int itself"""
+    h &= _MASK
+    h = (h ^ (h >> 30)) * 0xbf58476d1ce4e5b9 & _MASK
+    h = (h ^ (h >> 27)) * 0x94d049bb133111eb & _MASK
+    return h ^ (h >> 31)
+
+
+class HyperLogLog:
+    """approximate number of distinct values added: the hash of a value
+    picks one of 2**p registers, which keeps the longest run of leading
+    zero bits of the rest of the hashes it was picked by. The standard
+    error is 1.04 / sqrt(2**p), 0.8% for p=14"""
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, value):
+        try:
+            h = hash(value)
+        except TypeError:
+            h = hash(repr(value))
+        x = _mix(h)
+        p = self.p
+        j = x & ((1 << p) - 1)
+        rank = 65 - p - (x >> p).bit_length()
+        if rank > self.registers[j]:
+            self.registers[j] = rank
+
+    def update(self, other):
+        """add the values added to other, a sketch of the same p"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        e = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if zeros:
+            # few values: counting the empty registers is the better
+            # estimate up to about 0.7 m, where e is still biased up
+            linear = m * math.log(m / zeros)
+            if linear <= 0.7 * m:
+                e = linear
+        return int(round(e))
+
+    def __len__(self):
+        return self.count()
+
+
+class ColumnStats:
+    """statistics of the values of a field: the fraction of NULLs, the least
+    and greatest values (None when the values do not compare) and the
+    estimated number of distinct values but NULL"""
+    __slots__ = ("nulls", "min", "max", "distinct")
+
+    def __init__(self, nulls=0.0, min=None, max=None, distinct=0):
+        self.nulls = nulls
+        self.min = min
+        self.max = max
+        self.distinct = distinct
+
+    def __repr__(self):
+        return "ColumnStats(nulls={:.3f}, min={!r}, max={!r}, distinct={})".format(
+            self.nulls, self.min, self.max, self.distinct)
+
+
+class TableStats:
+    """statistics of the rows of a view: their number and the statistics of
+    its fields by name"""
+    def __init__(self, rows, columns=None):
+        self.rows = rows
+        self.columns = dict(columns or {})
+
+    def distinct(self, field):
+        """estimated number of distinct values of field, None when unknown"""
+        column = self.columns.get(field)
+        if column is not None:
+            return column.distinct
+
+    def null_fraction(self, field):
+        column = self.columns.get(field)
+        if column is not None:
+            return column.nulls
+
+    def update(self, other):
+        """take the row count and field statistics of other, collected later
+        from the same rows, keeping those of the fields it has not"""
+        self.rows = other.rows
+        self.columns.update(other.columns)
+
+    def __repr__(self):
+        return "TableStats(rows={}, columns={!r})".format(self.rows, self.columns)
+
+
+class Collector:
+    """statistics of the rows added, which have the fields header"""
+    def __init__(self, header):
+        self.fields = tuple(header)
+        n = len(self.fields)
+        self.rows = 0
+        self.values = [0] * n
+        self.low = [None] * n
+        self.high = [None] * n
+        self.ordered = [True] * n
+        self.sketches = [HyperLogLog() for _ in range(n)]
+
+    def add(self, row):
+        self.rows += 1
+        values, low, high, ordered, sketches = self.values, self.low, self.high, self.ordered, self.sketches
+        # short rows lack their last values, counted as NULLs
+        for i, v in zip(range(len(values)), row):
+            if v is None:
+                continue
+            values[i] += 1
+            sketches[i].add(v)
+            if ordered[i]:
+                try:
+                    if low[i] is None or v < low[i]:
+                        low[i] = v
+                    if high[i] is None or v > high[i]:
+                        high[i] = v
+                except TypeError:
+                    ordered[i] = False
+                    low[i] = high[i] = None
+
+    def result(self):
+        rows = self.rows
+        columns = {}
+        for i, name in enumerate(self.fields):
+            nulls = (rows - self.values[i]) / rows if rows else 0.0
+            distinct = self.sketches[i].count() if self.values[i] else 0
+            # the sketch may overshoot a small count
+            columns[name] = ColumnStats(nulls, self.low[i], self.high[i], min(distinct, self.values[i]))
+        return TableStats(rows, columns)
+
+
+def collect(table):
+    """statistics of the rows of table, all read"""
+    it = iter(table)
+    try:
+        header = next(it)
+    except StopIteration:
+        return TableStats(0)
+    collector = Collector(header)
+    add = collector.add
+    for row in it:
+        add(row)
+    return collector.result()
+
+
+class StatsView(etl.Table):
+    """rows of source, their statistics given to record once all are read,
+    unless known(header) tells they are known already"""
+    def __init__(self, source, record, known):
+        self.source = source
+        self.record = record
+        self.known = known
+
+    def __iter__(self):
+        it = iter(self.source)
+        try:
+            header = next(it)
+        except StopIteration:
+            return
+        yield header
+        if self.known(header):
+            yield from it
+            return
+        collector = Collector(header)
+        add = collector.add
+        for row in it:
+            add(row)
+            yield row
+        # not reached when the reader stops before the last row
+        self.record(collector.result())
+
+
+def stats_path(path):
+    return path.with_name(path.name + '.stats')
+
+
+def _stored(value):
+    """value when JSON stores and loads it unchanged, else None"""
+    if type(value) in (str, int, bool):
+        return value
+    if type(value) is float and math.isfinite(value):
+        return value
+
+
+def dump_stats(sig, stats):
+    """the JSON document of the statistics stats of a file of signature sig"""
+    columns = [dict(name=name, nulls=c.nulls, distinct=c.distinct, min=_stored(c.min), max=_stored(c.max))
+               for name, c in stats.columns.items() if type(name) is str]
+    return dict(format=FORMAT, signature=list(sig), rows=stats.rows, columns=columns)
+
+
+def load_stats(entry, sig):
+    """TableStats of the JSON document entry, None when it is not the
+    current format or of a file of another signature than sig"""
+    if entry.get('format') != FORMAT or entry.get('signature') != list(sig):
+        return
+    columns = {}
+    for c in entry['columns']:
+        columns[c['name']] = ColumnStats(float(c['nulls']), c.get('min'), c.get('max'), int(c['distinct']))
+    return TableStats(int(entry['rows']), columns)
+
+
+def signature(path):
+    """what tells a file changed: its modification time and size"""
+    try:
+        st = os.stat(str(path))
+    except OSError:
+        return
+    return st.st_mtime_ns, st.st_size
+
+
+class Catalog:
+    """statistics of views by the key of their source: a Path for files,
+    whose statistics are also stored next to them, any hashable value for
+    the others"""
+    def __init__(self):
+        # key: (signature of a file or None, TableStats)
+        self.tables = {}
+
+    def get(self, key):
+        """statistics of key, None when unknown or its file changed"""
+        entry = self.tables.get(key)
+        if not isinstance(key, Path):
+            return entry[1] if entry is not None else None
+        sig = signature(key)
+        if sig is None:
+            return
+        if entry is None or entry[0] != sig:
+            stats = self.load(key, sig)
+            if stats is None:
+                self.tables.pop(key, None)
+                return
+            entry = self.tables[key] = sig, stats
+        return entry[1]
+
+    def put(self, key, stats):
+        """record the statistics stats, collected now, of key"""
+        known = self.get(key)
+        if known is not None:
+            known.update(stats)
+            stats = known
+        if isinstance(key, Path):
+            sig = signature(key)
+            self.tables[key] = sig, stats
+            if sig is not None:
+                self.store(key, sig, stats)
+        else:
+            self.tables[key] = None, stats
+
+    def discard(self, key):
+        self.tables.pop(key, None)
+        if isinstance(key, Path):
+            try:
+                stats_path(key).unlink()
+            except OSError:
+                pass
+
+    def has(self, key, fields):
+        """the statistics of key and all of its fields fields are known"""
+        stats = self.get(key)
+        return stats is not None and all(f in stats.columns for f in fields)
+
+    def rows(self, key):
+        stats = self.get(key)
+        if stats is not None:
+            return stats.rows
+
+    def distinct(self, key, field):
+        stats = self.get(key)
+        if stats is not None:
+            return stats.distinct(field)
+
+    def scan(self, key, table):
+        """the rows of table, a full scan of key, collecting its statistics
+        when they are not known"""
+        return StatsView(table, partial(self.put, key), partial(self.has, key))
+
+    def bind(self, view, key, collect=False):
+        """have view, the source key, estimate by the statistics of key and,
+        with collect, collect them when it is read whole"""
+        estimated = view.estimated
+
+        def estimate():
+            rows = self.rows(key)
+            if rows is not None:
+                return rows
+            return estimated() if callable(estimated) else estimated
+
+        view.estimated = estimate
+        view.distinct = partial(self.distinct, key)
+        if collect:
+            view.collect = partial(self.scan, key)
+
+    @staticmethod
+    def load(path, sig):
+        try:
+            with stats_path(path).open(encoding='utf-8') as f:
+                return load_stats(json.load(f), sig)
+        except Exception:
+            # missing, unreadable or malformed
+            return
+
+    @staticmethod
+    def store(path, sig, stats):
+        """write the statistics next to the file path; a directory that
+        cannot be written keeps them in memory only"""
+        entry = dump_stats(sig, stats)
+        target = stats_path(path)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=str(target.parent), suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp, str(target))
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -1,15 +1,22 @@
+import os
+from functools import partial
 import inspect
 from collections.abc import Iterable
 import importlib as im
 import petl as etl
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
 
 from . import Aggregator
 from . import sqlib
 from .sql.ast import PyVar, Identifier, View
-from .virtsql import compile, execute, SQLError
-from .run import filter_keys
+from .virtsql import compile, execute, prepare, SQLError
+from .plancache import PlanCache, DiskPlanCache
+from .explain import explain
+from .run import filter_keys, LimitView
+from .csvscan import fromcsv, estimate_rows, parallel_fromcsv
+from .stats import Catalog, collect
 
 
 __all__ = ("VirtualDB",)
@@ -45,12 +52,19 @@ class DirectoryDB:
         else:
             path = self.path / path
         ext = path.suffix[1:]
-        extractor = self._ext_.get(ext)[0]
+        extractor, _, columns, estimate, scan = self._ext_.get(ext)
         if extractor:
             args = self.config.get(ext, {})
             if query:
                 args.update(str2dict(query))
-        return View(path, extractor, path, **args)
+        view = View(path, extractor, path, **args)
+        view.project = columns
+        if estimate is not None:
+            view.estimated = partial(estimate, path)
+        if scan is not None:
+            view.scan = partial(scan, path, **args)
+        view.blocking = True
+        return view
 
     def load_data(self, data, path, **kwargs):
         if path.startswith('/'):
@@ -67,24 +81,84 @@ class DirectoryDB:
 
 
 class DB:
+    # SQL of the database, for conditions evaluated by it
+    placeholder = '?'
+    # null-safe <>, as python's != on None
+    distinct = 'IS DISTINCT FROM'
+    # equal keys {0} and {1} of a join, NULL matching NULL as None == None:
+    # with a plain = the database can look the keys up in an index, which
+    # it does not for IS NOT DISTINCT FROM
+    same = '({0} = {1} OR {0} IS NULL AND {1} IS NULL)'
+    # RIGHT and FULL JOIN
+    outer_joins = True
+    # an expression NULL where {} is 0 or '', the values sqlib aggregates
+    # skip; None when there is none and aggregates stay in python
+    nonfalsy = None
+    # LIKE compares as python does (sqlite ignores the case of ascii letters)
+    exact_like = True
+    # LIKE without ESCAPE has no escape character
+    like_escape = ''
+
     def __init__(self, url, config={}):
         self.conn = self.create_connection(url, config=config)
         # _, path, query = path_from_url(url)
         # self.dbname = path
         self._tables = self._get_tables()
+        self._types = {}
 
     def has_view(self, path, query=None):
         return path in self._tables
 
     def get_view(self, path, query=None):
         if self.has_view(path):
-            return View(path, self.extract_data, f'SELECT * FROM {path}')
+            view = View(path, self.select, path)
+            view.database = self
+            view.project = True
+            view.estimated = partial(self.estimate, path)
+            view.blocking = True
+            return view
 
     def _get_tables(self):
         return set()
 
-    def extract_data(self, sql):
-        return etl.fromdb(lambda: self.extractcursor(self.conn), sql)
+    def extract_data(self, sql, *args):
+        return etl.fromdb(lambda: self.extractcursor(self.conn), sql, *args)
+
+    def select(self, path, columns=None, where=None, args=()):
+        """rows of table path, of the fields columns only when given, the
+        condition where, with its placeholders bound to args, holds for"""
+        fields = ', '.join(map(self.quote, columns)) if columns else '*'
+        sql = f'SELECT {fields} FROM {path}'
+        if where:
+            return self.fetch(f'{sql} WHERE {where}', args)
+        return self.fetch(sql)
+
+    def estimate(self, path):
+        """number of rows of table path by the statistics of the database,
+        None when it has none: counting them could cost more than the
+        plan saves"""
+        return None
+
+    def column_types(self, path):
+        """python types of the values the columns of table path compare
+        with as python compares them, by column: the database converts
+        the others first, as '1' = 1 holds in sqlite. Columns missing are
+        unknown"""
+        if path not in self._types:
+            self._types[path] = self._column_types(path)
+        return self._types[path]
+
+    def _column_types(self, path):
+        return {}
+
+    def fetch(self, sql, args=()):
+        """rows of sql with its placeholders bound to args"""
+        if args:
+            return self.extract_data(sql, tuple(args))
+        return self.extract_data(sql)
+
+    def quote(self, name):
+        return '"{}"'.format(name.replace('"', '""'))
 
     def load_data(self, data, tablename, append=False, **kwargs):
         if '.' in tablename:
@@ -100,13 +174,75 @@ class VirtualDB:
     _drivers = {}
     global_dir = DirectoryDB(None, skip_root=False)
 
-    def __init__(self, **views):
+    EXECUTION_MODES = ('chain', 'fused')
+    JOIN_METHODS = ('auto', 'hash', 'merge')
+
+    def __init__(self, *, plan_cache_size=128, plan_cache_dir=None, execution='chain', workers=1,
+                 sort_memory=None, sort_dir=None, join_method='auto', collect_stats=False,
+                 ordered_scan=True, prefetch=0, **views):
+        if execution not in self.EXECUTION_MODES:
+            raise ValueError("unknown execution mode {!r}".format(execution))
+        if join_method not in self.JOIN_METHODS:
+            raise ValueError("unknown join method {!r}".format(join_method))
+        # bytes of rows ORDER BY holds before spilling sorted runs to
+        # sort_dir (the system temporary directory when None); both may be
+        # changed between queries
+        self.sort_memory = sort_memory
+        self.sort_dir = sort_dir
+        # processes GROUP BY of mergeable aggregates and scans of large files
+        # may use; None: one per cpu
+        self.workers = workers or os.cpu_count() or 1
+        # rows scanned by the workers come in the order of the file, or in
+        # the order the workers read them with ordered_scan=False
+        self.ordered_scan = ordered_scan
+        # batches of rows a thread reads from databases and files ahead of
+        # the statement, overlapping their waits with its work; 0 reads them
+        # as the statement pulls them
+        self.prefetch = prefetch
+        # joins on equal keys hash the smaller side ('hash'), sort both
+        # sides and merge them ('merge'), or pick one by the estimated
+        # sizes and known order of the sides ('auto')
+        self.join_method = join_method
+        # statistics of the views, by which plans estimate rows and distinct
+        # values; with collect_stats, queries reading a view whole collect
+        # those it has not, for the statements compiled after them
+        self.stats = Catalog()
+        self.collect_stats = collect_stats
+        self._pool = None
         self._module = None
+        self._version = 0
+        self._deterministic = set()
+        self.execution = execution
+        self.plan_cache = PlanCache(plan_cache_size)
+        self.disk_cache = DiskPlanCache(plan_cache_dir) if plan_cache_dir else None
         self.views = {}
+        self.sortedby = {}
+        self.estimates = {}
         self.databases = {}
         for k, v in views.items():
             self.addView(k, v)
 
+    def fingerprint(self):
+        return (self._version, self.execution, self.workers, self.sort_memory, self.sort_dir, self.join_method,
+                self.ordered_scan, self.prefetch)
+
+    def process_pool(self):
+        """pool of the worker processes, started on first use"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        """stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def invalidate(self):
+        """forget compiled plans: views, databases or globals changed"""
+        self._version += 1
+        self.plan_cache.clear()
+
     def addView(self, name, *args, **kwargs):
         value = None
         if args and len(args) == 1:
@@ -121,6 +257,18 @@ class VirtualDB:
             value = list(iter(value))
         if value is not None:
             self.views[name] = value
+            # the fields data is already sorted by lets GROUP BY skip hashing
+            self.sortedby[name] = tuple(kwargs.get('sortedby', ()))
+            # the number of rows, given or counted, chooses the side of
+            # joins held in memory
+            rows = kwargs.get('rows')
+            if rows is None and isinstance(value, list):
+                rows = len(value) - 1
+            elif rows is None and isinstance(data, (list, tuple)):
+                rows = len(data) - 1
+            self.estimates[name] = rows
+            self.stats.discard(name)
+            self.invalidate()
 
     def addDatabase(self, url, name=None, config=None):
         # path = Path(path)
@@ -129,17 +277,18 @@ class VirtualDB:
             if name is None:
                 name = db.name
             self.databases[name] = db
+            self.invalidate()
 
     def _find_cursor_source(self, name):
         db = query = path = ''
-        if isinstance(name, Identifier):
+        if isinstance(name, Identifier) or ":" not in name:
+            # a name, as written in sql without quotes
             if '.' in name:
                 db, path = name.split('.', 1)
             else:
                 path = name
         else:
-            if ":" in name:
-                db, path, query = path_from_url(name)
+            db, path, query = path_from_url(name)
         if db == 'file':
             r = self.global_dir
         elif db in self.databases:
@@ -154,14 +303,49 @@ class VirtualDB:
 
     def getView(self, name):
         db, path, query = self._find_cursor_source(name)
-        return db.get_view(path, query)
+        view = db.get_view(path, query)
+        if view is not None:
+            self.stats.bind(view, self._stats_key(db, path, view), self.collect_stats)
+        return view
+
+    def _stats_key(self, db, path, view):
+        """key of the statistics of view, path of db: the file it reads, the
+        name of a view of self, a table of a database"""
+        if isinstance(db, DirectoryDB):
+            return Path(view.args[0]).resolve()
+        if db is self:
+            return path
+        return db, path
+
+    def analyze(self, name):
+        """collect the statistics of the rows of view name, reading them all,
+        and return them; plans compiled later are estimated by them"""
+        db, path, query = self._find_cursor_source(name)
+        view = db.get_view(path, query)
+        if view is None:
+            raise KeyError(name)
+        key = self._stats_key(db, path, view)
+        self.stats.put(key, collect(view()))
+        self.invalidate()
+        return self.stats.get(key)
+
+    def statistics(self, name):
+        """statistics of view name known, collected or stored with its file,
+        or None"""
+        db, path, query = self._find_cursor_source(name)
+        view = db.get_view(path, query)
+        if view is not None:
+            return self.stats.get(self._stats_key(db, path, view))
 
     def has_view(self, path, query):
         return path in self.views
 
     def get_view(self, path, query):
         if path in self.views:
-            return View(path, lambda x: x, self.views[path])
+            view = View(path, lambda x: x, self.views[path])
+            view.sortedby = self.sortedby.get(path, ())
+            view.estimated = self.estimates.get(path)
+            return view
 
     def databaseByUrl(self, url, config=None):
         r = urlparse(url)
@@ -172,18 +356,47 @@ class VirtualDB:
     def importlib(self, name, asname=None):
         m = im.import_module(name)
         self.globals[asname or name] = m
+        self.invalidate()
 
     def importfile(self, path):
         path = Path(path)
         if path.is_file():
             src = path.read_text()
             exec(src, self.globals)
+            self.invalidate()
 
-    def function(self, f, name=None):
+    def function(self, f, name=None, deterministic=False):
+        """register f for use in sql; pass deterministic=True when it always
+        returns the same value for the same arguments, so calls with
+        constant arguments may be folded and equal calls shared. Others
+        (random numbers, clocks, counters) are called for every row"""
         if inspect.isfunction(f) or (inspect.isclass(f) and issubclass(f, Aggregator)):
             if name is None:
                 name = f.__name__
             self.globals[name] = f
+            if deterministic:
+                self._deterministic.add(name)
+            else:
+                self._deterministic.discard(name)
+            self.invalidate()
+
+    def is_deterministic(self, name):
+        """functions of imported modules and files are not known to be"""
+        return name in self._deterministic
+
+    def prepare(self, sql):
+        """compile sql once; call the result with parameter values to run it"""
+        return prepare(sql, self)
+
+    def explain(self, sql, analyze=False, params=None):
+        """print the operator tree of sql; analyze runs it and adds rows,
+        time and memory of every operator"""
+        try:
+            if isinstance(sql, str):
+                sql = compile(sql, self)
+            print(explain(sql, analyze=analyze, params=params))
+        except SQLError as e:
+            print(e)
 
     def print(self, sql, title=None, limit=10):
         try:
@@ -225,7 +438,8 @@ class VirtualDB:
         try:
             if isinstance(sql, str):
                 sql = execute(sql, self)
-            return next(iter(etl.namedtuples(sql)))
+            for rec in etl.namedtuples(LimitView(sql, 1)):
+                return rec
         except SQLError as e:
             print(e)
 
@@ -275,8 +489,12 @@ class VirtualDB:
         VirtualDB._drivers[name] = dcls
 
     @staticmethod
-    def register_file_driver(name, extractor, loader):
-        DirectoryDB._ext_[name] = extractor, loader
+    def register_file_driver(name, extractor, loader, columns=False, estimate=None, scan=None):
+        """columns: extractor takes columns=[...] and reads those fields only;
+        estimate: function of the path of a file estimating its rows;
+        scan: function of the path of a file, a pool and its workers, reading
+        its rows with them as View.scan, or returning None"""
+        DirectoryDB._ext_[name] = extractor, loader, columns, estimate, scan
 
 
 VirtualDB.register_db_driver("file", DirectoryDB)
@@ -292,7 +510,7 @@ def tocsv(data, target, append, **kwargs):
         return etl.tocsv(data, target, **kwargs)
 
 
-VirtualDB.register_file_driver("csv", etl.fromcsv, tocsv)
+VirtualDB.register_file_driver("csv", fromcsv, tocsv, columns=True, estimate=estimate_rows, scan=parallel_fromcsv)
 
 
 def topickle(data, target, append, **kwargs):
@@ -1,16 +1,27 @@
 from functools import singledispatch
 # from itertools import chain
 from functools import partial
+import pickle
 from collections import defaultdict, OrderedDict
 
 from .sql import Scanner, Parser
+from .sql.fastscanner import create_scanner
 from .sql.ast import *
 from .run import *
 from .skan_ast import skan_ast
-from .plan import plan
+from .plan import plan, Schema, heap_limit, plan_group_query, parallel_scan
+from .fuse import fuse
+from .rewrite import fold_constants, reuse_aliases
+from .pushdown import push_predicates, delegate_joins, conjuncts
+from .joinorder import reorder_joins
+from .compile_ast import comp
+from .plancache import normalize_sql
 
-def parse_sql(sqlstr, sqlid=''):
-    scanner = Scanner.Scanner(sqlstr)
+def parse_sql(sqlstr, sqlid='', fast=True):
+    if fast:
+        scanner = create_scanner(sqlstr)
+    else:
+        scanner = Scanner.Scanner(sqlstr)
     parser = Parser.Parser(sqlid)
     parser.Parse(scanner)
     if parser.Successful():
@@ -20,16 +31,85 @@ def parse_sql(sqlstr, sqlid=''):
 
 def compile(sql, db, sqlid=''):
     if isinstance(sql, str):
-        sql = parse_sql(sql, sqlid=sqlid)
+        cache = db.plan_cache
+        key = normalize_sql(sql), db.fingerprint()
+        r = cache.get(key)
+        if r is None:
+            r = compile_text(sql, db, sqlid)
+            cache.put(key, r)
+        return r
     return Compiler(db).run(sql)
 
 
+def compile_text(sql, db, sqlid=''):
+    disk = db.disk_cache
+    if disk is None:
+        return Compiler(db).run(parse_sql(sql, sqlid=sqlid))
+    ast = disk.load(sql, partial(view_headers, db))
+    if ast is not None:
+        return Compiler(db).run(ast)
+    ast = parse_sql(sql, sqlid=sqlid)
+    parsed = pickle.dumps(ast, pickle.HIGHEST_PROTOCOL)
+    r = Compiler(db).run(ast)
+    disk.store(sql, parsed, view_headers(db, source_tables(ast)))
+    return r
+
+
+def source_tables(ast, local=()):
+    """names of the database views a parsed statement reads"""
+    names = []
+    if ast.withcontext:
+        local = set(local)
+        for name, item in ast.withcontext.views.items():
+            names.extend(n for n in source_tables(item, local) if n not in names)
+            local.add(name)
+    for cond in conjuncts(ast.selector.cond) if ast.selector is not None else ():
+        sub, _ = subquery(cond)
+        if sub is not None:
+            names.extend(n for n in source_tables(sub.select, local) if n not in names)
+    sources = [ast.source]
+    while sources:
+        src = sources.pop()
+        if isinstance(src, JoinCursor):
+            sources.extend((src.source2, src.source1))
+        elif isinstance(src, Table) and src.tblname not in local and src.tblname not in names:
+            names.append(src.tblname)
+    return names
+
+
+def view_headers(db, names):
+    return {name: tuple(db.getView(name).header()) for name in names}
+
+
 def execute(sql, db, sqlid='', params=None):
     if isinstance(sql, str):
         sql = compile(sql, db, sqlid=sqlid)
     return sql(params=params)
 
 
+def prepare(sql, db, sqlid=''):
+    return Statement(compile(sql, db, sqlid=sqlid))
+
+
+class Statement:
+    """compiled statement, parsed and planned once.
+    Parameter values (?name in sql) are bound on every call.
+    """
+    def __init__(self, view):
+        self.view = view
+
+    @property
+    def params(self):
+        return self.view.params
+
+    def __call__(self, params=None, **kwargs):
+        params = dict(params or {}, **kwargs)
+        missing = [p for p in self.params if p not in params]
+        if missing:
+            raise SQLError("missing values for parameters {}".format(', '.join(missing)))
+        return self.view(params=params)
+
+
 class Compiler:
     def __init__(self, db, parent=None):
         self.parent = parent
@@ -38,6 +118,9 @@ class Compiler:
         self.columns = {}
         self.varcount = 0
         self.unknown_vars = set()
+        # columns of the enclosing statement a subquery reads
+        self.outer = []
+        self.fieldcount = 0
 
     def var_name(self, var):
         if var.id is None:
@@ -60,6 +143,8 @@ class Compiler:
                     return var
         else:
             var = source.find_var(name)
+        if var is None and source is None and self.parent is not None:
+            var = self.find_outer(name)
         if var is None:
             var = self.db.find_var(name)
         if var is None:
@@ -69,37 +154,225 @@ class Compiler:
             raise NotFound("Var {} not found".format(name))
         return var
 
+    def find_outer(self, name):
+        """column of the tables of the enclosing statement, for a correlated
+        subquery"""
+        for tbl in self.parent.tables:
+            var = tbl.find_var(name)
+            if var is not None:
+                self.outer.append(var)
+                return var
+
+    def field_name(self):
+        """name of a field a subquery adds for its enclosing statement,
+        unique in the whole statement"""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        root.fieldcount += 1
+        return "@sq{}".format(root.fieldcount)
+
     def find_sql_var(self, name):
         cs = self.ast.columns
         if isinstance(cs, Columns):
             return cs.get_sql_var(name)
 
     def run(self, ast):
+        return self.build(ast, self.resolve(ast))
+
+    def resolve(self, ast):
+        """bind the names of ast to tables and columns; returns the
+        parameters of the statement"""
         self.ast = ast
+        params = list(ast.params)
         if ast.withcontext:
             for name, item in ast.withcontext.views.items():
                 item.view = View(name, compile(item, self.db, name))
+                item.view.params = item.view.f.params
+                item.view.sortedby = item.view.f.sortedby
+                params.extend(p for p in item.view.params if p not in params)
         columns = skan_ast.collect(ast, compiler=self)
-        self.ensure_unique(columns)
         if self.unknown_vars:
             raise SQLError("unrecognized vars {}".format(', '.join(self.unknown_vars)))
-        # print("columns:", columns)
+        for semi in self.subqueries(ast):
+            columns.extend(semi.outer)
+            params.extend(p for p in semi.view.params if p not in params)
+        self.ensure_unique(columns)
+        return params
 
-        kwargs = dict(compiler=self, db=self.db, header=set())
-        f = plan(ast.source, **kwargs)
-        if ast.selector is not None:
-            f = plan(ast.selector, f=f, **kwargs)
-            # print("f2:", f)
-        if ast.groupby:
-            f = plan(ast.groupby, f=f, **kwargs)
-        if ast.orders:
-            f = plan(ast.orders, f=f, **kwargs)
-        f = plan(ast.columns, f=f, **kwargs)
+    def build(self, ast, params):
+        """plan of a resolved statement"""
+        self.rewrite(ast)
+        reorder_joins(ast)
+        delegate_joins(ast.source)
+        push_predicates(ast)
+
+        kwargs = dict(compiler=self, db=self.db, header=Schema())
+        f = None
+        if self.db.execution == 'fused' or parallel_scan(self.db, ast.source) is not None:
+            # a scan by worker processes filters and projects in them too
+            f = fuse(ast, **kwargs)
+        if f is None:
+            f = self.plan(ast, **kwargs)
         if ast.distinct:
             f = partial(distinct_execute, f)
+        if ast.limit is not None and heap_limit(ast) is None:
+            f = partial(limit_execute, f, count=ast.limit.count, offset=ast.limit.offset)
         r = ast.view = View('', f)
+        r.params = tuple(params)
+        if ast.orders and not ast.distinct:
+            r.sortedby = tuple(str(getattr(var, 'name', var)) for var in ast.orders.items)
         return r
 
+    def subqueries(self, ast):
+        """take the EXISTS and IN (subquery) conditions out of the WHERE of
+        ast into semi joins, compiling their subqueries"""
+        if ast.selector is None:
+            return []
+        conds = []
+        for cond in conjuncts(ast.selector.cond):
+            sub, anti = subquery(cond)
+            if sub is None:
+                conds.append(cond)
+                continue
+            semi = SemiJoin(sub.select, anti)
+            self.semi_join(semi, sub)
+            ast.semijoins.append(semi)
+        if not ast.semijoins:
+            return []
+        if conds:
+            ast.selector.cond = conjunction(conds)
+        else:
+            ast.selector = None
+        return ast.semijoins
+
+    def semi_join(self, semi, sub):
+        """compile the subquery of semi, splitting its correlated conditions
+        off into the keys and the residual condition of the semi join"""
+        select = semi.select
+        c = type(self)(self.db, parent=self)
+        params = c.resolve(select)
+        okeys, ikeys, semi.residual = c.correlate(select)
+        correlated = ikeys or semi.residual
+        if correlated and (select.groupby is not None or select.limit is not None
+                           or select.withcontext is not None):
+            raise SQLError("correlated subquery with GROUP BY, LIMIT or WITH")
+        columns = select.columns
+        if correlated and isinstance(columns, Columns) and any(is_aggregate(v.value) for v in columns):
+            raise SQLError("correlated subquery with aggregates")
+        if isinstance(sub, InSubquery):
+            if not isinstance(columns, Columns) or len(columns.columns) != 1:
+                raise SQLError("subquery of IN must select one column")
+            var = columns.columns[0]
+            var.id = c.field_name()
+            okeys.insert(0, sub.arg)
+            ikeys.insert(0, var.id)
+            semi.strict = True
+        elif correlated:
+            columns = select.columns = Columns()
+        # the fields the keys and the residual condition read
+        names = {}
+        for i, key in enumerate(ikeys):
+            if isinstance(key, str):
+                continue
+            if isinstance(key, Column):
+                ikeys[i] = c.inner_field(key, names, columns)
+            else:
+                ikeys[i] = c.field_name()
+                columns.append(Var(ikeys[i], key))
+        for col in columns_read.collect(semi.residual):
+            if col.table in c.tables:
+                c.inner_field(col, names, columns)
+        if isinstance(columns, Columns) and not columns.columns:
+            columns.append(Var(c.field_name(), 1))
+        if select.limit is None:
+            # the order of the rows is of no use to the semi join
+            select.orders = None
+        semi.keys = okeys, ikeys
+        semi.outer = c.outer
+        semi.fields = [str(v.id) for v in columns] if correlated else []
+        semi.view = c.build(select, params)
+        return semi
+
+    def correlate(self, ast):
+        """take the conditions of the WHERE of ast that read columns of the
+        enclosing statement out of it; returns the expressions of the
+        enclosing statement and of ast they make equal, and the others"""
+        okeys, ikeys, residual = [], [], []
+        if not self.outer:
+            return okeys, ikeys, residual
+        outer = {id(c) for c in self.outer}
+
+        def reads_outer(expr):
+            cols = columns_read.collect(expr)
+            return sum(id(c) in outer for c in cols), len(cols)
+
+        conds, found = [], 0
+        for cond in conjuncts(ast.selector.cond) if ast.selector is not None else ():
+            n, _ = reads_outer(cond)
+            if not n:
+                conds.append(cond)
+                continue
+            found += n
+            if isinstance(cond, CompareExpr) and cond.op == '==':
+                (o1, n1), (o2, n2) = reads_outer(cond.arg1), reads_outer(cond.arg2)
+                if o1 and o1 == n1 and not o2:
+                    okeys.append(cond.arg1)
+                    ikeys.append(unbraced(cond.arg2))
+                    continue
+                if o2 and o2 == n2 and not o1:
+                    okeys.append(cond.arg2)
+                    ikeys.append(unbraced(cond.arg1))
+                    continue
+            residual.append(cond)
+        if found != len(self.outer):
+            raise SQLError("a subquery can read columns of the enclosing statement in its WHERE only")
+        if conds:
+            ast.selector.cond = conjunction(conds)
+        else:
+            ast.selector = None
+        return okeys, ikeys, residual
+
+    def inner_field(self, col, names, columns):
+        """name of the field of the rows of this subquery holding the value
+        of its column col, added to columns once"""
+        name = names.get(id(col))
+        if name is None:
+            name = names[id(col)] = col.alias = self.field_name()
+            columns.append(Var(name, col))
+        return name
+
+    def rewrite(self, ast):
+        deterministic = self.db.is_deterministic
+        if isinstance(ast.columns, Columns):
+            for var in ast.columns:
+                var.value = fold_constants(var.value, self.evaluate, deterministic)
+        if ast.selector is not None:
+            fold_constants(ast.selector, self.evaluate, deterministic)
+            reuse_aliases(ast, deterministic)
+
+    def evaluate(self, ast):
+        """value of an expression that does not read rows"""
+        src = comp(ast, compiler=self, db=self.db)
+        return eval(src, self.module, dict(rec=None, params=None))
+
+    def plan(self, ast, **kwargs):
+        f = None
+        if ast.groupby:
+            f = plan_group_query(ast, **kwargs)
+        if f is None:
+            f = plan(ast.source, **kwargs)
+            if ast.selector is not None:
+                f = plan(ast.selector, f=f, **kwargs)
+                # print("f2:", f)
+            for semi in ast.semijoins:
+                f = plan(semi, f=f, **kwargs)
+            if ast.groupby:
+                f = plan(ast.groupby, f=f, **kwargs)
+        if ast.orders:
+            f = plan(ast.orders, f=f, **kwargs)
+        return plan(ast.columns, f=f, **kwargs)
+
     def ensure_unique(self, columns):
         columns = set(map(str, columns))
         cc = defaultdict(int)
@@ -0,0 +1,55 @@
+import io
+import csv
+
+import pytest
+
+from petlsql.csvscan import record_ranges, header_end
+
+
+# quoted values holding delimiters, newlines, CRLFs and doubled quotes
+DATA = (b'id,"na\nme",note\r\n'
+        b'1,plain,x\r\n'
+        b'2,"two\nlines",y\r\n'
+        b'3,"with ""quotes"", and comma",z\r\n'
+        b'4,"crlf\r\ninside",""\r\n'
+        b'5,"""",\r\n'
+        b'6,"ends with newline\n",w\n'
+        b'7,last,no newline')
+
+
+def records(data):
+    return list(csv.reader(io.StringIO(data.decode('utf-8'), newline='')))
+
+
+def test_header_end():
+    start = header_end(io.BytesIO(DATA))
+    assert DATA[:start] == b'id,"na\nme",note\r\n'
+    assert header_end(io.BytesIO(b'a,b')) == 3
+    assert header_end(io.BytesIO(b'')) == 0
+
+
+def test_header_end_past_a_block():
+    header = b'"' + b'x\n' * 5000 + b'",b\n'
+    assert header_end(io.BytesIO(header + b'1,2\n')) == len(header)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 8, 13, 40, 1000])
+def test_ranges_end_after_whole_records(size):
+    start = header_end(io.BytesIO(DATA))
+    ranges = list(record_ranges(io.BytesIO(DATA), start, size))
+    # the ranges cover the records one after the other
+    assert ranges[0][0] == start and ranges[-1][1] == len(DATA)
+    assert all(end == begin for (_, end), (begin, _) in zip(ranges, ranges[1:]))
+    rows = []
+    for begin, end in ranges:
+        assert end > begin
+        rows += records(DATA[begin:end])
+    assert rows == records(DATA)[1:]
+
+
+def test_ranges_of_records_without_quotes():
+    data = b'a,b\n' + b''.join(b'%d,%d\n' % (i, i * i) for i in range(100))
+    ranges = list(record_ranges(io.BytesIO(data), 4, 64))
+    assert len(ranges) > 1
+    assert all(data[end - 1:end] == b'\n' for _, end in ranges)
+    assert b''.join(data[begin:end] for begin, end in ranges) == data[4:]
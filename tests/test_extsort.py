@@ -0,0 +1,104 @@
+import os
+import random
+from itertools import islice
+
+import petl as etl
+import pytest
+
+from petlsql.extsort import ExternalSortView
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+
+
+HEADER = ('id', 'grp', 'qty', 'name')
+# a budget of a few dozen rows: thousands of rows spill to many runs, more
+# than are merged at once
+MEMORY = 8 << 10
+
+
+def table(n=3000, seed=1):
+    rnd = random.Random(seed)
+    rows = [(i, rnd.choice('abcde'), rnd.choice([None, 0, 1, 2, 3, 5, 8]), rnd.choice([None, 'x', 'y', 'zz']))
+            for i in range(n)]
+    return [HEADER] + rows
+
+
+def expected(data, key, reverse=False):
+    """rows of data sorted by key with sorted(), NULLs first as petl
+    compares them"""
+    positions = [HEADER.index(k) for k in key]
+    return sorted(data[1:], key=lambda row: [(row[i] is not None, row[i]) for i in positions], reverse=reverse)
+
+
+def spilled(directory):
+    return [name for name in os.listdir(directory) if name.startswith('petlsql-sort-')]
+
+
+@pytest.mark.parametrize('key', [('grp',), ('qty',), ('name', 'qty'), ('grp', 'name', 'qty')])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_spilled_rows_are_sorted(tmp_path, key, reverse):
+    data = table()
+    view = ExternalSortView(data, key, reverse, MEMORY, str(tmp_path))
+    rows = iter(view)
+    assert next(rows) == HEADER
+    # equal keys keep the order of the input, as sorted() does
+    assert [tuple(r) for r in rows] == expected(data, key, reverse)
+    assert spilled(tmp_path) == []
+
+
+def test_spills_to_the_directory(tmp_path):
+    rows = iter(ExternalSortView(table(), ('qty',), memory=MEMORY, directory=str(tmp_path)))
+    next(rows)
+    next(rows)
+    assert spilled(tmp_path)
+    rows.close()
+    assert spilled(tmp_path) == []
+
+
+def test_rows_fitting_in_memory_are_not_spilled(tmp_path):
+    data = table(50)
+    view = ExternalSortView(data, ('grp', 'id'), memory=64 << 20, directory=str(tmp_path))
+    rows = iter(view)
+    next(rows)
+    assert spilled(tmp_path) == []
+    assert [tuple(r) for r in rows] == expected(data, ('grp', 'id'))
+
+
+def test_empty_source(tmp_path):
+    assert list(ExternalSortView([HEADER], ('id',), memory=MEMORY, directory=str(tmp_path))) == [HEADER]
+    assert list(ExternalSortView([], ('id',), memory=MEMORY, directory=str(tmp_path))) == []
+
+
+@pytest.mark.parametrize('start, stop', [(0, 10), (25, 40), (2990, 3010)])
+def test_slice_of_spilled_rows(tmp_path, start, stop):
+    data = table()
+    view = ExternalSortView(data, ('name', 'grp'), True, MEMORY, str(tmp_path))
+    rows = [tuple(r) for r in etl.data(etl.rowslice(view, start, stop))]
+    assert rows == expected(data, ('name', 'grp'), True)[start:stop]
+    assert spilled(tmp_path) == []
+
+
+def test_error_of_the_source_removes_runs(tmp_path):
+    def source():
+        yield HEADER
+        yield from islice(table(), 1, 2000)
+        raise ValueError('source failed')
+
+    with pytest.raises(ValueError):
+        list(ExternalSortView(etl.wrap(source()), ('qty',), memory=MEMORY, directory=str(tmp_path)))
+    assert spilled(tmp_path) == []
+
+
+@pytest.mark.parametrize('sql, key, reverse, start, stop', [
+    ("select id, grp, qty, name from t order by qty", ('qty',), False, 0, None),
+    # DESC after the keys orders by all of them descending
+    ("select id, grp, qty, name from t order by grp, name desc", ('grp', 'name'), True, 0, None),
+    ("select id, grp, qty, name from t order by name, qty offset 100", ('name', 'qty'), False, 100, None),
+    ("select id, grp, qty, name from t order by qty desc limit 20 offset 5", ('qty',), True, 5, 25),
+])
+def test_order_by_with_sort_memory(tmp_path, sql, key, reverse, start, stop):
+    data = table()
+    db = VirtualDB(t=data, sort_memory=MEMORY, sort_dir=str(tmp_path))
+    rows = [tuple(r) for r in etl.data(execute(sql, db))]
+    assert rows == expected(data, key, reverse)[start:stop]
+    assert spilled(tmp_path) == []
@@ -0,0 +1,62 @@
+import sqlite3
+
+import petl as etl
+import pytest
+
+import petlsql.sqlitedb
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+
+
+ROWS = [(None, None, '1', None), (1, 1, '1', 1), (1, None, 'a', '1'), (2, 2, '2', 2.0), (3, 2, None, 'b')]
+
+
+@pytest.fixture(scope='module')
+def databases(tmp_path_factory):
+    """the rows in a sqlite table, which WHERE is pushed to, and in memory"""
+    path = tmp_path_factory.mktemp('pushdown') / 't.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE t (a INTEGER, b INTEGER, s TEXT, x)')
+    conn.executemany('INSERT INTO t VALUES (?, ?, ?, ?)', ROWS)
+    conn.commit()
+    conn.close()
+    db = VirtualDB()
+    db.addDatabase('sqlite:///' + str(path), name='s')
+    memory = VirtualDB(t=[('a', 'b', 's', 'x')] + ROWS)
+    return db, memory
+
+
+def rows(sql, db, params=None):
+    return sorted(map(tuple, etl.data(execute(sql, db, params=params))), key=repr)
+
+
+@pytest.mark.parametrize('where, params', [
+    # NULL equals NULL, as python's None == None
+    ("a = b", None),
+    ("a = ?v", {'v': None}),
+    ("a = ?v", {'v': 1}),
+    ("a <> b", None),
+    ("s = ?v and a = 1", {'v': '1'}),
+    # sqlite converts '1' to 1 for an INTEGER column, and 1 to '1' for TEXT
+    ("a = '1'", None),
+    ("s = 1", None),
+    ("a in ('1', 2)", None),
+    ("a = s", None),
+    ("s = '1'", None),
+    ("x = '1'", None),
+    ("x = 1", None),
+    ("a between 1 and 2", None),
+    ("b is null or a > 2", None),
+])
+def test_pushed_where_keeps_the_rows_python_does(databases, where, params):
+    db, memory = databases
+    expected = rows("select a, b, s, x from t where " + where, memory, params)
+    assert rows("select a, b, s, x from s.t where " + where, db, params) == expected
+
+
+def test_conditions_of_other_tables_stay_in_python(databases, tmp_path):
+    db, memory = databases
+    path = tmp_path / 'm.csv'
+    path.write_text('s,tag\n1,x\na,y\n')
+    sql = "select t.a, m.s, tag from 'file:{}' as m inner join s.t as t on m.s = t.s where tag = 'x' and a = 1"
+    assert list(etl.data(execute(sql.format(path), db))) == [(1, '1', 'x')]
@@ -0,0 +1,65 @@
+import petl as etl
+
+from petlsql.joins import JoinView, ScanIndex, SemiJoinView
+from petlsql.sql.ast import Join
+from petlsql.virtdb import VirtualDB
+from petlsql.virtsql import execute
+
+
+def database():
+    return VirtualDB(t=[('k', 'v'), ('a', 1), ('b', 2), ('a', 3)])
+
+
+def test_aggregate_read_twice():
+    r = execute("select count(*) as n, sum(v) as s from t", database())
+    assert list(r) == [('n', 's'), (3, 6)]
+    assert list(r) == [('n', 's'), (3, 6)]
+    # petl reads the table once to count its rows, then again
+    assert etl.nrows(r) == 1
+    assert list(r) == [('n', 's'), (3, 6)]
+
+
+def test_rows_read_twice():
+    r = execute("select k, (v * 2) as w from t where v > 1", database())
+    assert list(r) == [('k', 'w'), ('b', 4), ('a', 6)]
+    assert list(etl.data(r)) == [('b', 4), ('a', 6)]
+
+
+def test_groups_read_twice():
+    r = execute("select k, sum(v) as s from t group by k", database())
+    assert sorted(etl.data(r)) == [('a', 4), ('b', 2)]
+    assert list(r)[0] == ('k', 's')
+    assert sorted(etl.data(r)) == [('a', 4), ('b', 2)]
+
+
+def test_join_read_twice():
+    db = database()
+    db.addView('u', [('k', 'n'), ('a', 'x'), ('b', 'y')])
+    r = execute("select t.k, n from t join u on t.k = u.k", db)
+    assert sorted(etl.data(r)) == [('a', 'x'), ('a', 'x'), ('b', 'y')]
+    assert sorted(etl.data(r)) == [('a', 'x'), ('a', 'x'), ('b', 'y')]
+
+
+def test_join_of_a_side_without_header():
+    t = [('k', 'v'), ('a', 1)]
+    for join in (Join.INNER, Join.LEFT, Join.FULL):
+        assert list(JoinView(t, [], join, ScanIndex(), lkey=('k',), rkey=('k',))) == [('k', 'v')]
+        assert list(JoinView([], t, join, ScanIndex(), lkey=('k',), rkey=('k',))) == [('v',)]
+
+
+def test_semijoin_read_twice():
+    db = database()
+    db.addView('u', [('k',), ('a',)])
+    r = execute("select k, v from t where k in (select k from u)", db)
+    assert list(etl.data(r)) == [('a', 1), ('a', 3)]
+    assert list(etl.data(r)) == [('a', 1), ('a', 3)]
+
+
+def test_semijoin_of_a_subquery_without_header():
+    t = [('k', 'v'), ('a', 1), (None, 2)]
+    key = (lambda row: row[0],)
+    assert list(SemiJoinView(t, [], key, ('k',))) == [('k', 'v')]
+    assert list(SemiJoinView(t, [], key, ('k',), anti=True)) == t
+    # NOT IN drops the rows whose key is NULL
+    assert list(SemiJoinView(t, [], key, ('k',), anti=True, strict=True)) == t[:2]
+    assert list(SemiJoinView([], t, key, ('k',))) == []